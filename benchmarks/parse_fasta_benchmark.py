@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Compare fasta parsing throughput of SeqReader.parse_fasta against the original
+line by line string concatenation parser on a synthetic genome.
+
+python benchmarks/parse_fasta_benchmark.py --size 500
+"""
+from __future__ import division
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dsa_seq_utils.SeqReader import SeqReader
+
+
+def legacy_parse_fasta(in_file):
+    """ The original parse_fasta, which appends each line to the sequence string. """
+    with open(in_file) as fasta_file:
+        sequence = ''
+        line = fasta_file.readline()
+        while not line.startswith('>'):
+            line = fasta_file.readline()
+        header = line.rstrip()
+        for line in fasta_file:
+            if line.startswith('>'):
+                yield header, sequence
+                header = line.rstrip()
+                sequence = ''
+            else:
+                sequence += ''.join(line.rstrip().split())
+    yield header, sequence
+
+
+def write_genome(out_file, size_mb, n_chromosomes, line_width):
+    """ Write a random genome of size_mb megabases split evenly into n_chromosomes. """
+    chrom_length = int(size_mb * 1000000) // n_chromosomes
+    # Reuse one random block, generating hundreds of Mb with random.choice is slow.
+    block = ''.join(random.choice('ACGT') for i in range(1000000))
+    block_lines = [block[i:i+line_width] for i in range(0, len(block) - line_width + 1, line_width)]
+    with open(out_file, 'w') as f:
+        for c in range(n_chromosomes):
+            f.write('>chr%d\n' % (c + 1))
+            lines_left = chrom_length // line_width
+            while lines_left:
+                chunk = block_lines[:lines_left]
+                f.write('\n'.join(chunk) + '\n')
+                lines_left -= len(chunk)
+            if chrom_length % line_width:
+                f.write(block[:chrom_length % line_width] + '\n')
+
+
+def time_parser(parser, in_file):
+    """ Return seconds taken to parse in_file and the total sequence length. """
+    start = time.time()
+    total = 0
+    for header, sequence in parser(in_file):
+        total += len(sequence)
+    return time.time() - start, total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark fasta parsing throughput.')
+    parser.add_argument('--size', type=float, default=500, help='Synthetic genome size in Mb (default 500).')
+    parser.add_argument('--chromosomes', type=int, default=10, help='Number of chromosomes (default 10).')
+    parser.add_argument('--line-width', type=int, default=60, help='Bases per fasta line (default 60).')
+    parser.add_argument('--fasta', type=str, default=None, help='Benchmark this fasta file instead of a synthetic one.')
+    parser.add_argument('--skip-legacy', action='store_true', default=False, help='Do not time the original parser.')
+    args = parser.parse_args()
+
+    if args.fasta is None:
+        fd, fasta = tempfile.mkstemp(suffix='.fasta')
+        os.close(fd)
+        print 'Writing a %.0f Mb synthetic genome to %s' % (args.size, fasta)
+        write_genome(fasta, args.size, args.chromosomes, args.line_width)
+    else:
+        fasta = args.fasta
+
+    try:
+        file_mb = os.path.getsize(fasta) / 1000000
+        parsers = [('SeqReader.parse_fasta', lambda f: SeqReader(f).parse_fasta())]
+        if not args.skip_legacy:
+            parsers.append(('legacy parse_fasta', legacy_parse_fasta))
+        for name, parse in parsers:
+            seconds, total = time_parser(parse, fasta)
+            print '%-24s %8.2f s %8.1f MB/s (%d bases)' % (name, seconds, file_mb / seconds, total)
+    finally:
+        if args.fasta is None:
+            os.remove(fasta)
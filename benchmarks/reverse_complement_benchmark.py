@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Compare utilities.reverse_complement and reverse_complement_array against the
+original per base string concatenation on random sequences of increasing size.
+
+python benchmarks/reverse_complement_benchmark.py --max-size 100000000
+"""
+from __future__ import division
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dsa_seq_utils import utilities
+from dsa_seq_utils.utilities import complements
+from dsa_seq_utils.utilities import reverse_complement
+from dsa_seq_utils.utilities import reverse_complement_array
+
+
+def legacy_reverse_complement(seq):
+    """ The original reverse_complement, which appends one base at a time. """
+    rc_seq = ''
+    for nuc in seq[::-1]:
+        rc_seq += complements[nuc]
+    return rc_seq
+
+
+def numpy_reverse_complement(seq):
+    """ reverse_complement_array, including the conversion from and to a string. """
+    np = utilities.np
+    return reverse_complement_array(np.frombuffer(seq, dtype=np.uint8)).tostring()
+
+
+def time_function(function, seq, repeats):
+    """ Return the best time in seconds of repeats calls of function(seq). """
+    best = None
+    for i in range(repeats):
+        start = time.time()
+        function(seq)
+        seconds = time.time() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark reverse complement implementations.')
+    parser.add_argument('--min-size', type=int, default=1000, help='Smallest sequence length (default 1 kb).')
+    parser.add_argument('--max-size', type=int, default=100000000, help='Largest sequence length (default 100 Mb).')
+    parser.add_argument('--legacy-max-size', type=int, default=10000000,
+                        help='Do not time the original function above this length (default 10 Mb).')
+    args = parser.parse_args()
+
+    # Reuse one random block, generating 100 Mb with random.choice is slow.
+    block = ''.join(random.choice('ACGTN') for i in range(min(args.max_size, 1000000)))
+    functions = [('reverse_complement', reverse_complement)]
+    if utilities.np is not None:
+        functions.append(('reverse_complement_array', numpy_reverse_complement))
+    functions.append(('legacy reverse_complement', legacy_reverse_complement))
+
+    size = args.min_size
+    while size <= args.max_size:
+        seq = (block * (size // len(block) + 1))[:size]
+        repeats = 5 if size <= 1000000 else 1
+        for name, function in functions:
+            if function is legacy_reverse_complement and size > args.legacy_max_size:
+                continue
+            seconds = time_function(function, seq, repeats)
+            print '%-12d %-28s %10.4f s %10.1f Mb/s' % (size, name, seconds, size / 1000000 / max(seconds, 1e-9))
+        size *= 10
@@ -2,11 +2,16 @@
 from __future__ import division
 
 import sys
+from itertools import repeat
+from multiprocessing import Pool
 
 from dsa_seq_utils.SeqReader import SeqReader
-from dsa_seq_utils.stats import calculate_mean
-from dsa_seq_utils.stats import calculate_pop_sd
+from dsa_seq_utils.SeqReader import get_compression
+from dsa_seq_utils.stats import LengthHistogram
 from dsa_seq_utils.utilities import get_flag
+from dsa_seq_utils.utilities import has_extension
+from dsa_seq_utils.utilities import fasta_extensions
+from dsa_seq_utils.utilities import fastq_extensions
 from dsa_seq_utils.utilities import help_desired
 from dsa_seq_utils.utilities import log
 
@@ -23,6 +28,8 @@ or fastq files. This is not a utility that makes use of mapping information to
 report precise coverage information. Rather, this tool reports a theoretical
 global genome coverage given an expected genome size.
 
+Input files may be gzip, bgzip, bzip2 or xz compressed (e.g. reads.fastq.gz).
+
 _____
 Usage:
 
@@ -39,87 +46,121 @@ python calculate_coverage [options] -s <genome size> <fastq/fasta file(s)>
     --hist          ------------ Write a read length histogram file to current working directory.
     -a              ------------ Input files are in fasta format.
     -q              ------------ Input files are in fastq format.
+    --threads       ------------ Number of processes used to read each uncompressed file. Default 1.
 
 """
 
-# Get command line args
-if help_desired(sys.argv):
-    sys.exit(usage)
-
-genome_size = get_flag(sys.argv, '-s', usage)
-try:
-    genome_size = int(genome_size)
-except ValueError():
-    raise ValueError('Genome size must be an integer.')
-
-if '-a' in sys.argv and '- q' not in sys.argv:
-    using_fastas = True
-elif '-q' in sys.argv and '-a' not in sys.argv:
-    using_fastas = False
-elif '-q' in sys.argv and '-a' in sys.argv:
-    raise ValueError(
-        "'-a' and '-q' flag cannot be specified together. Files must be either all fasta or all fastq format."
-    )
-else:
-    raise ValueError(
-        "A '-a' or '-q' flag must be specified. This specifies fasta or fastq file format."
-    )
-
-# Check if a histogram file is desired.
-if '--hist' in sys.argv:
-    histogram_requested = True
-    log("Histogram file requested.")
-else:
-    histogram_requested = False
-    log("Histogram file not requested.")
-
-# Get the list of all fasta or fastq files.
-if using_fastas:
-    all_files = [
-        i for i in sys.argv if
-        i.endswith('.fasta') or
-        i.endswith('.fa') or
-        i.endswith('.fan') or
-        i.endswith('.fas')
-    ]
-    if not all_files:
+
+def count_read_lengths(chunk):
+    """
+    Count the read lengths in one sequence file, or one byte range of it.
+    This is run in worker processes when --threads is used.
+    :param chunk: Tuple of (file name, start offset, end offset, fasta format flag).
+                  Offsets may be None to read the whole file.
+    :return: LengthHistogram of read lengths.
+    """
+    in_file, start, end, fasta = chunk
+    lengths = LengthHistogram()
+    x = SeqReader(in_file)
+    if fasta:
+        lengths.update(length for header, length in x.scan_lengths(start, end))
+    else:
+        lengths.update(x.parse_fastq_lengths(start, end))
+    return lengths
+
+
+if __name__ == "__main__":
+    # Get command line args
+    if help_desired(sys.argv):
+        sys.exit(usage)
+
+    genome_size = get_flag(sys.argv, '-s', usage)
+    try:
+        genome_size = int(genome_size)
+    except ValueError():
+        raise ValueError('Genome size must be an integer.')
+
+    if '-a' in sys.argv and '- q' not in sys.argv:
+        using_fastas = True
+    elif '-q' in sys.argv and '-a' not in sys.argv:
+        using_fastas = False
+    elif '-q' in sys.argv and '-a' in sys.argv:
         raise ValueError(
-            "The '-a' option was specified, but no fasta files were found."
+            "'-a' and '-q' flag cannot be specified together. Files must be either all fasta or all fastq format."
         )
-
-else:
-    all_files = [
-        i for i in sys.argv if
-        i.endswith('.fastq') or
-        i.endswith('.fq')
-    ]
-    if not all_files:
+    else:
         raise ValueError(
-            "The '-q' option was specified, but no fastq files were found."
+            "A '-a' or '-q' flag must be specified. This specifies fasta or fastq file format."
         )
 
-all_seq_lengths = []
-for f in all_files:
-    log("Processing %s" % f)
-    x = SeqReader(f)
-    if using_fastas:
-        for header, seq in x.parse_fasta():
-            all_seq_lengths.append(len(seq))
-
+    # Get the number of processes to use.
+    threads = 1
+    if '--threads' in sys.argv:
+        try:
+            threads = int(get_flag(sys.argv, '--threads', usage))
+        except ValueError:
+            raise ValueError('The number of threads must be an integer.')
+        if threads < 1:
+            raise ValueError('The number of threads must be at least 1.')
+
+    # Check if a histogram file is desired.
+    if '--hist' in sys.argv:
+        histogram_requested = True
+        log("Histogram file requested.")
     else:
-        for read in x.parse_fastq():
-            all_seq_lengths.append(len(read[1]))
-
-# Write read length histogram file.
-if histogram_requested:
-    log("Writing read length histogram 'read_lengths.txt'.")
-    with open('read_lengths.txt', 'w') as histogram_file:
-        for length in sorted(all_seq_lengths):
-            histogram_file.write(str(length) + "\n")
-
-log("The coverage for a genome of size %r is %fX." % (genome_size, sum(all_seq_lengths)/genome_size))
-log("The average read length is %fbp." % calculate_mean(all_seq_lengths))
-log("The read length standard deviation is %fbp." % calculate_pop_sd(all_seq_lengths))
-
+        histogram_requested = False
+        log("Histogram file not requested.")
 
+    # Get the list of all fasta or fastq files.
+    if using_fastas:
+        all_files = [i for i in sys.argv[1:] if has_extension(i, fasta_extensions)]
+        if not all_files:
+            raise ValueError(
+                "The '-a' option was specified, but no fasta files were found."
+            )
 
+    else:
+        all_files = [i for i in sys.argv[1:] if has_extension(i, fastq_extensions)]
+        if not all_files:
+            raise ValueError(
+                "The '-q' option was specified, but no fastq files were found."
+            )
+
+    # Count reads of each length. With --threads, uncompressed files are split into byte ranges
+    # on record boundaries, and the ranges are counted in parallel.
+    read_lengths = LengthHistogram()
+    pool = Pool(threads) if threads > 1 else None
+    for f in all_files:
+        log("Processing %s" % f)
+        x = SeqReader(f)
+        # Lengths of an indexed fasta file are read from its .dsa.fai index, which needs no splitting.
+        indexed = using_fastas and x.get_index(build=False) is not None
+        if pool is not None and get_compression(f) is None and not indexed:
+            offsets = x.split_offsets(threads * 4, fastq=not using_fastas)
+            chunks = [(f, start, end, using_fastas) for start, end in offsets]
+            for chunk_lengths in pool.imap_unordered(count_read_lengths, chunks):
+                read_lengths.merge(chunk_lengths)
+        else:
+            read_lengths.merge(count_read_lengths((f, None, None, using_fastas)))
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    # Write read length histogram file.
+    if histogram_requested:
+        log("Writing read length histogram 'read_lengths.txt'.")
+        with open('read_lengths.txt', 'w') as histogram_file:
+            for length, count in read_lengths.items():
+                histogram_file.writelines(repeat(str(length) + "\n", count))
+
+    log("The coverage for a genome of size %r is %fX." % (genome_size, read_lengths.total_length()/genome_size))
+    log("The average read length is %fbp." % read_lengths.mean())
+    log("The read length standard deviation is %fbp." % read_lengths.pop_sd())
+    log("The median read length is %fbp." % read_lengths.median())
+    log("The read length N50 is %rbp." % read_lengths.n50())
+    ng50 = read_lengths.ng50(genome_size)
+    if ng50 is not None:
+        log("The read length NG50 is %rbp." % ng50)
+    else:
+        log("The reads do not cover half of the genome, so the read length NG50 is undefined.")
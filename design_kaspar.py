@@ -1,4 +1,189 @@
 #!/usr/bin/env python
+import sys
+from collections import Counter
+
+from dsa_seq_utils.SeqReader import SeqReader
+from dsa_seq_utils.SeqReader import open_seq_file
+from dsa_seq_utils.SeqWriter import SeqWriter
+from dsa_seq_utils.Sequence import KasparSequence
+from dsa_seq_utils.utilities import log
+from dsa_seq_utils.utilities import run
+from dsa_seq_utils.utilities import get_flag
+from dsa_seq_utils.utilities import help_desired
+from dsa_seq_utils.utilities import has_extension
+
+
+def read_snps(snp_file):
+    """
+    Read the SNPs of a batch. VCF files (.vcf, optionally compressed) are read from their CHROM, POS, ID,
+    REF and ALT columns, and records which are not biallelic SNPs are skipped. Other files are tab
+    separated, with the columns scaffold, coordinate, reference base, alternate base and an optional name.
+    Lines starting with '#' are ignored, as is a line naming the columns before the first SNP.
+
+    :param snp_file: VCF or TSV file.
+    :return: list of (name, scaffold, coordinate, reference base, alternate base) tuples. Scaffolds have
+             no '>', coordinates are 1-based and SNPs without a name are named <scaffold>_<coordinate>.
+    """
+    vcf = has_extension(snp_file, ('.vcf',))
+    snps = []
+    skipped = 0
+    first_line = True
+    with open_seq_file(snp_file) as f:
+        for line_number, line in enumerate(f, 1):
+            if line.startswith('#') or not line.strip():
+                continue
+            fields = line.rstrip('\r\n').split('\t')
+            if len(fields) > 1 and not fields[1].isdigit():
+                if first_line and not vcf:
+                    # Column names, e.g. scaffold coordinate ref alt.
+                    first_line = False
+                    continue
+                raise ValueError('Line %r of %s does not have an integer coordinate: %s' % (line_number, snp_file, line.rstrip()))
+            if vcf:
+                if len(fields) < 5:
+                    raise ValueError('Expected CHROM, POS, ID, REF and ALT columns: %s' % line.rstrip())
+                scaffold, coordinate, name, ref, alt = fields[:5]
+                if len(ref) != 1 or len(alt) != 1 or alt in '.*':
+                    skipped += 1
+                    continue
+            else:
+                if len(fields) < 4:
+                    raise ValueError('Expected scaffold, coordinate, reference and alternate columns: %s' % line.rstrip())
+                scaffold, coordinate, ref, alt = fields[:4]
+                name = fields[4] if len(fields) > 4 else '.'
+            first_line = False
+            scaffold = scaffold.lstrip('>')
+            if name in ('', '.'):
+                name = '%s_%s' % (scaffold, coordinate)
+            snps.append((name, scaffold, int(coordinate), ref.upper(), alt.upper()))
+    if skipped:
+        log('---- Skipped %r VCF records which are not biallelic SNPs.' % skipped)
+    return snps
+
+
+def read_masks(masking_file):
+    """
+    :param masking_file: Bed file of regions to be masked.
+    :return: dictionary of scaffold (without '>'): list of 0-based, end exclusive (start, end) tuples.
+    """
+    masks = dict()
+    with open(masking_file) as f:
+        for line in f:
+            if not line.strip() or line.startswith(('#', 'track', 'browser')):
+                continue
+            bed = line.split('\t')
+            masks.setdefault(bed[0], []).append((int(bed[1]), int(bed[2])))
+    return masks
+
+
+def get_snp_regions(assembly, snps, flank):
+    """
+    Get the region of each SNP plus flank bases on either side. If the assembly can be indexed, only
+    the bytes of each region are read. Otherwise the assembly is read once, rather than once per SNP.
+
+    :param assembly: Fasta file.
+    :param snps: list of SNP tuples from read_snps.
+    :param flank: Number of flanking bases on either side of the SNP.
+    :return: list with the region of each SNP, or None for SNPs on scaffolds which were not found.
+    """
+    x = SeqReader(assembly)
+    if x.get_index() is not None:
+        regions = []
+        for name, scaffold, coordinate, ref, alt in snps:
+            header_and_region = x.get_subseq(scaffold, max(coordinate - flank - 1, 0), coordinate + flank)
+            regions.append(None if header_and_region is None else header_and_region[1])
+        return regions
+
+    snps_by_scaffold = dict()
+    for i, snp in enumerate(snps):
+        snps_by_scaffold.setdefault('>' + snp[1], []).append(i)
+    regions = [None] * len(snps)
+    for header, sequence in x.parse_fasta():
+        for i in snps_by_scaffold.get(header, ()):
+            coordinate = snps[i][2]
+            regions[i] = sequence[max(coordinate - flank - 1, 0):coordinate + flank]
+    return regions
+
+
+def make_kaspar_sequences(region, region_start, flank, ref, alt, masks=()):
+    """
+    Make the reference, alternate and SNP ([ref/alt]) sequences of one SNP region.
+
+    :param region: SNP plus flank bases on either side.
+    :param region_start: 0-based coordinate of the region in its scaffold.
+    :param masks: 0-based, end exclusive (start, end) scaffold coordinates of regions to be replaced with 'n'.
+                  Regions are clipped to the SNP region.
+    :return: tuple of KasparSequence objects.
+    """
+    ref_region = KasparSequence(region)
+    alt_region = KasparSequence(region)
+    SNP_region = KasparSequence(region)
+    for start, end in masks:
+        start_mask = max(start - region_start, 0)
+        end_mask = min(end - region_start, len(region))
+        if start_mask < end_mask:
+            for sequence in (ref_region, alt_region, SNP_region):
+                sequence.replace_coordinates('n', start_mask, end_mask)
+    alt_region.replace_coordinates(alt, flank, flank + 1)
+    SNP_region.replace_coordinates('[' + ref + '/' + alt + ']', flank, flank + 1)
+    return ref_region, alt_region, SNP_region
+
+
+def design_batch(assembly, snps, flank, project, masks=None):
+    """
+    Write the reference, alternate and SNP sequences of a batch of SNPs into one multi fasta file each:
+    project.REF.fasta, project.ALT.fasta and project.SNP.fasta. Headers start with the SNP name.
+    SNPs whose scaffold is not found, whose flanking region runs past the end of the scaffold,
+    or whose reference base does not match the assembly are skipped and logged.
+
+    :param snps: list of SNP tuples from read_snps.
+    :param masks: dictionary from read_masks, or None.
+    :return: Counter of the reasons SNPs were skipped.
+    """
+    regions = get_snp_regions(assembly, snps, flank)
+    skipped = Counter()
+    with SeqWriter(project + '.REF.fasta') as ref_out, SeqWriter(project + '.ALT.fasta') as alt_out, \
+            SeqWriter(project + '.SNP.fasta') as snp_out:
+        for (name, scaffold, coordinate, ref, alt), region in zip(snps, regions):
+            if region is None:
+                reason = 'scaffold not found'
+            elif coordinate - flank < 1 or len(region) != 2 * flank + 1:
+                reason = 'flanking region runs past the end of the scaffold'
+            elif region[flank].upper() != ref:
+                reason = 'reference base does not match the assembly'
+            else:
+                reason = None
+            if reason is not None:
+                log('---- Skipping SNP %s at %s:%r, %s.' % (name, scaffold, coordinate, reason))
+                skipped[reason] += 1
+                continue
+
+            region_start = coordinate - flank - 1
+            sequences = make_kaspar_sequences(
+                region, region_start, flank, ref, alt, () if masks is None else masks.get(scaffold, ())
+            )
+            location = '>%s %s %r:%r ' % (name, scaffold, region_start, coordinate + flank)
+            ref_out.write_fasta(location + 'reference SNP at %r' % (flank + 1), sequences[0].sequence)
+            alt_out.write_fasta(location + 'alternate SNP at %r' % (flank + 1), sequences[1].sequence)
+            snp_out.write_fasta(location + 'SNP at %r' % (flank + 1), sequences[2].sequence)
+    return skipped
+
+
+def run_blast(project, blastdb, threads=1):
+    """ Blast the alternate sequences against the blast database with one blastn process. """
+    run(
+        [
+            'blastn',
+            '-query',
+            '{}.ALT.fasta'.format(project),
+            '-db',
+            '{}'.format(blastdb),
+            '-out',
+            '{}.alt.against.ref.blastresults'.format(project),
+            '-num_threads',
+            str(threads)
+        ]
+    )
 
 
 if __name__ == "__main__":
@@ -21,10 +206,15 @@ against the reference, producing a visualization of the SNP.
 
 A masking option is available that allows you to replace regions
 given in genomic coordinates with 'n' values.
+
+In batch mode (-b), any number of SNPs are read from a VCF or TSV file.
+Their sequences are written to the same 3 multi fasta files, and all
+alternate sequences are blasted with one blastn process.
 _____
 Usage:
 
 python design_kaspar.py [options] -g <genome build> -db <blast db> -c <LG or scaffold of SNP> -l <SNP Genomic Coordinate> -s <Reference Base,Alternate Base> -f <flanking region> -p <Project Name>
+python design_kaspar.py [options] -g <genome build> -db <blast db> -b <SNPs.vcf or SNPs.tsv> -f <flanking region> -p <Project Name>
 
     flags:
 
@@ -46,6 +236,14 @@ python design_kaspar.py [options] -g <genome build> -db <blast db> -c <LG or sca
     -help, --help   ------------ Display help message.
     -m              ------------ Bed file for regions to be masked.
                                  Whole regions will be replaced with 'n'.
+                                 In batch mode, regions are clipped to
+                                 each SNP region.
+    -b              ------------ Batch of SNPs, replacing -c, -l and -s.
+                                 A VCF file (.vcf, biallelic SNPs are used)
+                                 or a tab separated file with columns
+                                 scaffold, coordinate, reference base,
+                                 alternate base and optional SNP name.
+    -t              ------------ Number of blastn threads. Default 1.
 ______
 Output:
 
@@ -55,15 +253,6 @@ Output:
     project_name.alt.against.ref.blastresults
 """
 
-    import sys
-
-    from dsa_seq_utils.SeqReader import SeqReader
-    from dsa_seq_utils.Sequence import KasparSequence
-    from dsa_seq_utils.utilities import log
-    from dsa_seq_utils.utilities import run
-    from dsa_seq_utils.utilities import get_flag
-    from dsa_seq_utils.utilities import help_desired
-
     # get command line args
     if help_desired(sys.argv):
         sys.exit(usage)
@@ -74,6 +263,26 @@ Output:
     # Get the blast database.
     blastdb = get_flag(sys.argv, '-db', usage)
 
+    # Get the number of blast threads.
+    threads = int(get_flag(sys.argv, '-t')) if '-t' in sys.argv else 1
+    if threads < 1:
+        raise ValueError('The number of threads must be at least 1.')
+
+    if '-b' in sys.argv:
+        snp_file = get_flag(sys.argv, '-b', usage)
+        flank = int(get_flag(sys.argv, '-f', usage))
+        project = get_flag(sys.argv, '-p', usage)
+        masks = read_masks(get_flag(sys.argv, '-m')) if '-m' in sys.argv else None
+
+        log('---- Reading SNPs.')
+        snps = read_snps(snp_file)
+        log('---- Writing sequences of %r SNPs.' % len(snps))
+        skipped = design_batch(assembly, snps, flank, project, masks)
+        for reason, count in sorted(skipped.iteritems()):
+            log('---- %r SNPs were skipped: %s.' % (count, reason))
+        run_blast(project, blastdb, threads)
+        sys.exit(0)
+
     # Get the fasta header for contig/scaffold of interest.
     scaffold = get_flag(sys.argv, '-c', usage)
     # Add a '>' character if not already there.
@@ -194,14 +403,4 @@ Output:
         outfile3.write(SNP_region.sequence)
 
     # Run blast
-    run(
-        [
-            'blastn',
-            '-query',
-            '{}.ALT.fasta'.format(project),
-            '-db',
-            '{}'.format(blastdb),
-            '-out',
-            '{}.alt.against.ref.blastresults'.format(project)
-        ]
-    )
\ No newline at end of file
+    run_blast(project, blastdb, threads)
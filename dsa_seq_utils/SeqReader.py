@@ -1,5 +1,22 @@
 #!/usr/bin/env python
 __author__ = 'malonge'
+import os
+import gzip
+import signal
+import subprocess
+from string import whitespace
+from contextlib import contextmanager
+from distutils.spawn import find_executable
+from collections import Counter
+from collections import namedtuple
+from collections import OrderedDict
+from itertools import izip
+from itertools import chain
+from itertools import imap
+from itertools import islice
+from operator import itemgetter
+
+from dsa_seq_utils.utilities import reverse_complement
 
 """
 Michael Alonge
@@ -13,10 +30,133 @@ for header, sequence in x.parse_fasta():
 
 y = SeqReader('reads.fastq')
 for read in y.parse_fastq():
-    # Each read is a 4 element list.
-    # One element for each line of a read.
+    # Each read is a 4 element FastqRecord tuple.
+    # One element for each line of a read, also available as
+    # read.header, read.sequence, read.plus and read.quality.
+
+z = SeqReader('genome.fasta')
+# Random access through a samtools style .dsa.fai index, built on first use.
+header, sequence = z.get_seq('chr1')
+header, region = z.get_subseq('chr1', 1000, 2000)
+
+gzip, bgzip, bzip2 and xz compressed files are detected and decompressed on the fly.
 """
 
+# One line of a .dsa.fai index. Offset is the byte offset of the first base of the sequence,
+# line_bases the number of bases per line and line_width the number of bytes per line,
+# including the line terminator.
+FastaIndexRecord = namedtuple('FastaIndexRecord', ['length', 'offset', 'line_bases', 'line_width'])
+
+# Leading bytes of each supported compression format. bgzip files are gzip files.
+compression_magic = [
+    ('gzip', '\x1f\x8b'),
+    ('bz2', 'BZh'),
+    ('xz', '\xfd7zXZ\x00'),
+]
+
+# External decompressors, in order of preference. Running these in a separate process
+# lets decompression overlap with parsing.
+decompression_commands = {
+    'gzip': [['pigz', '-dc'], ['gzip', '-dc']],
+    'bz2': [['pbzip2', '-dc'], ['lbzip2', '-dc'], ['bzip2', '-dc']],
+    'xz': [['xz', '-dc']],
+}
+
+
+def get_compression(file_name):
+    """
+    Detect the compression format of a file from its first bytes.
+    :param file_name: Path to file.
+    :return: 'gzip', 'bz2', 'xz' or None if the file is not compressed.
+    """
+    with open(file_name, 'rb') as f:
+        magic = f.read(6)
+    for compression, prefix in compression_magic:
+        if magic.startswith(prefix):
+            return compression
+    return None
+
+
+def _restore_sigpipe():
+    """ Python ignores SIGPIPE, let decompressors exit quietly when their output is closed. """
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+
+@contextmanager
+def open_seq_file(file_name):
+    """
+    Open a possibly compressed sequence file for reading. Compressed files are
+    streamed through an external decompressor (pigz, gzip, pbzip2, bzip2, xz) when
+    one is available, and through the python standard library otherwise.
+    :param file_name: Path to file.
+    """
+    compression = get_compression(file_name)
+    if compression is None:
+        with open(file_name) as f:
+            yield f
+        return
+
+    command = None
+    for candidate in decompression_commands[compression]:
+        if find_executable(candidate[0]):
+            command = candidate
+            break
+
+    if command is None:
+        if compression == 'gzip':
+            f = gzip.open(file_name)
+        elif compression == 'bz2':
+            import bz2
+            f = bz2.BZ2File(file_name)
+        else:
+            try:
+                import lzma
+            except ImportError:
+                from backports import lzma
+            f = lzma.open(file_name)
+        try:
+            yield f
+        finally:
+            f.close()
+        return
+
+    process = subprocess.Popen(command + [file_name], stdout=subprocess.PIPE, bufsize=-1, preexec_fn=_restore_sigpipe)
+    try:
+        yield process.stdout
+    finally:
+        process.stdout.close()
+        return_code = process.wait()
+    # A decompressor killed by SIGPIPE was stopped early by the reader, which is not an error.
+    if return_code not in (0, -signal.SIGPIPE):
+        raise IOError('Failed : %s' % ' '.join(command + [file_name]))
+
+
+class FastqRecord(tuple):
+    """
+    One fastq read: (header, sequence, plus line, quality scores).
+    A tuple with named fields and no per instance dictionary. It compares equal to a
+    list of the same 4 lines, as parse_fastq used to yield lists.
+    """
+    __slots__ = ()
+
+    header = property(itemgetter(0))
+    sequence = property(itemgetter(1))
+    plus = property(itemgetter(2))
+    quality = property(itemgetter(3))
+
+    def __eq__(self, other):
+        if isinstance(other, list):
+            other = tuple(other)
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = tuple.__hash__
+
+    def __reduce__(self):
+        return FastqRecord, (tuple(self),)
+
 
 class SeqReader:
     """
@@ -24,8 +164,15 @@ class SeqReader:
     and one for fastq files. These methods are bare bones,
     and simply provide the raw contents of the file provided.
     parse_fasta() --- fasta parser. Yields header, sequence for each sequence.
-    parse_fastq() --- fastq parser. Yields a list of 4 elements per read
-                      [header, sequence, '+', quality scores]
+    parse_fastq() --- fastq parser. Yields a 4 element FastqRecord per read
+                      (header, sequence, '+', quality scores)
+
+    Random access to fasta sequences (get_seq, get_subseq, get_seq_length) goes
+    through a .dsa.fai index of byte offsets saved next to the fasta file. The index
+    is built on first use and reused from disk until the fasta file changes.
+    Unlike samtools, the index is keyed on the full header line, not just its first word,
+    so it has its own file name and a samtools .fai index of the same fasta file is left alone.
+    Compressed files are read sequentially, they are never indexed.
     """
 
     def __init__(self, in_file):
@@ -37,37 +184,27 @@ class SeqReader:
         if not isinstance(in_file, str):
             raise AttributeError('Only a string can be used to instantiate a SeqReader object.')
         self.in_file = in_file
+        self.index_file = in_file + '.dsa.fai'
+        self._index = None
 
-    def parse_fasta(self):
+    def parse_fasta(self, start=None, end=None):
         """
         Generator yielding header and sequence, for each sequence
         in the fasta file sent to the class.
+
+        :param start: Optional byte offset to start reading at. Should come from split_offsets.
+        :param end: Optional byte offset to stop reading at. Should come from split_offsets.
         """
-        with open(self.in_file) as fasta_file:
-            sequence = ''
-            # Find first header.
-            line = fasta_file.readline()
-            while not line.startswith('>'):
-                line = fasta_file.readline()
-                if not line:
-                    error = """ This file provided is not in proper fasta format.
-                    In addition to the usual fasta conventions, be sure that there are
-                    no blank lines in the file.
-                    """
-                    raise RuntimeError(error)
-            header = line.rstrip()
-
-            # Get sequence associated with that header.
-            for line in fasta_file:
-                if line.startswith('>'):
-                    # Once the sequence is over, (next header begins),
-                    # yield initial header and sequence.
+        if start is not None or end is not None:
+            with open(self.in_file, 'rb') as fasta_file:
+                lines = self._lines_in_range(fasta_file, start, end)
+                for header, sequence in self._fasta_records(lines):
                     yield header, sequence
-                    header = line.rstrip()
-                    sequence = ''
-                else:
-                    sequence += ''.join(line.rstrip().split())
-        yield header, sequence
+            return
+
+        with open_seq_file(self.in_file) as fasta_file:
+            for header, sequence in self._fasta_records(fasta_file):
+                yield header, sequence
 
     def parse_multihead_fasta(self):
         """
@@ -86,53 +223,437 @@ class SeqReader:
         I decided not to adjust the original generator to accomdodate this, because then
         it would not be able to handle fasta files where a header is present but no sequence.
         """
-        with open(self.in_file) as fasta_file:
-            sequence = ''
-            # Find first header.
-            line = fasta_file.readline()
-            while not line.startswith('>'):
-                line = fasta_file.readline()
-                if not line:
-                    error = """ This file provided is not in proper fasta format.
-                    In addition to the usual fasta conventions, be sure that there are
-                    no blank lines in the file.
-                    """
-                    raise RuntimeError(error)
-            header = line.rstrip()
-
-            # Get sequence associated with that header.
-            for line in fasta_file:
-                if line.startswith('>'):
-                    # Here is the change. Check if this header is immediately following
-                    # the previous header. If so, treat it as an extension of the previous header.
-                    if not sequence:
-                        header += line.rstrip()
-                    else:
-                        # Once the sequence is over, (next header begins),
-                        # yield initial header and sequence.
-                        yield header, sequence
-                        header = line.rstrip()
-                        sequence = ''
+        with open_seq_file(self.in_file) as fasta_file:
+            for header, sequence in self._fasta_records(fasta_file, multihead=True):
+                yield header, sequence
+
+    @staticmethod
+    def _fasta_records(fasta_file, multihead=False, lines_per_piece=8192):
+        """
+        Parsing core shared by the fasta generators. The lines of each sequence are
+        collected in a list, and whitespace is stripped from many lines at once when
+        they are joined. Sequences are never grown one line at a time, so parsing
+        time is linear in the length of the sequence.
+
+        :param fasta_file: Fasta file object, or any iterable of fasta lines.
+        :param multihead: Treat consecutive header lines as one header.
+        :param lines_per_piece: Number of lines to collect before joining them, which
+                                bounds the list overhead for very long sequences.
+        """
+        file_lines = iter(fasta_file)
+        # Find first header.
+        for line in file_lines:
+            if line.startswith('>'):
+                break
+        else:
+            error = """ This file provided is not in proper fasta format.
+            In addition to the usual fasta conventions, be sure that there are
+            no blank lines in the file.
+            """
+            raise RuntimeError(error)
+        header = line.rstrip()
+
+        # Get sequence associated with that header.
+        pieces = []
+        lines = []
+        for line in file_lines:
+            if line[0] == '>':
+                pieces.append(''.join(lines).translate(None, whitespace))
+                sequence = ''.join(pieces)
+                # Check if this header is immediately following the previous header.
+                # If so, treat it as an extension of the previous header.
+                if multihead and not sequence:
+                    header += line.rstrip()
+                    continue
+                # Once the sequence is over, (next header begins),
+                # yield initial header and sequence.
+                yield header, sequence
+                header = line.rstrip()
+                pieces = []
+                lines = []
+            else:
+                lines.append(line)
+                if len(lines) == lines_per_piece:
+                    pieces.append(''.join(lines).translate(None, whitespace))
+                    lines = []
+        pieces.append(''.join(lines).translate(None, whitespace))
+        yield header, ''.join(pieces)
+
+    def scan_lengths(self, start=None, end=None, block_size=4194304):
+        """
+        Generator yielding the header and sequence length of each sequence in the fasta file,
+        without making the sequences. If a .dsa.fai index is already present and no byte range
+        is given, lengths are read from the index and the fasta file is not read at all.
+        Otherwise, bases are counted in large blocks of the file, so memory use does not
+        depend on the length of the sequences. For fastq files, see parse_fastq_lengths.
+
+        :param start: Optional byte offset to start reading at. Should come from split_offsets.
+        :param end: Optional byte offset to stop reading at. Should come from split_offsets.
+        """
+        if start is None and end is None:
+            index = self.get_index(build=False)
+            if index is not None:
+                for name, record in index.iteritems():
+                    yield '>' + name, record.length
+                return
+
+            with open_seq_file(self.in_file) as fasta_file:
+                blocks = iter(lambda: fasta_file.read(block_size), '')
+                for header, length in self._count_fasta_bases(blocks):
+                    yield header, length
+            return
+
+        with open(self.in_file, 'rb') as fasta_file:
+            for header, length in self._count_fasta_bases(self._blocks_in_range(fasta_file, start, end, block_size)):
+                yield header, length
+
+    @staticmethod
+    def _count_fasta_bases(blocks):
+        """
+        Counting core of scan_lengths. Bases are counted as in parse_fasta, i.e. every
+        non whitespace character of the sequence lines.
+        :param blocks: Iterable of consecutive blocks of a fasta file.
+        :return: Generator of (header, length) tuples.
+        """
+        header = None
+        length = 0
+        # Pieces of a header line which continues into the next block.
+        header_pieces = None
+        at_line_start = True
+        for block in blocks:
+            position = 0
+            if header_pieces is not None:
+                line_end = block.find('\n')
+                if line_end == -1:
+                    header_pieces.append(block)
+                    continue
+                header_pieces.append(block[:line_end])
+                header = ''.join(header_pieces).rstrip()
+                header_pieces = None
+                position = line_end + 1
+
+            while True:
+                if position == 0 and at_line_start and block.startswith('>'):
+                    header_start = 0
                 else:
-                    sequence += ''.join(line.rstrip().split())
-        yield header, sequence
+                    # Search from the new line ending the previous line, if it is in this block.
+                    header_start = block.find('\n>', max(position - 1, 0))
+                    if header_start == -1:
+                        if header is not None:
+                            length += len(block[position:].translate(None, whitespace))
+                        break
+                    header_start += 1
+                if header is not None:
+                    length += len(block[position:header_start].translate(None, whitespace))
+                    yield header, length
+                length = 0
+                line_end = block.find('\n', header_start)
+                if line_end == -1:
+                    header_pieces = [block[header_start:]]
+                    header = None
+                    break
+                header = block[header_start:line_end].rstrip()
+                position = line_end + 1
+            at_line_start = block.endswith('\n')
+
+        if header_pieces is not None:
+            header = ''.join(header_pieces).rstrip()
+        if header is None:
+            raise RuntimeError('This file provided is not in proper fasta format. No headers were found.')
+        yield header, length
 
-    def parse_fastq(self):
+    def parse_fastq(self, start=None, end=None):
         """
-        Fastq generator, yielding a list of 4 lines at a time.
+        Fastq generator, yielding a FastqRecord of 4 lines at a time.
         These 4 lines represent 1 read.
+
+        :param start: Optional byte offset to start reading at. Should come from split_offsets.
+        :param end: Optional byte offset to stop reading at. Should come from split_offsets.
         """
-        with open(self.in_file) as fastq_file:
-            read_list = []
-            index = 0
-            # Iterate over each line of fastq file.
-            for line in fastq_file:
-                read_list.append(line.rstrip())
-                index += 1
-                if index == 4:
-                    yield read_list
-                    read_list = []
-                    index = 0
+        # chain and imap keep the per read work in C.
+        return chain.from_iterable(
+            imap(FastqRecord, izip(*[iter(lines)] * 4)) for lines in self._fastq_line_blocks(start, end)
+        )
+
+    def parse_fastq_lengths(self, start=None, end=None):
+        """
+        Generator yielding the sequence length of each read in a fastq file,
+        without making a record for each read.
+
+        :param start: Optional byte offset to start reading at. Should come from split_offsets.
+        :param end: Optional byte offset to stop reading at. Should come from split_offsets.
+        """
+        return chain.from_iterable(
+            imap(len, islice(lines, 1, None, 4)) for lines in self._fastq_line_blocks(start, end)
+        )
+
+    def _fastq_line_blocks(self, start=None, end=None, block_size=4194304):
+        """
+        Read a fastq file in large blocks, and split each block into lines in one call
+        rather than reading line by line.
+        :return: Generator of lists of lines. Each list holds a whole number of reads.
+        """
+        if start is not None or end is not None:
+            with open(self.in_file, 'rb') as fastq_file:
+                for lines in self._split_fastq_blocks(self._blocks_in_range(fastq_file, start, end, block_size)):
+                    yield lines
+            return
+
+        with open_seq_file(self.in_file) as fastq_file:
+            blocks = iter(lambda: fastq_file.read(block_size), '')
+            for lines in self._split_fastq_blocks(blocks):
+                yield lines
+
+    @staticmethod
+    def _split_fastq_blocks(blocks):
+        """
+        Parsing core of parse_fastq.
+        :param blocks: Iterable of consecutive blocks of a fastq file.
+        :return: Generator of lists of lines, each holding a whole number of reads.
+                 Lines of an incomplete read at the end of the file are dropped.
+        """
+        partial_line = ''
+        leftover_lines = []
+        for block in blocks:
+            block = partial_line + block
+            line_end = block.rfind('\n') + 1
+            partial_line = block[line_end:]
+            if not line_end:
+                continue
+            block = block[:line_end - 1]
+            if '\r' in block:
+                block = block.replace('\r', '')
+            lines = block.split('\n')
+            if leftover_lines:
+                lines = leftover_lines + lines
+            n_read_lines = len(lines) - len(lines) % 4
+            leftover_lines = lines[n_read_lines:]
+            del lines[n_read_lines:]
+            yield lines
+        # The file may not end with a new line.
+        if partial_line:
+            leftover_lines.append(partial_line.rstrip('\r'))
+            if len(leftover_lines) == 4:
+                yield leftover_lines
+
+    @staticmethod
+    def _blocks_in_range(seq_file, start, end, block_size):
+        """
+        Generator yielding blocks of an uncompressed file between two byte offsets.
+        """
+        position = start or 0
+        seq_file.seek(position)
+        while end is None or position < end:
+            size = block_size if end is None else min(block_size, end - position)
+            block = seq_file.read(size)
+            if not block:
+                return
+            position += len(block)
+            yield block
+
+    @staticmethod
+    def _lines_in_range(seq_file, start, end):
+        """
+        Generator yielding the lines of an uncompressed file between two byte offsets.
+        Both offsets should be at the start of a line.
+        """
+        position = start or 0
+        seq_file.seek(position)
+        for line in seq_file:
+            if end is not None and position >= end:
+                break
+            position += len(line)
+            yield line
+
+    @staticmethod
+    def _next_record_start(seq_file, offset, fastq):
+        """
+        Find the byte offset of the first record starting after offset, or at offset 0 for the first
+        record of the file.
+
+        A fastq record is recognized as a line starting with '@' which is followed two lines later
+        by a line starting with '+'. Quality lines may start with '@', but the line two lines
+        after a quality line is a sequence line, which never starts with '+'.
+        """
+        seq_file.seek(offset)
+        if offset:
+            # Skip the rest of the line that offset falls in.
+            seq_file.readline()
+        position = seq_file.tell()
+        if not fastq:
+            line = seq_file.readline()
+            while line and not line.startswith('>'):
+                position += len(line)
+                line = seq_file.readline()
+            return position
+
+        lines = [seq_file.readline(), seq_file.readline(), seq_file.readline()]
+        while lines[0] and not (lines[0].startswith('@') and lines[2].startswith('+')):
+            position += len(lines[0])
+            lines = [lines[1], lines[2], seq_file.readline()]
+        return position
+
+    def split_offsets(self, n_chunks, fastq=False):
+        """
+        Split an uncompressed fasta or fastq file into byte ranges which start and end on
+        record boundaries, so that each range can be parsed independently, e.g. by
+        parse_fasta(start, end) in a separate process.
+
+        :param n_chunks: Desired number of ranges. Fewer are returned for small files.
+        :param fastq: True if the file is in fastq format.
+        :return: List of (start, end) byte offsets.
+        """
+        if get_compression(self.in_file) is not None:
+            raise RuntimeError('Compressed files can not be split: %s' % self.in_file)
+        file_size = os.path.getsize(self.in_file)
+        with open(self.in_file, 'rb') as seq_file:
+            # Lines before the first record, e.g. comments, are skipped as they are when parsing the whole file.
+            starts = [self._next_record_start(seq_file, 0, fastq)]
+            if starts[0] == file_size:
+                # No records at all. Parsing the whole file reports the error.
+                starts = [0]
+            for i in range(1, n_chunks):
+                starts.append(self._next_record_start(seq_file, file_size * i // n_chunks, fastq))
+        starts.append(file_size)
+        return [(start, end) for start, end in zip(starts, starts[1:]) if start < end]
+
+    def build_index(self):
+        """
+        Scan the fasta file and make a .dsa.fai index for it.
+        Raises a RuntimeError if the file can not be indexed, i.e. if it is compressed,
+        has no headers, has a header more than once or if the lines of a sequence are
+        not all of the same length.
+        :return: Ordered dictionary where keys = headers (without '>'), values = FastaIndexRecord
+        """
+        if get_compression(self.in_file) is not None:
+            raise RuntimeError('Compressed files can not be indexed: %s' % self.in_file)
+        index = OrderedDict()
+        offset = 0
+        name = None
+        with open(self.in_file, 'rb') as fasta_file:
+            for line in fasta_file:
+                line_width = len(line)
+                if line.startswith('>'):
+                    if name is not None:
+                        index[name] = FastaIndexRecord(length, seq_offset, first_bases, first_width)
+                    name = line[1:].rstrip()
+                    if '\t' in name:
+                        raise RuntimeError('Headers containing tabs can not be indexed: %s' % name)
+                    if name in index:
+                        raise RuntimeError('Files with duplicate headers can not be indexed: %s' % name)
+                    seq_offset = offset + line_width
+                    length = 0
+                    first_bases = first_width = 0
+                    last_bases = None
+                elif name is not None:
+                    bases = len(line.rstrip())
+                    if last_bases is None:
+                        first_bases, first_width = bases, line_width
+                    elif bases and (last_bases < first_bases or bases > first_bases or line_width > first_width):
+                        # Only the final line of a sequence may be shorter than the others.
+                        raise RuntimeError('The sequence %s does not have uniform line lengths.' % name)
+                    last_bases = bases
+                    length += bases
+                offset += line_width
+
+        if name is None:
+            raise RuntimeError('This file provided is not in proper fasta format. No headers were found.')
+        index[name] = FastaIndexRecord(length, seq_offset, first_bases, first_width)
+        return index
+
+    def write_index(self, index):
+        """
+        Write an index made by build_index to the .dsa.fai file.
+        :param index: Ordered dictionary from build_index.
+        """
+        with open(self.index_file, 'w') as out_file:
+            for name, record in index.iteritems():
+                out_file.write('%s\t%d\t%d\t%d\t%d\n' % ((name,) + tuple(record)))
+
+    def read_index(self):
+        """
+        Read the .dsa.fai file of this fasta file.
+        :return: Ordered dictionary where keys = headers (without '>'), values = FastaIndexRecord
+        """
+        index = OrderedDict()
+        with open(self.index_file) as in_file:
+            for line in in_file:
+                fields = line.rstrip('\r\n').split('\t')
+                if fields[0] in index:
+                    raise ValueError('The header %s is in the index more than once.' % fields[0])
+                index[fields[0]] = FastaIndexRecord(*[int(i) for i in fields[1:5]])
+        return index
+
+    def _index_matches_file(self, index):
+        """
+        Check that the header lines preceding the first and last indexed sequences are where
+        the index says they are. This catches indexes which were not made for this file.
+        """
+        if not index:
+            return False
+        with open(self.in_file, 'rb') as fasta_file:
+            for name in (next(iter(index)), next(reversed(index))):
+                offset = index[name].offset
+                header = '>' + name
+                fasta_file.seek(max(0, offset - len(header) - 2))
+                preceding = fasta_file.read(offset - fasta_file.tell())
+                if not (preceding.endswith(header + '\n') or preceding.endswith(header + '\r\n')):
+                    return False
+        return True
+
+    def get_index(self, build=True):
+        """
+        Get the .dsa.fai index for this fasta file. An index on disk is reused if it is at least
+        as new as the fasta file. Otherwise, a new index is built and, if possible, saved.
+        :param build: If False, only an index already on disk (or in memory) is used.
+        :return: Ordered dictionary from build_index, or None if the file can not be indexed.
+        """
+        if self._index is not None:
+            return self._index or None
+        if get_compression(self.in_file) is not None:
+            self._index = OrderedDict()
+            return None
+
+        index = None
+        try:
+            if os.path.getmtime(self.index_file) >= os.path.getmtime(self.in_file):
+                index = self.read_index()
+                if not self._index_matches_file(index):
+                    index = None
+        except (OSError, IOError, ValueError, TypeError):
+            index = None
+
+        if index is None:
+            if not build:
+                return None
+            try:
+                index = self.build_index()
+            except RuntimeError:
+                # Not indexable. Remember that, so callers fall back to parsing.
+                self._index = OrderedDict()
+                return None
+            try:
+                self.write_index(index)
+            except (OSError, IOError):
+                # e.g. a read only directory. The index is still used from memory.
+                pass
+
+        self._index = index
+        return index
+
+    def _read_region(self, fasta_file, record, start, end):
+        """
+        Read the bases between start and end (0-based, end exclusive) of an indexed sequence.
+        Only the bytes covering the region are read from disk.
+        :param fasta_file: Fasta file object opened in binary mode.
+        :param record: FastaIndexRecord of the sequence.
+        """
+        if start >= end:
+            return ''
+        first_byte = record.offset + (start // record.line_bases) * record.line_width + start % record.line_bases
+        last_byte = record.offset + ((end - 1) // record.line_bases) * record.line_width + (end - 1) % record.line_bases
+        fasta_file.seek(first_byte)
+        return fasta_file.read(last_byte - first_byte + 1).translate(None, '\r\n')
 
     def get_seq(self, query_header):
         """
@@ -141,20 +662,100 @@ class SeqReader:
 
         :param query_header:
         """
+        return self.get_subseq(query_header)
+
+    def get_subseq(self, query_header, start=None, end=None):
+        """
+        Get a region of one sequence from a multi fasta given that sequences header.
+        start and end follow python slicing conventions (0-based, end exclusive).
+        If the fasta file is indexed, only the bytes covering the region are read.
+
+        :param query_header:
+        :param start: Start coordinate. Defaults to the start of the sequence.
+        :param end: End coordinate. Defaults to the end of the sequence.
+        :return: header, subsequence or None if the header was not found.
+        """
         if not query_header.startswith('>'):
             query_header = ''.join(['>', query_header])
-        for header, sequence in self.parse_fasta():
-            if header == query_header:
-                return header, sequence
-        return None
+
+        index = self.get_index()
+        if index is None:
+            for header, sequence in self.parse_fasta():
+                if header == query_header:
+                    return header, sequence[start:end]
+            return None
+
+        record = index.get(query_header[1:])
+        if record is None:
+            return None
+        start, end, step = slice(start, end).indices(record.length)
+        with open(self.in_file, 'rb') as fasta_file:
+            return query_header, self._read_region(fasta_file, record, start, end)
+
+    def iter_reverse_complement(self, query_header, chunk_size=1048576):
+        """
+        Generator yielding the reverse complement of one sequence in consecutive pieces
+        of chunk_size bases, starting from the end of the sequence. If the fasta file is
+        indexed, only one piece is in memory at a time.
+        e.g. out_file.writelines(x.iter_reverse_complement('>chr1'))
+
+        :param query_header:
+        :param chunk_size: Number of bases in each piece.
+        """
+        if not query_header.startswith('>'):
+            query_header = ''.join(['>', query_header])
+
+        index = self.get_index()
+        if index is None:
+            header_and_seq = self.get_subseq(query_header)
+            if header_and_seq is None:
+                raise ValueError('The sequence %s was not found in %s.' % (query_header, self.in_file))
+            sequence = header_and_seq[1]
+            for end in xrange(len(sequence), 0, -chunk_size):
+                yield reverse_complement(sequence[max(end - chunk_size, 0):end])
+            return
+
+        record = index.get(query_header[1:])
+        if record is None:
+            raise ValueError('The sequence %s was not found in %s.' % (query_header, self.in_file))
+        with open(self.in_file, 'rb') as fasta_file:
+            for end in xrange(record.length, 0, -chunk_size):
+                yield reverse_complement(self._read_region(fasta_file, record, max(end - chunk_size, 0), end))
+
+    def get_seq_length(self, query_header):
+        """
+        Get the length of one sequence from a multi fasta given that sequences header.
+
+        :param query_header:
+        :return: The length of the sequence, or None if the header was not found.
+        """
+        if not query_header.startswith('>'):
+            query_header = ''.join(['>', query_header])
+
+        index = self.get_index()
+        if index is None:
+            for header, sequence in self.parse_fasta():
+                if header == query_header:
+                    return len(sequence)
+            return None
+
+        record = index.get(query_header[1:])
+        if record is None:
+            return None
+        return record.length
 
     def get_multiple_seqs(self, query_headers):
         """
         Get multiple sequences from a multi fasta given
-        sequence headers.
+        sequence headers. Sequences are yielded in the order
+        of query_headers.
+
+        If a .dsa.fai index is already present, each sequence is read
+        directly from its offset. Otherwise, the file is read once and
+        only the requested sequences are kept, so memory use is bounded
+        by the size of the requested sequences, not of the whole file.
         :return:
         """
-        all_seqs = dict()
         q_heads = []
         for i in query_headers:
             if not i:
@@ -164,11 +765,39 @@ class SeqReader:
             else:
                 q_heads.append(i)
 
-        for header, sequence in self.parse_fasta():
-            all_seqs[header] = sequence
+        index = self.get_index(build=False)
+        if index is not None:
+            with open(self.in_file, 'rb') as fasta_file:
+                for head in q_heads:
+                    record = index.get(head[1:])
+                    if record is None:
+                        raise ValueError('A sequence with the header %s was not found' % head)
+                    yield head, self._read_region(fasta_file, record, 0, record.length)
+            return
+
+        # Number of times each header still has to be yielded.
+        remaining = Counter(q_heads)
+        # Requested sequences which have been read, but not yet yielded.
+        found = dict()
+        next_head = 0
+        if q_heads:
+            for header, sequence in self.parse_fasta():
+                if not remaining[header] or header in found:
+                    continue
+                found[header] = sequence
+                # Yield everything that is now available in the requested order.
+                while next_head < len(q_heads) and q_heads[next_head] in found:
+                    head = q_heads[next_head]
+                    yield head, found[head]
+                    remaining[head] -= 1
+                    if not remaining[head]:
+                        del found[head]
+                    next_head += 1
+                if next_head == len(q_heads):
+                    return
 
-        for head in q_heads:
+        for head in q_heads[next_head:]:
             try:
-                yield head, all_seqs[head]
+                yield head, found[head]
             except KeyError:
-                raise ValueError('A sequence with the header %s was not found' % head)
\ No newline at end of file
+                raise ValueError('A sequence with the header %s was not found' % head)
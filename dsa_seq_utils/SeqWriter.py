@@ -0,0 +1,222 @@
+import zlib
+import struct
+import threading
+from Queue import Queue
+
+"""
+Michael Alonge
+SeqWriter.py
+Buffered fasta and fastq writer. Records are collected in memory and written in
+large blocks, optionally gzip or bgzip compressed in a background thread.
+e.g.
+from SeqWriter import SeqWriter
+with SeqWriter('out.fasta.gz', line_width=60) as writer:
+    writer.write_records(SeqReader('sequences.fasta').parse_fasta())
+
+with SeqWriter(sys.stdout) as writer:
+    for read in SeqReader('reads.fastq').parse_fastq():
+        writer.write_record(read)
+"""
+
+# Largest amount of uncompressed data in one BGZF block, as used by samtools/htslib.
+bgzf_block_size = 65280
+
+# The empty BGZF block which marks the end of a bgzip file.
+bgzf_eof = '\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+
+
+def bgzf_block(data, level=6):
+    """
+    Compress up to bgzf_block_size bytes into one BGZF block, a gzip member with
+    the size of the block stored in its header.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    header = struct.pack('<4BI2BH2BHH', 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord('B'), ord('C'), 2, len(compressed) + 25)
+    trailer = struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data))
+    return header + compressed + trailer
+
+
+class _Compressor(object):
+    """ Incrementally compress data into one gzip member or a series of BGZF blocks. """
+
+    def __init__(self, compression, level=6):
+        if compression not in ('gzip', 'bgzip'):
+            raise ValueError('Unsupported compression %r. Use gzip or bgzip.' % compression)
+        self.compression = compression
+        self.level = level
+        if compression == 'gzip':
+            # wbits of 31 writes a gzip header and trailer.
+            self._gzip = zlib.compressobj(level, zlib.DEFLATED, 31)
+        self._pending = ''
+
+    def compress(self, data):
+        if self.compression == 'gzip':
+            return self._gzip.compress(data)
+        data = self._pending + data
+        n_full = len(data) // bgzf_block_size * bgzf_block_size
+        self._pending = data[n_full:]
+        return ''.join(
+            bgzf_block(data[i:i + bgzf_block_size], self.level) for i in xrange(0, n_full, bgzf_block_size)
+        )
+
+    def flush(self):
+        if self.compression == 'gzip':
+            return self._gzip.flush()
+        last_block = bgzf_block(self._pending, self.level) if self._pending else ''
+        self._pending = ''
+        return last_block + bgzf_eof
+
+
+class SeqWriter(object):
+
+    def __init__(self, out_file, line_width=None, compression=None, buffer_size=4194304, level=6):
+        """
+        :param out_file: Output file name, or an open file object such as sys.stdout.
+        :param line_width: Number of bases per fasta sequence line. By default sequences are not wrapped.
+        :param compression: None, 'gzip' or 'bgzip'. For file names ending in .gz or .bgz,
+                            the default is gzip or bgzip compression respectively.
+        :param buffer_size: Number of bytes collected before they are written.
+        :param level: Compression level, 1 to 9.
+        """
+        if isinstance(out_file, basestring):
+            if compression is None:
+                if out_file.endswith('.bgz'):
+                    compression = 'bgzip'
+                elif out_file.endswith('.gz'):
+                    compression = 'gzip'
+            self._file = open(out_file, 'wb')
+            self._close_file = True
+        else:
+            self._file = out_file
+            self._close_file = False
+        if line_width is not None and line_width < 1:
+            raise ValueError('The line width must be at least 1.')
+        self.line_width = line_width
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._buffered = 0
+        self._closed = False
+
+        # Compression runs in a background thread. zlib releases the GIL while compressing,
+        # so formatting records and compressing them overlap.
+        self._compressor = None
+        if compression is not None:
+            self._compressor = _Compressor(compression, level)
+            self._queue = Queue(maxsize=4)
+            self._error = None
+            self._thread = threading.Thread(target=self._compress_and_write)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _compress_and_write(self):
+        """ Compress and write each block of data from the queue, until None is received. """
+        while True:
+            data = self._queue.get()
+            # After an error, keep emptying the queue so that the writing thread does not block.
+            # The error is raised in the writing thread by _check_error.
+            if self._error is None:
+                try:
+                    if data is None:
+                        self._file.write(self._compressor.flush())
+                    else:
+                        self._file.write(self._compressor.compress(data))
+                except Exception as e:
+                    self._error = e
+            if data is None:
+                return
+
+    def _check_error(self):
+        if self._compressor is not None and self._error is not None:
+            raise IOError('Compressing output failed: %s' % self._error)
+
+    def write(self, text):
+        """ Write preformatted text. """
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def write_fasta(self, header, sequence):
+        """
+        Write one fasta record.
+        :param header: Fasta header, including the '>'.
+        :param sequence: Sequence, wrapped to line_width bases per line if line_width was given.
+        """
+        line_width = self.line_width
+        if line_width is not None and len(sequence) > line_width:
+            sequence = '\n'.join(sequence[i:i + line_width] for i in xrange(0, len(sequence), line_width))
+        self.write(header + '\n' + sequence + '\n')
+
+    def write_fastq(self, read):
+        """
+        Write one fastq record.
+        :param read: The 4 lines of a read, e.g. a FastqRecord from SeqReader.parse_fastq.
+        """
+        self.write('\n'.join(read) + '\n')
+
+    def write_record(self, record):
+        """ Write a fasta (header, sequence) record or a 4 line fastq record. """
+        if len(record) == 2:
+            self.write_fasta(record[0], record[1])
+        else:
+            self.write_fastq(record)
+
+    def write_records(self, records):
+        """
+        Write every record from an iterable of fasta (header, sequence) records or 4 line fastq records.
+        :return: The number of records written.
+        """
+        if self.line_width is not None:
+            n_records = 0
+            for record in records:
+                self.write_record(record)
+                n_records += 1
+            return n_records
+
+        # Without wrapping, fasta and fastq records are both written line by line.
+        # Append to the buffer directly, this is the hot loop when copying large files.
+        n_records = 0
+        buffer_size = self.buffer_size
+        for record in records:
+            text = '\n'.join(record) + '\n'
+            self._buffer.append(text)
+            self._buffered += len(text)
+            if self._buffered >= buffer_size:
+                self.flush()
+            n_records += 1
+        return n_records
+
+    def flush(self):
+        """ Write all buffered data. Compressed data is written by the background thread. """
+        if self._buffer:
+            data = ''.join(self._buffer)
+            self._buffer = []
+            self._buffered = 0
+            if self._compressor is None:
+                self._file.write(data)
+            else:
+                self._check_error()
+                self._queue.put(data)
+
+    def close(self):
+        """ Flush, finish compression and close the output file if it was opened by this object. """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.flush()
+            if self._compressor is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._check_error()
+            self._file.flush()
+        finally:
+            if self._close_file:
+                self._file.close()
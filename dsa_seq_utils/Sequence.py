@@ -1,6 +1,11 @@
 __author__ = 'malonge'
 import re
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 class BaseSequence(object):
 
@@ -78,6 +83,8 @@ class GapSequence(BaseSequence):
     get_gaps -------- Uses regular expressions to return each contiguous subsequence of 'N' characters.
     get_gap_coords -- Uses regular expressions to return the string indices of each
                       contiguous subsequence of 'N' characters.
+    get_gap_intervals -- Returns the start, end and length of every gap in one pass.
+                         Vectorized with NumPy if it is installed.
     """
 
     def count_Ns(self):
@@ -91,3 +98,34 @@ class GapSequence(BaseSequence):
     def get_gap_coords(self):
         """ Find all of the gap string indices for this sequence. """
         return re.finditer(r'N+', self.sequence)
+
+    def get_gap_intervals(self, use_numpy=None):
+        """
+        Find the start, end (exclusive) and length of every gap for this sequence.
+        With NumPy, the sequence is viewed as a uint8 array and gap boundaries are found
+        with one vectorized comparison, without making a string for each gap.
+        :param use_numpy: Use NumPy. By default, NumPy is used if it can be imported.
+        :return: starts, ends, lengths. NumPy arrays if NumPy is used, lists otherwise.
+        """
+        if use_numpy is None:
+            use_numpy = np is not None
+        if not use_numpy:
+            coords = [m.span() for m in re.finditer(r'N+', self.sequence)]
+            starts = [start for start, end in coords]
+            ends = [end for start, end in coords]
+            return starts, ends, [end - start for start, end in coords]
+
+        is_n = np.frombuffer(self.sequence, dtype=np.uint8) == ord('N')
+        if not is_n.size:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        # Positions where a run of Ns starts or ends.
+        boundaries = np.flatnonzero(is_n[1:] != is_n[:-1]) + 1
+        if is_n[0]:
+            boundaries = np.concatenate(([0], boundaries))
+        if is_n[-1]:
+            boundaries = np.concatenate((boundaries, [is_n.size]))
+        boundaries = boundaries.astype(np.int64)
+        starts = boundaries[::2]
+        ends = boundaries[1::2]
+        return starts, ends, ends - starts
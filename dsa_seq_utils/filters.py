@@ -0,0 +1,266 @@
+from __future__ import division
+import os
+from itertools import islice
+from multiprocessing import Pool
+
+from dsa_seq_utils.SeqReader import SeqReader
+from dsa_seq_utils.SeqReader import get_compression
+from dsa_seq_utils.stats import RunningStats
+
+"""
+Streaming record filters shared by the command line utilities.
+Records are fasta (header, sequence) or fastq [header, sequence, '+', quality] records.
+e.g.
+from filters import RecordFilter, LengthFilter, GCFilter, filter_file
+record_filter = RecordFilter([LengthFilter(1000, 50000), GCFilter(0.3, 0.6)])
+with open('filtered.fasta', 'w') as out_file:
+    length_stats = filter_file('reads.fasta', out_file, record_filter, processes=4)
+"""
+
+# Target size of the byte ranges that worker processes read from uncompressed files.
+range_size = 8 * 1024 * 1024
+
+
+class LengthFilter(object):
+    """ Keep records with lower < sequence length < upper. Either bound may be None. """
+
+    def __init__(self, lower=None, upper=None):
+        self.lower = lower
+        self.upper = upper
+
+    def __call__(self, record):
+        return self.accepts_length(len(record[1]))
+
+    def accepts_length(self, length):
+        if self.lower is not None and length <= self.lower:
+            return False
+        if self.upper is not None and length >= self.upper:
+            return False
+        return True
+
+
+class GCFilter(object):
+    """
+    Keep records with lower <= GC fraction <= upper. Either bound may be None.
+    The GC fraction is computed over A, C, G and T bases, ignoring case.
+    Records without any of those bases are removed.
+    """
+
+    def __init__(self, lower=None, upper=None):
+        self.lower = lower
+        self.upper = upper
+
+    def __call__(self, record):
+        sequence = record[1]
+        without_gc = sequence.translate(None, 'GCgc')
+        gc = len(sequence) - len(without_gc)
+        acgt = gc + len(without_gc) - len(without_gc.translate(None, 'ATat'))
+        if not acgt:
+            return False
+        gc_fraction = gc / acgt
+        if self.lower is not None and gc_fraction < self.lower:
+            return False
+        if self.upper is not None and gc_fraction > self.upper:
+            return False
+        return True
+
+
+class NFilter(object):
+    """ Keep records where the fraction of N bases is at most max_fraction. """
+
+    def __init__(self, max_fraction):
+        self.max_fraction = max_fraction
+
+    def __call__(self, record):
+        sequence = record[1]
+        if not sequence:
+            return True
+        return (sequence.count('N') + sequence.count('n')) / len(sequence) <= self.max_fraction
+
+
+class ExactSubseqFilter(object):
+    """ Keep records containing a subsequence exactly, with the same case. """
+
+    def __init__(self, subseq):
+        self.subseq = subseq
+
+    def __call__(self, record):
+        return self.subseq in record[1]
+
+
+class SubseqFilter(object):
+    """ Keep records containing at least one hit of a MismatchSearcher. Case is ignored. """
+
+    def __init__(self, searcher):
+        """
+        :param searcher: MismatchSearcher made from the probes to search for.
+        """
+        self.searcher = searcher
+
+    def __call__(self, record):
+        for hit in self.searcher.search(record[1].upper()):
+            return True
+        return False
+
+
+def format_record(record):
+    """ Format a fasta or fastq record as it appeared in the input file. """
+    return '\n'.join(record) + '\n'
+
+
+class HitFormatter(object):
+    """
+    Format every hit of a MismatchSearcher in a record, ignoring case, as tab separated lines:
+    <sequence header> <start> <end> <probe name> <strand> <mismatches>
+    Records without hits are not written.
+    """
+
+    def __init__(self, searcher):
+        """
+        :param searcher: MismatchSearcher made from the probes to search for.
+        """
+        self.searcher = searcher
+
+    def __call__(self, record):
+        name = record[0][1:]
+        return ''.join(
+            '%s\t%r\t%r\t%s\t%s\t%r\n' % (name, start, end, probe_name, strand, mismatches)
+            for start, end, (probe_name, strand), mismatches in self.searcher.search(record[1].upper())
+        )
+
+
+class RecordFilter(object):
+    """
+    A set of predicates that every written record must pass, and a formatter which
+    turns each passing record into output text. Predicates are evaluated in order,
+    and evaluation stops at the first predicate a record fails.
+    """
+
+    def __init__(self, predicates=(), formatter=format_record):
+        """
+        :param predicates: Callables taking a record and returning True if it should be kept.
+        :param formatter: Callable taking a record and returning the text to write.
+                          Records formatted as an empty string are not counted as written.
+        """
+        self.predicates = list(predicates)
+        self.formatter = formatter
+
+    def filter_records(self, records):
+        """
+        :param records: Iterable of fasta or fastq records.
+        :return: tuple of the output text and a list of the lengths of the written records.
+        """
+        predicates = self.predicates
+        formatter = self.formatter
+        output = []
+        lengths = []
+        for record in records:
+            for predicate in predicates:
+                if not predicate(record):
+                    break
+            else:
+                text = formatter(record)
+                if text:
+                    output.append(text)
+                    lengths.append(len(record[1]))
+        return ''.join(output), lengths
+
+
+# The RecordFilter of a worker process. Set once per worker rather than sent with every task.
+_worker_filter = None
+
+
+def _set_worker_filter(record_filter):
+    global _worker_filter
+    _worker_filter = record_filter
+
+
+def _filter_range(task):
+    """
+    Filter the records in one byte range of an uncompressed file. Run in worker processes.
+    :param task: tuple of file name, start offset, end offset and fastq format flag.
+    """
+    in_file, start, end, fastq = task
+    x = SeqReader(in_file)
+    records = x.parse_fastq(start, end) if fastq else x.parse_fasta(start, end)
+    return _worker_filter.filter_records(records)
+
+
+def _filter_batch(records):
+    """ Filter a list of records. Run in worker processes. """
+    return _worker_filter.filter_records(records)
+
+
+def _batches(records, batch_size):
+    """ Generator yielding lists of batch_size records. """
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def filter_file(in_file, out_file, record_filter, fastq=False, processes=1, batch_size=10000):
+    """
+    Write the records of a fasta or fastq file that pass a RecordFilter, in input order.
+    Output is written once per batch of records rather than once per record.
+
+    If a fasta file has a .dsa.fai index and every predicate is a LengthFilter, lengths are
+    taken from the index and only the sequences which pass are read.
+
+    With more than one process, uncompressed files are split into byte ranges on record
+    boundaries, and each worker process reads and filters its own ranges. Compressed files
+    are read by this process and sent to the workers in batches.
+
+    :param in_file: Fasta or fastq file, optionally compressed.
+    :param out_file: File object to write to, e.g. sys.stdout.
+    :param record_filter: RecordFilter.
+    :param fastq: True if the file is in fastq format.
+    :param processes: Number of worker processes.
+    :param batch_size: Number of records read before output is written.
+    :return: RunningStats of the lengths of the written records.
+    """
+    length_stats = RunningStats()
+    x = SeqReader(in_file)
+
+    predicates = record_filter.predicates
+    only_lengths = predicates and all(isinstance(i, LengthFilter) for i in predicates)
+    if only_lengths and not fastq and x.get_index(build=False) is not None:
+        headers = [
+            header for header, length in x.scan_lengths() if all(i.accepts_length(length) for i in predicates)
+        ]
+        for batch in _batches(x.get_multiple_seqs(headers), batch_size):
+            text, lengths = record_filter.filter_records(batch)
+            out_file.write(text)
+            length_stats.update(lengths)
+        return length_stats
+
+    if processes > 1:
+        pool = Pool(processes, initializer=_set_worker_filter, initargs=(record_filter,))
+        try:
+            if get_compression(in_file) is None:
+                n_ranges = max(processes * 4, os.path.getsize(in_file) // range_size)
+                tasks = [(in_file, start, end, fastq) for start, end in x.split_offsets(n_ranges, fastq=fastq)]
+                results = pool.imap(_filter_range, tasks)
+            else:
+                records = x.parse_fastq() if fastq else x.parse_fasta()
+                results = pool.imap(_filter_batch, _batches(records, batch_size))
+            for text, lengths in results:
+                out_file.write(text)
+                length_stats.update(lengths)
+        except:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+        return length_stats
+
+    records = x.parse_fastq() if fastq else x.parse_fasta()
+    for batch in _batches(records, batch_size):
+        text, lengths = record_filter.filter_records(batch)
+        out_file.write(text)
+        length_stats.update(lengths)
+    return length_stats
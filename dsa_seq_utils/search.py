@@ -0,0 +1,534 @@
+__author__ = 'malonge'
+from itertools import product
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from dsa_seq_utils.utilities import reverse_complement
+from dsa_seq_utils.utilities import kmer_code_array
+
+"""
+Multi pattern nucleotide search. Exact, IUPAC and mismatch (substitution only) searches are
+supported. Hits with insertions or deletions are not found.
+e.g.
+from search import build_probe_searcher
+searcher = build_probe_searcher([('probe1', 'ACGTTGCA'), ('probe2', 'GGNCCA')], both_strands=True, iupac=True)
+for header, sequence in SeqReader('reads.fasta').parse_fasta():
+    for start, end, (probe_name, strand) in searcher.search(sequence):
+        # Do stuff with each hit.
+"""
+
+# Nucleotides matched by each IUPAC code.
+iupac_codes = {
+    'A': 'A',
+    'C': 'C',
+    'G': 'G',
+    'T': 'T',
+    'U': 'T',
+    'R': 'AG',
+    'Y': 'CT',
+    'S': 'CG',
+    'W': 'AT',
+    'K': 'GT',
+    'M': 'AC',
+    'B': 'CGT',
+    'D': 'AGT',
+    'H': 'ACT',
+    'V': 'ACG',
+    'N': 'ACGT'
+}
+
+
+def expand_iupac(pattern, max_expansions=100000):
+    """
+    List every nucleotide sequence matched by a pattern with IUPAC ambiguity codes.
+    :param pattern: Nucleotide sequence, optionally with ambiguity codes.
+    :param max_expansions: Raise a ValueError rather than make more sequences than this.
+    :return: List of sequences.
+    """
+    pattern = pattern.upper()
+    try:
+        choices = [iupac_codes[nuc] for nuc in pattern]
+    except KeyError as e:
+        raise ValueError('%r is not an IUPAC nucleotide code (pattern %s).' % (e.args[0], pattern))
+    n_expansions = 1
+    for nucleotides in choices:
+        n_expansions *= len(nucleotides)
+    if n_expansions > max_expansions:
+        raise ValueError('%s matches %r sequences, more than the limit of %r.' % (pattern, n_expansions, max_expansions))
+    return [''.join(nucleotides) for nucleotides in product(*choices)]
+
+
+class AhoCorasick(object):
+    """
+    Aho-Corasick automaton for finding every occurrence of many patterns in one pass over a text.
+    Add all patterns, then call build before searching.
+
+    x = AhoCorasick()
+    x.add('ACGT', 'probe1')
+    x.add('CGTA', 'probe2')
+    x.build()
+    list(x.search('AACGTAA'))
+    # [(1, 5, 'probe1'), (2, 6, 'probe2')]
+    """
+
+    def __init__(self):
+        # One dictionary of transitions per state. State 0 is the root.
+        self._transitions = [{}]
+        # (pattern length, value) tuples of the patterns ending at each state.
+        self._outputs = [[]]
+        self._n_patterns = 0
+        self._built = False
+
+    def __len__(self):
+        return self._n_patterns
+
+    def add(self, pattern, value=None):
+        """
+        Add a pattern.
+        :param pattern: Pattern string. Must not be empty.
+        :param value: Value reported with each occurrence of the pattern. Defaults to the pattern.
+        """
+        if self._built:
+            raise RuntimeError('Patterns can not be added after build.')
+        if not pattern:
+            raise ValueError('Patterns can not be empty.')
+        if value is None:
+            value = pattern
+
+        state = 0
+        for char in pattern:
+            next_state = self._transitions[state].get(char)
+            if next_state is None:
+                next_state = len(self._transitions)
+                self._transitions[state][char] = next_state
+                self._transitions.append({})
+                self._outputs.append([])
+            state = next_state
+        self._outputs[state].append((len(pattern), value))
+        self._n_patterns += 1
+
+    def build(self):
+        """
+        Compute failure links and turn the pattern tree into a complete automaton,
+        so that searching follows exactly one transition per character.
+        """
+        transitions = self._transitions
+        outputs = self._outputs
+        alphabet = set()
+        for state_transitions in transitions:
+            alphabet.update(state_transitions)
+
+        # Breadth first, so the failure state of each state is complete before it is needed.
+        fail = [0] * len(transitions)
+        queue = deque()
+        for child in transitions[0].values():
+            queue.append(child)
+        while queue:
+            state = queue.popleft()
+            fail_transitions = transitions[fail[state]]
+            for char in alphabet:
+                child = transitions[state].get(char)
+                if child is None:
+                    fail_state = fail_transitions.get(char)
+                    if fail_state:
+                        transitions[state][char] = fail_state
+                else:
+                    fail[child] = fail_transitions.get(char, 0)
+                    outputs[child].extend(outputs[fail[child]])
+                    queue.append(child)
+        # Bound get methods save an attribute lookup per character when searching.
+        self._transition_getters = [state_transitions.get for state_transitions in transitions]
+        self._built = True
+
+    def search(self, text):
+        """
+        Generator yielding every occurrence of every pattern in text, ordered by end coordinate.
+        Characters that are in no pattern return the automaton to the root state.
+        :param text: String to search.
+        :return: Generator of (start, end, value) tuples. Coordinates are 0-based, end exclusive.
+        """
+        if not self._built:
+            raise RuntimeError('build must be called before searching.')
+        transition_getters = self._transition_getters
+        outputs = self._outputs
+        state = 0
+        for i, char in enumerate(text):
+            state = transition_getters[state](char, 0)
+            if outputs[state]:
+                end = i + 1
+                for length, value in outputs[state]:
+                    yield end - length, end, value
+
+
+def build_probe_searcher(probes, both_strands=False, iupac=False):
+    """
+    Make an AhoCorasick automaton that finds a set of probes or primers.
+    Probes are upper cased, so search upper cased sequences.
+    :param probes: Iterable of (probe name, probe sequence) tuples.
+    :param both_strands: Also find the reverse complement of each probe.
+    :param iupac: Expand IUPAC ambiguity codes in the probes into every sequence they match.
+    :return: AhoCorasick automaton with (probe name, strand) values. strand is '+' or '-'.
+    """
+    searcher = AhoCorasick()
+    for name, probe in probes:
+        probe = probe.upper()
+        sequences = expand_iupac(probe) if iupac else [probe]
+        for sequence in sequences:
+            searcher.add(sequence, (name, '+'))
+            if both_strands:
+                searcher.add(reverse_complement(sequence), (name, '-'))
+    searcher.build()
+    return searcher
+
+
+class MismatchSearcher(object):
+    """
+    Find probes or primers with up to max_mismatches mismatches (substitutions, i.e. Hamming distance).
+    Insertions and deletions are not supported, so a hit is always as long as its probe.
+    Each probe is split into max_mismatches + 1 pieces. By the pigeonhole principle, any
+    occurrence with at most max_mismatches mismatches contains at least one piece exactly,
+    so the pieces are found with an AhoCorasick automaton, and only those candidate
+    positions are compared base by base.
+
+    x = MismatchSearcher([('barcode1', 'ACGTACGTAC')], max_mismatches=1, both_strands=True)
+    for start, end, (probe_name, strand), mismatches in x.search(sequence.upper()):
+        # Do stuff with each hit.
+    """
+
+    def __init__(self, probes, max_mismatches=0, both_strands=False, iupac=False):
+        """
+        :param probes: Iterable of (probe name, probe sequence) tuples.
+        :param max_mismatches: Maximum number of mismatches in a hit.
+        :param both_strands: Also find the reverse complement of each probe.
+        :param iupac: Let IUPAC ambiguity codes in the probes match any of their nucleotides.
+        """
+        if max_mismatches < 0:
+            raise ValueError('The maximum number of mismatches can not be negative.')
+        self.max_mismatches = max_mismatches
+        if not max_mismatches:
+            # Exact hits need no checking base by base, so the whole probes are searched for.
+            self._exact = build_probe_searcher(probes, both_strands, iupac)
+            return
+        self._exact = None
+        # (pattern, (probe name, strand)) tuples.
+        self._patterns = []
+        # For each pattern, the set of matching text characters of each base.
+        self._allowed = []
+        self._seeds = AhoCorasick()
+
+        for name, probe in probes:
+            probe = probe.upper()
+            strands = [(probe, '+')]
+            if both_strands:
+                strands.append((reverse_complement(probe), '-'))
+            for pattern, strand in strands:
+                if len(pattern) <= max_mismatches:
+                    raise ValueError('Probe %s must be longer than the maximum number of mismatches.' % name)
+                pattern_index = len(self._patterns)
+                self._patterns.append((pattern, (name, strand)))
+                if iupac:
+                    self._allowed.append([frozenset(expand_iupac(nuc)) for nuc in pattern])
+                else:
+                    self._allowed.append([frozenset(nuc) for nuc in pattern])
+                for offset, piece in self._pieces(pattern, max_mismatches + 1):
+                    for seed in (expand_iupac(piece) if iupac else [piece]):
+                        self._seeds.add(seed, (pattern_index, offset))
+        self._seeds.build()
+        self._max_length = max(len(pattern) for pattern, value in self._patterns) if self._patterns else 0
+
+    @staticmethod
+    def _pieces(pattern, n_pieces):
+        """
+        Split a pattern into n_pieces pieces of nearly equal length.
+        :return: List of (offset in pattern, piece) tuples.
+        """
+        pieces = []
+        for i in xrange(n_pieces):
+            start = i * len(pattern) // n_pieces
+            end = (i + 1) * len(pattern) // n_pieces
+            pieces.append((start, pattern[start:end]))
+        return pieces
+
+    def _count_mismatches(self, text, start, allowed):
+        """ Number of mismatches between text at start and a pattern, or None if above the maximum. """
+        mismatches = 0
+        max_mismatches = self.max_mismatches
+        for i, nucleotides in enumerate(allowed):
+            if text[start + i] not in nucleotides:
+                mismatches += 1
+                if mismatches > max_mismatches:
+                    return None
+        return mismatches
+
+    def search(self, text):
+        """
+        Generator yielding every hit of every probe in text. A position with hits from several
+        pieces of the same probe is only reported once.
+        :param text: Upper case string to search.
+        :return: Generator of (start, end, (probe name, strand), mismatches) tuples.
+                 Coordinates are 0-based, end exclusive.
+        """
+        if self._exact is not None:
+            for start, end, value in self._exact.search(text):
+                yield start, end, value, 0
+            return
+
+        patterns = self._patterns
+        allowed = self._allowed
+        max_length = self._max_length
+        text_length = len(text)
+        # (pattern index, start) of the positions already checked, and the same in the order they were checked.
+        checked = set()
+        checked_order = deque()
+        for seed_start, seed_end, (pattern_index, offset) in self._seeds.search(text):
+            # Seeds come in order of their end, and every seed of a hit at start ends by start + max_length,
+            # so positions starting before seed_end - max_length can not come up again.
+            while checked_order and checked_order[0][1] < seed_end - max_length:
+                checked.remove(checked_order.popleft())
+            start = seed_start - offset
+            pattern, value = patterns[pattern_index]
+            end = start + len(pattern)
+            if start < 0 or end > text_length or (pattern_index, start) in checked:
+                continue
+            checked.add((pattern_index, start))
+            checked_order.append((pattern_index, start))
+            mismatches = self._count_mismatches(text, start, allowed[pattern_index])
+            if mismatches is not None:
+                yield start, end, value, mismatches
+
+
+class SuffixArray(object):
+    """
+    Suffix array of a text: the start coordinates of all suffixes of the text, in sorted order.
+    Every occurrence of a pattern is found by binary search in O(len(pattern) * log(len(text)))
+    time, independent of how many sequences the text holds. Requires NumPy.
+    The array can be saved and loaded again (memory mapped) to avoid rebuilding it.
+
+    Building the array needs about 30-40 bytes of memory per character of text at its peak, e.g. 30-40 GB
+    for a 1 Gb assembly. Repetitive text, such as long runs of N, takes several times longer to
+    build than unique sequence, because its suffixes only differ after many characters.
+
+    x = SuffixArray('ACGTACGA')
+    x.find_all('ACG')
+    # [0, 4]
+    """
+
+    # Longest text for which a rank and the next rank are packed into one int64 sort key.
+    # Longer texts are sorted on the two ranks with np.lexsort, which is slower.
+    max_packed_length = 3037000498
+
+    def __init__(self, text, suffix_array=None):
+        """
+        :param text: String to index.
+        :param suffix_array: Previously built suffix array of text, e.g. from load.
+                             By default, the suffix array is built.
+        """
+        if np is None:
+            raise ImportError('SuffixArray requires NumPy.')
+        self.text = text
+        if suffix_array is None:
+            suffix_array = self._build(text)
+        elif len(suffix_array) != len(text):
+            raise ValueError('The suffix array does not belong to this text.')
+        self.suffix_array = suffix_array
+
+    def __len__(self):
+        return len(self.text)
+
+    @classmethod
+    def _build(cls, text):
+        """
+        Sort the suffixes by prefix doubling. Suffixes are first sorted by their first 8 characters.
+        When the suffixes are sorted by their first k characters, sorting each group of suffixes
+        with the same first k characters by the rank of the suffix k characters later sorts them
+        by their first 2k characters. Only groups of more than one suffix are sorted again, so
+        rounds get cheaper as suffixes are resolved. The text must not contain null characters.
+        """
+        n = len(text)
+        index_type = np.int32 if n < 2 ** 31 else np.int64
+        if not n:
+            return np.zeros(0, dtype=index_type)
+
+        # The first 8 characters of each suffix packed into one integer, padded with null characters.
+        padded = np.zeros(n + 7, dtype=np.uint8)
+        padded[:n] = np.frombuffer(text, dtype=np.uint8)
+        key = np.zeros(n, dtype=np.uint64)
+        for i in xrange(8):
+            key <<= np.uint64(8)
+            key |= padded[i:i + n]
+        del padded
+
+        suffix_array = np.argsort(key).astype(index_type)
+        # Sorting in place gives key[suffix_array] without another copy of the keys.
+        key.sort()
+        # Positions in the suffix array of the suffixes whose group is not yet sorted.
+        unsorted = np.arange(n, dtype=index_type)
+        suffixes = suffix_array
+        # The rank of a suffix is the position in the suffix array of the first suffix of its group.
+        rank = np.zeros(n, dtype=index_type)
+        k = 8
+        while True:
+            group_start = np.ones(len(key), dtype=bool)
+            group_start[1:] = key[1:] != key[:-1]
+            rank[suffixes] = np.maximum.accumulate(np.where(group_start, unsorted, 0))
+            # Free the keys and suffixes of this round before the next round's are made.
+            del key, suffixes
+            single = group_start.copy()
+            single[:-1] &= group_start[1:]
+            unsorted = unsorted[~single]
+            if not len(unsorted) or k >= n:
+                return suffix_array
+
+            # Sort each group by the rank of the suffix k characters later.
+            # Suffixes shorter than k characters have a next rank of 0, so they sort first.
+            suffixes = suffix_array[unsorted]
+            next_rank = np.zeros(len(suffixes), dtype=np.int64)
+            has_next = suffixes < n - k
+            next_rank[has_next] = rank[suffixes[has_next] + k] + 1
+            if n <= cls.max_packed_length:
+                key = rank[suffixes].astype(np.int64)
+                key *= n + 1
+                key += next_rank
+                del next_rank
+                order = np.argsort(key)
+                key.sort()
+            else:
+                # rank * (n + 1) would overflow an int64. Sort on both ranks, then number the new groups.
+                current_rank = rank[suffixes]
+                order = np.lexsort((next_rank, current_rank))
+                current_rank = current_rank[order]
+                next_rank = next_rank[order]
+                changed = np.ones(len(order), dtype=bool)
+                changed[1:] = (current_rank[1:] != current_rank[:-1]) | (next_rank[1:] != next_rank[:-1])
+                key = np.cumsum(changed)
+            suffixes = suffixes[order]
+            suffix_array[unsorted] = suffixes
+            del order, has_next
+            k *= 2
+
+    def save(self, file_name):
+        """ Save the suffix array, without the text, in NumPy .npy format. """
+        with open(file_name, 'wb') as out_file:
+            np.save(out_file, self.suffix_array)
+
+    @classmethod
+    def load(cls, file_name, text):
+        """
+        Load a suffix array saved by save. The array is memory mapped rather than read into memory.
+        Raises a ValueError if the array does not fit the text.
+        :param text: The text the suffix array was built from.
+        """
+        suffix_array = np.load(file_name, mmap_mode='r')
+        if len(suffix_array) != len(text):
+            raise ValueError('The suffix array in %s does not belong to this text.' % file_name)
+        # Spot check that suffixes are in order, which catches arrays made from other texts of the same length.
+        for i in np.linspace(0, max(len(text) - 2, 0), min(len(text) - 1, 1000)).astype(np.int64):
+            start, next_start = suffix_array[i], suffix_array[i + 1]
+            if text[start:start + 100] > text[next_start:next_start + 100]:
+                raise ValueError('The suffix array in %s does not belong to this text.' % file_name)
+        return cls(text, suffix_array)
+
+    def _bounds(self, pattern):
+        """ Range of the suffix array of suffixes starting with pattern. """
+        text = self.text
+        suffix_array = self.suffix_array
+        m = len(pattern)
+        low, high = 0, len(suffix_array)
+        while low < high:
+            middle = (low + high) // 2
+            start = suffix_array[middle]
+            if text[start:start + m] < pattern:
+                low = middle + 1
+            else:
+                high = middle
+        first = low
+        high = len(suffix_array)
+        while low < high:
+            middle = (low + high) // 2
+            start = suffix_array[middle]
+            if text[start:start + m] <= pattern:
+                low = middle + 1
+            else:
+                high = middle
+        return first, low
+
+    def count(self, pattern):
+        """ Number of occurrences of pattern in the text. """
+        first, last = self._bounds(pattern)
+        return last - first
+
+    def find_all(self, pattern):
+        """ Sorted list of the start coordinates of every occurrence of pattern. """
+        first, last = self._bounds(pattern)
+        return sorted(int(i) for i in self.suffix_array[first:last])
+
+    def find(self, pattern):
+        """ Lowest start coordinate of pattern in the text, or -1 if it is absent, like str.find. """
+        first, last = self._bounds(pattern)
+        if first == last:
+            return -1
+        return int(self.suffix_array[first:last].min())
+
+
+class KmerIndex(object):
+    """
+    Sampled k-mer index of a long text, for seed and extend searches. The k-mers starting at every
+    step-th position of the text are stored sorted by their 2-bit code, so all k-mers of a query
+    are looked up at once with one vectorized binary search per k-mer. Any exact occurrence of a query
+    of at least k + step - 1 bases contains a sampled k-mer. k-mers with ambiguous bases are not
+    indexed. Requires NumPy.
+
+    x = KmerIndex(genome, k=20, step=8)
+    query_offsets, positions = x.seed_hits(contig)
+    # Each hit suggests an occurrence of the contig starting at positions - query_offsets.
+    """
+
+    def __init__(self, text, k=20, step=8, chunk_size=16777216):
+        """
+        :param text: String to index.
+        :param k: k-mer length, up to 32.
+        :param step: Distance between the starts of sampled k-mers.
+        :param chunk_size: Number of positions whose k-mers are computed at once. Bounds memory use.
+        """
+        if np is None:
+            raise ImportError('KmerIndex requires NumPy.')
+        self.k = k
+        self.step = step
+        index_type = np.int32 if len(text) < 2 ** 31 else np.int64
+        codes = []
+        positions = []
+        for chunk_start in xrange(0, max(len(text) - k + 1, 0), chunk_size):
+            chunk_starts, chunk_codes = kmer_code_array(text[chunk_start:chunk_start + chunk_size + k - 1], k)
+            chunk_starts += chunk_start
+            sampled = chunk_starts % step == 0
+            codes.append(chunk_codes[sampled])
+            positions.append(chunk_starts[sampled].astype(index_type))
+        codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.uint64)
+        positions = np.concatenate(positions) if positions else np.zeros(0, dtype=index_type)
+        # A stable sort keeps the positions of each k-mer in increasing order.
+        order = np.argsort(codes, kind='mergesort')
+        self.codes = codes[order]
+        self.positions = positions[order]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def seed_hits(self, query, max_hits=1000):
+        """
+        Look up every k-mer of a query.
+        :param query: Nucleotide sequence.
+        :param max_hits: k-mers found more often than this, e.g. in repeats, are skipped.
+        :return: tuple of NumPy arrays: query offset and text position of each hit.
+        """
+        query_starts, query_codes = kmer_code_array(query, self.k)
+        first = np.searchsorted(self.codes, query_codes, 'left')
+        counts = np.searchsorted(self.codes, query_codes, 'right') - first
+        found = (counts > 0) & (counts <= max_hits)
+        first, counts = first[found], counts[found]
+        # The index of each hit in self.positions: its k-mer's first index plus its rank among that k-mer's hits.
+        hit_number = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(query_starts[found], counts), self.positions[np.repeat(first, counts) + hit_number]
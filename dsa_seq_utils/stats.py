@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 from __future__ import division
 import math
+from collections import defaultdict
 
 
 def calculate_mean(data_list):
@@ -17,19 +18,11 @@ def calculate_mean(data_list):
 def calculate_pop_sd(data_list):
     """
     Calculate the population standard deviation of a list of numbers.
-    :param data_list: List of numbers.
+    :param data_list: List, or any iterable, of numbers.
     :return: The population standard deviation of the list of numbers.
     """
-    # Make sure there are enough data points.
-    sample_number = len(data_list)
-    if sample_number < 2:
-        raise ValueError('At least 2 data points needed to calculate population standard deviation.')
-
-    # Get the mean.
-    mean = calculate_mean(data_list)
-    # Calculate the variance.
-    variance = sum(math.pow(j - mean, 2) for j in data_list)/sample_number
-    return math.sqrt(variance)
+    # One pass over the data, so that generators can be used too.
+    return RunningStats(data_list, max_bins=0).pop_sd()
 
 
 def calculate_median(data_list):
@@ -48,4 +41,344 @@ def calculate_median(data_list):
         y = sorted_data[(dist_length//2)-1]
         return (x+y)/2
     else:
-        return sorted_data[dist_length//2]
\ No newline at end of file
+        return sorted_data[dist_length//2]
+
+
+def percentile_from_counts(items, p):
+    """
+    Calculate a percentile from value counts, interpolating linearly between
+    the two closest ranks when needed. This matches calculate_median for p = 50.
+    :param items: List of (value, count) tuples sorted by value.
+    :param p: Percentile between 0 and 100.
+    """
+    if not 0 <= p <= 100:
+        raise ValueError('Percentiles must be between 0 and 100.')
+    total_count = sum(count for value, count in items)
+    if not total_count:
+        raise ValueError('At least 1 value is needed to calculate a percentile.')
+    position = (total_count - 1) * p / 100
+    lower_rank = int(math.floor(position))
+    seen = 0
+    lower = None
+    for value, count in items:
+        seen += count
+        if lower is None and seen > lower_rank:
+            lower = value
+            if position == lower_rank:
+                return lower
+        if lower is not None and seen > lower_rank + 1:
+            return lower + (value - lower) * (position - lower_rank)
+
+
+class LengthHistogram(object):
+    """
+    Compact accumulator of sequence lengths. Rather than a list of every length,
+    the number of sequences of each length is stored, so memory use depends on the
+    number of distinct lengths, not the number of sequences. Histograms made from
+    different files or worker processes can be merged.
+
+    x = LengthHistogram()
+    for header, sequence in SeqReader('reads.fasta').parse_fasta():
+        x.add(len(sequence))
+    x.mean(), x.median(), x.n50()
+    """
+
+    def __init__(self, lengths=()):
+        """
+        :param lengths: Optional iterable of lengths to start with.
+        """
+        self.counts = defaultdict(int)
+        self.update(lengths)
+
+    def add(self, length, count=1):
+        """ Add count sequences of the given length. """
+        self.counts[length] += count
+
+    def update(self, lengths):
+        """ Add every length from an iterable of lengths. """
+        counts = self.counts
+        for length in lengths:
+            counts[length] += 1
+
+    def merge(self, other):
+        """
+        Add all counts of another LengthHistogram to this one.
+        :return: This histogram.
+        """
+        counts = self.counts
+        for length, count in other.counts.iteritems():
+            counts[length] += count
+        return self
+
+    def items(self):
+        """ List of (length, number of sequences) tuples, sorted by length. """
+        return sorted((length, count) for length, count in self.counts.iteritems() if count)
+
+    def iter_lengths(self):
+        """ Generator yielding every length, in ascending order. """
+        for length, count in self.items():
+            for i in xrange(count):
+                yield length
+
+    def total_count(self):
+        """ The number of sequences. """
+        return sum(self.counts.itervalues())
+
+    def total_length(self):
+        """ The sum of all lengths. """
+        return sum(length * count for length, count in self.counts.iteritems())
+
+    def min(self):
+        """ The shortest length. """
+        return self._value_at_rank(0)
+
+    def max(self):
+        """ The longest length. """
+        return self._value_at_rank(self.total_count() - 1)
+
+    def mean(self):
+        """ Mean of all lengths. """
+        total_count = self.total_count()
+        if not total_count:
+            raise ValueError('At least 1 value is needed to calculate mean.')
+        return self.total_length()/total_count
+
+    def pop_sd(self):
+        """ Population standard deviation of all lengths. """
+        total_count = self.total_count()
+        if total_count < 2:
+            raise ValueError('At least 2 data points needed to calculate population standard deviation.')
+        mean = self.total_length()/total_count
+        variance = sum(count * math.pow(length - mean, 2) for length, count in self.counts.iteritems())/total_count
+        return math.sqrt(variance)
+
+    def _value_at_rank(self, rank):
+        """ The length at position rank (0-based) of the sorted lengths. """
+        if rank < 0:
+            raise ValueError('At least 1 value is needed.')
+        seen = 0
+        for length, count in self.items():
+            seen += count
+            if seen > rank:
+                return length
+        raise ValueError('Rank %r is out of range.' % rank)
+
+    def percentile(self, p):
+        """
+        Calculate a percentile of all lengths, interpolating linearly between
+        the two closest ranks when needed.
+        :param p: Percentile between 0 and 100.
+        """
+        return percentile_from_counts(self.items(), p)
+
+    def median(self):
+        """ Median of all lengths. For an even number of lengths, the mean of the middle two. """
+        if self.total_count() < 2:
+            raise ValueError('At least 2 values are needed to calculate the median.')
+        return self.percentile(50)
+
+    def nx(self, x, genome_size=None):
+        """
+        Calculate an Nx statistic, i.e. the length such that sequences of at least this
+        length make up x percent of the total length (or of genome_size, for NGx).
+        :param x: Percentage between 0 and 100. e.g. 50 for the N50.
+        :param genome_size: If given, calculate NGx with respect to this genome size.
+        :return: The Nx length, or None if the sequences never reach x percent of genome_size.
+        """
+        target = (genome_size if genome_size is not None else self.total_length()) * x / 100
+        covered = 0
+        for length, count in reversed(self.items()):
+            covered += length * count
+            if covered >= target:
+                return length
+        return None
+
+    def n50(self):
+        """ The N50 of all lengths. """
+        return self.nx(50)
+
+    def ng50(self, genome_size):
+        """ The NG50 of all lengths given a genome size, or None if it is never reached. """
+        return self.nx(50, genome_size)
+
+
+class RunningStats(object):
+    """
+    Single pass summary statistics of a stream of numbers. Values can come from
+    any iterable, including generators, and are never stored in a list.
+    Mean and variance are updated with Welford's algorithm. Quantiles are exact
+    while at most max_bins distinct values have been seen. Beyond that, values are
+    merged into about max_bins weighted centroids, which bounds memory use and
+    makes quantiles approximate. RunningStats objects can be merged.
+
+    x = RunningStats(len(gap) for gap in gaps)
+    x.mean(), x.pop_sd(), x.max(), x.median()
+    """
+
+    def __init__(self, values=(), max_bins=10000):
+        """
+        :param values: Optional iterable of values to start with.
+        :param max_bins: Number of distinct values kept for quantiles. 0 disables quantiles.
+        """
+        self.max_bins = max_bins
+        self.exact = True
+        self._count = 0
+        # Exact sum of the values. Integer values give an integer total.
+        self._sum = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._min = None
+        self._max = None
+        # Value (or centroid) -> count.
+        self._bins = defaultdict(int)
+        self.update(values)
+
+    def add(self, value):
+        """ Add one value. """
+        self.update((value,))
+
+    def update(self, values):
+        """ Add every value from an iterable of values. """
+        count, mean, m2, total = self._count, self._mean, self._m2, self._sum
+        minimum, maximum = self._min, self._max
+        bins = self._bins
+        track_bins = self.max_bins > 0
+        # Allow up to twice as many bins between compressions, so that they are rare.
+        bin_limit = self.max_bins if self.exact else 2 * self.max_bins
+        for value in values:
+            count += 1
+            total += value
+            delta = value - mean
+            mean += delta / count
+            m2 += delta * (value - mean)
+            if minimum is None or value < minimum:
+                minimum = value
+            if maximum is None or value > maximum:
+                maximum = value
+            if track_bins:
+                bins[value] += 1
+                if len(bins) > bin_limit:
+                    self._compress()
+                    bins = self._bins
+                    bin_limit = 2 * self.max_bins
+        self._count, self._mean, self._m2, self._sum = count, mean, m2, total
+        self._min, self._max = minimum, maximum
+
+    def merge(self, other):
+        """
+        Combine the values of another RunningStats object with this one.
+        :return: This object.
+        """
+        if not other._count:
+            return self
+        total = self._count + other._count
+        delta = other._mean - self._mean
+        self._m2 += other._m2 + delta * delta * self._count * other._count / total
+        self._mean += delta * other._count / total
+        self._count = total
+        self._sum += other._sum
+        if self._min is None or other._min < self._min:
+            self._min = other._min
+        if self._max is None or other._max > self._max:
+            self._max = other._max
+        self.exact = self.exact and other.exact
+        for value, count in other._bins.iteritems():
+            self._bins[value] += count
+        if self.max_bins > 0 and len(self._bins) > (self.max_bins if self.exact else 2 * self.max_bins):
+            self._compress()
+        return self
+
+    def _compress(self):
+        """ Merge bins into max_bins centroids of roughly equal counts. """
+        self.exact = False
+        items = sorted(self._bins.iteritems())
+        total = sum(count for value, count in items)
+        target = total / self.max_bins
+        bins = defaultdict(int)
+        weighted_sum = 0
+        group_count = 0
+        for value, count in items:
+            weighted_sum += value * count
+            group_count += count
+            if group_count >= target:
+                bins[weighted_sum / group_count] += group_count
+                weighted_sum = group_count = 0
+        if group_count:
+            bins[weighted_sum / group_count] += group_count
+        self._bins = bins
+
+    def total_count(self):
+        """ The number of values. """
+        return self._count
+
+    def total(self):
+        """ The sum of all values. """
+        return self._sum
+
+    def min(self):
+        """ The smallest value. """
+        if not self._count:
+            raise ValueError('At least 1 value is needed.')
+        return self._min
+
+    def max(self):
+        """ The largest value. """
+        if not self._count:
+            raise ValueError('At least 1 value is needed.')
+        return self._max
+
+    def mean(self):
+        """ Mean of all values. """
+        if not self._count:
+            raise ValueError('At least 1 value is needed to calculate mean.')
+        return self._mean
+
+    def pop_variance(self):
+        """ Population variance of all values. """
+        if self._count < 2:
+            raise ValueError('At least 2 data points needed to calculate population variance.')
+        return self._m2 / self._count
+
+    def pop_sd(self):
+        """ Population standard deviation of all values. """
+        if self._count < 2:
+            raise ValueError('At least 2 data points needed to calculate population standard deviation.')
+        return math.sqrt(self._m2 / self._count)
+
+    def percentile(self, p):
+        """
+        Calculate a percentile of all values. Exact if no more than max_bins distinct
+        values were seen, otherwise interpolated between centroids.
+        :param p: Percentile between 0 and 100.
+        """
+        if self.max_bins <= 0:
+            raise ValueError('Quantiles are not tracked when max_bins is 0.')
+        items = sorted(self._bins.iteritems())
+        if self.exact:
+            return percentile_from_counts(items, p)
+
+        if not 0 <= p <= 100:
+            raise ValueError('Percentiles must be between 0 and 100.')
+        # Place each centroid at the middle rank of the values it stands for.
+        rank = (self._count - 1) * p / 100
+        previous_rank, previous_value = 0, self._min
+        seen = 0
+        for value, count in items:
+            middle_rank = seen + (count - 1) / 2
+            if rank <= middle_rank:
+                if middle_rank == previous_rank:
+                    return value
+                fraction = (rank - previous_rank) / (middle_rank - previous_rank)
+                return previous_value + (value - previous_value) * fraction
+            previous_rank, previous_value = middle_rank, value
+            seen += count
+        last_rank = self._count - 1
+        if last_rank == previous_rank:
+            return self._max
+        return previous_value + (self._max - previous_value) * (rank - previous_rank) / (last_rank - previous_rank)
+
+    def median(self):
+        """ Median of all values. Exact if no more than max_bins distinct values were seen. """
+        if self._count < 2:
+            raise ValueError('At least 2 values are needed to calculate the median.')
+        return self.percentile(50)
@@ -1,7 +1,14 @@
 #!/usr/bin/env python
 import time
+import string
+import hashlib
 import subprocess
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 complements = {
     'A': 'T',
     'T': 'A',
@@ -21,6 +28,28 @@ complements = {
     'H': 'D'
 }
 
+fasta_extensions = ('.fasta', '.fa', '.fan', '.fas')
+fastq_extensions = ('.fastq', '.fq')
+compression_extensions = ('.gz', '.bgz', '.bz2', '.xz')
+
+# Translation table for reverse_complement. Lowercase (soft masked) bases keep their case.
+_nucleotides = ''.join(complements.keys())
+_complement_table = string.maketrans(
+    _nucleotides + _nucleotides.lower(),
+    ''.join(complements[n] for n in _nucleotides) + ''.join(complements[n] for n in _nucleotides).lower()
+)
+_nucleotides += _nucleotides.lower()
+
+# 2-bit codes used by kmer_codes. Any other character breaks k-mers.
+kmer_bases = 'ACGT'
+_base_codes = dict((nuc, code) for code, nuc in enumerate(kmer_bases))
+_base_codes.update((nuc.lower(), code) for nuc, code in _base_codes.items())
+_base_codes['U'] = _base_codes['u'] = _base_codes['T']
+if np is not None:
+    _base_code_lookup = np.full(256, 4, dtype=np.uint8)
+    for _nuc, _code in _base_codes.iteritems():
+        _base_code_lookup[ord(_nuc)] = _code
+
 
 def run(cmnd):
     """ Run command and report status. """
@@ -69,6 +98,33 @@ def help_desired(args_list):
     return False
 
 
+def has_extension(file_name, extensions):
+    """
+    Detects if a file name ends with one of the given extensions, optionally
+    followed by a compression extension. e.g. reads.fq.gz has a fastq extension.
+    :param file_name: File name.
+    :param extensions: Tuple of extensions, such as fasta_extensions.
+    """
+    for compression_extension in compression_extensions:
+        if file_name.endswith(compression_extension):
+            file_name = file_name[:-len(compression_extension)]
+            break
+    return file_name.endswith(extensions)
+
+
+def file_md5(file_name, block_size=4194304):
+    """
+    Hexadecimal MD5 checksum of a file, read in blocks.
+    :param file_name: File name.
+    :param block_size: Number of bytes read at a time.
+    """
+    md5 = hashlib.md5()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), ''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
 def kmerize(seq, k):
     """
     :param seq:
@@ -78,6 +134,123 @@ def kmerize(seq, k):
         yield seq[i:i+k]
 
 
+def kmer_codes(seq, k, canonical=False):
+    """
+    Generator yielding every k-mer of a sequence as an integer, with 2 bits per base
+    (A=0, C=1, G=2, T=3, first base in the most significant bits). Codes are updated
+    with a rolling shift rather than by slicing the sequence. Case is ignored, and k-mers
+    containing N or any other ambiguity code are skipped.
+    :param seq: Nucleotide sequence.
+    :param k: k-mer length.
+    :param canonical: Yield the smaller of the k-mer code and its reverse complement code.
+    :return: Generator of (start coordinate, k-mer code) tuples.
+    """
+    if k < 1:
+        raise ValueError('k must be at least 1.')
+    mask = (1 << 2*k) - 1
+    rc_shift = 2*(k - 1)
+    base_codes = _base_codes
+    code = rc_code = 0
+    valid_bases = 0
+    for i, nuc in enumerate(seq):
+        base_code = base_codes.get(nuc)
+        if base_code is None:
+            # Start over after an ambiguous base.
+            valid_bases = 0
+            code = rc_code = 0
+            continue
+        code = ((code << 2) | base_code) & mask
+        rc_code = (rc_code >> 2) | ((3 - base_code) << rc_shift)
+        valid_bases += 1
+        if valid_bases >= k:
+            if canonical and rc_code < code:
+                yield i - k + 1, rc_code
+            else:
+                yield i - k + 1, code
+
+
+def kmer_code_array(seq, k, canonical=False):
+    """
+    NumPy version of kmer_codes, for k up to 32. Computes the codes of all k-mers of
+    the sequence at once. Requires NumPy.
+    e.g. the distinct canonical 21-mers of a sequence: numpy.unique(kmer_code_array(seq, 21, True)[1])
+    :param seq: Nucleotide sequence.
+    :param k: k-mer length.
+    :param canonical: Use the smaller of the k-mer code and its reverse complement code.
+    :return: tuple of NumPy arrays: k-mer start coordinates (int64) and k-mer codes (uint64).
+    """
+    if np is None:
+        raise ImportError('kmer_code_array requires NumPy.')
+    if not 1 <= k <= 32:
+        raise ValueError('k must be between 1 and 32 to fit k-mer codes in 64 bits.')
+    n_kmers = len(seq) - k + 1
+    if n_kmers < 1:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint64)
+
+    base_codes = _base_code_lookup[np.frombuffer(seq, dtype=np.uint8)]
+
+    # A k-mer is valid if its window has no ambiguous bases.
+    ambiguous_so_far = np.concatenate(([0], np.cumsum(base_codes > 3)))
+    valid = ambiguous_so_far[k:] == ambiguous_so_far[:-k]
+
+    base_codes = (base_codes & 3).astype(np.uint64)
+    codes = _window_codes(base_codes, k)
+    if canonical:
+        rc_codes = _window_codes(np.uint64(3) - base_codes, k, reverse=True)
+        np.minimum(codes, rc_codes, out=codes)
+
+    return np.flatnonzero(valid), codes[valid]
+
+
+def _window_codes(base_codes, k, reverse=False):
+    """
+    Codes of every window of k bases, built by joining windows of doubling length,
+    so only about 2*log2(k) passes are made over the array instead of k.
+    :param base_codes: uint64 NumPy array of 2-bit base codes.
+    :param k: Window length.
+    :param reverse: Put the last base of each window in the most significant bits,
+                    i.e. reverse complement codes when given complemented bases.
+    :return: uint64 NumPy array with the code of the window starting at each position.
+    """
+    codes = None
+    codes_length = 0
+    # Codes of windows of length block_length, which doubles every iteration.
+    block_codes = base_codes
+    block_length = 1
+    while True:
+        if k & block_length:
+            if codes is None:
+                codes = block_codes
+            else:
+                # Join each window with the block that follows it.
+                n = len(block_codes) - codes_length
+                following = block_codes[codes_length:codes_length + n]
+                if reverse:
+                    codes = (following << np.uint64(2*codes_length)) | codes[:n]
+                else:
+                    codes = (codes[:n] << np.uint64(2*block_length)) | following
+            codes_length += block_length
+        if 2*block_length > k:
+            return codes
+        n = len(block_codes) - block_length
+        if reverse:
+            block_codes = (block_codes[block_length:] << np.uint64(2*block_length)) | block_codes[:n]
+        else:
+            block_codes = (block_codes[:n] << np.uint64(2*block_length)) | block_codes[block_length:]
+        block_length *= 2
+
+
+def decode_kmer(code, k):
+    """
+    Convert a 2-bit k-mer code from kmer_codes back into its sequence.
+    :param code: k-mer code.
+    :param k: k-mer length.
+    :return: k-mer string.
+    """
+    code = int(code)
+    return ''.join(kmer_bases[(code >> 2*(k - i - 1)) & 3] for i in xrange(k))
+
+
 def find_coverage_cutoff(read_lengths, genome_size, desired_coverage):
     """
     Given a desired coverage and a list of read lengths, return
@@ -105,13 +278,41 @@ def find_coverage_cutoff(read_lengths, genome_size, desired_coverage):
     raise RuntimeError(error)
 
 
+def _raise_invalid_nucleotide(seq):
+    """ Raise a KeyError for the first character of seq that has no complement. """
+    for nuc in seq:
+        if nuc not in complements and nuc.upper() not in complements:
+            raise KeyError(nuc)
+
+
 def reverse_complement(seq):
     """
-    Reverse complement a nucleotide sequence.
+    Reverse complement a nucleotide sequence. Lowercase (soft masked) bases
+    are complemented to lowercase bases.
     :param seq: Sequence to be reverse complemented
     :return: A reverse complemented sequence
     """
-    rc_seq = ''
-    for nuc in seq[::-1]:
-        rc_seq += complements[nuc]
-    return rc_seq
\ No newline at end of file
+    if isinstance(seq, unicode):
+        seq = str(seq)
+    if seq.translate(None, _nucleotides):
+        _raise_invalid_nucleotide(seq)
+    return seq.translate(_complement_table)[::-1]
+
+
+def reverse_complement_array(seq):
+    """
+    Reverse complement a nucleotide sequence held in a NumPy uint8 array
+    (one ASCII code per base), e.g. numpy.frombuffer(sequence, dtype=numpy.uint8).
+    Lowercase (soft masked) bases are complemented to lowercase bases.
+    Requires NumPy. For str sequences, reverse_complement is faster.
+    :param seq: NumPy uint8 array of ASCII codes.
+    :return: A new NumPy uint8 array with the reverse complement.
+    """
+    if np is None:
+        raise ImportError('reverse_complement_array requires NumPy.')
+    lookup = np.frombuffer(_complement_table, dtype=np.uint8)
+    valid = np.zeros(256, dtype=bool)
+    valid[np.frombuffer(_nucleotides, dtype=np.uint8)] = True
+    if not valid[seq].all():
+        _raise_invalid_nucleotide(seq.tostring())
+    return lookup[seq[::-1]]
\ No newline at end of file
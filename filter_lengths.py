@@ -9,7 +9,8 @@ ___________
 Description:
 
 This command line utility takes a sequence file and output sequences
-of a length that falls between upper and lower limits.
+of a length that falls between upper and lower limits. Sequences can also be
+filtered by GC content and by their fraction of N bases, in the same pass.
 
 _____
 Usage:
@@ -28,10 +29,23 @@ python filter_lengths.py [options] -f <sequence file> -c <length cutoff>
     -h, --help   -------------- Display help message.
     -a           -------------- Input file is in fasta format.
     -q           -------------- Input file is in fastq format.
+    --stats      -------------- Write summary statistics of the lengths of the output sequences
+                                to standard error.
+    --min-gc     -------------- Minimum GC fraction (0-1) of output sequences.
+    --max-gc     -------------- Maximum GC fraction (0-1) of output sequences.
+    --max-n      -------------- Maximum fraction (0-1) of N bases in output sequences.
+    --threads    -------------- Number of processes used to filter sequences. Default 1.
+    -o           -------------- Write output to this file instead of standard output. File names ending
+                                in .gz or .bgz are gzip or bgzip compressed.
 """
 import sys
 
-from dsa_seq_utils.SeqReader import SeqReader
+from dsa_seq_utils.filters import RecordFilter
+from dsa_seq_utils.filters import LengthFilter
+from dsa_seq_utils.filters import GCFilter
+from dsa_seq_utils.filters import NFilter
+from dsa_seq_utils.filters import filter_file
+from dsa_seq_utils.SeqWriter import SeqWriter
 from dsa_seq_utils.utilities import get_flag
 from dsa_seq_utils.utilities import help_desired
 
@@ -55,8 +69,27 @@ try:
 except ValueError():
     raise ValueError('Upper length cutoff must be an integer.')
 
+# Get the optional GC and N fraction cutoffs.
+fraction_cutoffs = {}
+for flag in ('--min-gc', '--max-gc', '--max-n'):
+    if flag in sys.argv:
+        try:
+            fraction_cutoffs[flag] = float(get_flag(sys.argv, flag, usage))
+        except ValueError:
+            raise ValueError('%s must be followed by a fraction between 0 and 1.' % flag)
+
+# Get the number of processes to use.
+threads = 1
+if '--threads' in sys.argv:
+    try:
+        threads = int(get_flag(sys.argv, '--threads', usage))
+    except ValueError:
+        raise ValueError('The number of threads must be an integer.')
+    if threads < 1:
+        raise ValueError('The number of threads must be at least 1.')
+
 # Check if the input file is in fasta or fastq format.
-if '-a' in sys.argv and '- q' not in sys.argv:
+if '-a' in sys.argv and '-q' not in sys.argv:
     using_fastas = True
 elif '-q' in sys.argv and '-a' not in sys.argv:
     using_fastas = False
@@ -69,17 +102,31 @@ else:
         "A '-a' or '-q' flag must be specified. This specifies fasta or fastq file format."
     )
 
-# Iterate through the sequence file and write sequence to standard output
-# if the sequence is longer than the specified cutoff length.
-x = SeqReader(input_file)
-if using_fastas:
-    for header, sequence in x.parse_fasta():
-        if upper_cutoff > len(sequence) > lower_cutoff:
-            print header
-            print sequence
-else:
-    for read in x.parse_fastq():
-        if upper_cutoff > len(read[1]) > lower_cutoff:
-            for i in read:
-                print i
+# Write each sequence that passes all filters to standard output, in one pass over the file.
+predicates = [LengthFilter(lower_cutoff, upper_cutoff)]
+if '--min-gc' in fraction_cutoffs or '--max-gc' in fraction_cutoffs:
+    predicates.append(GCFilter(fraction_cutoffs.get('--min-gc'), fraction_cutoffs.get('--max-gc')))
+if '--max-n' in fraction_cutoffs:
+    predicates.append(NFilter(fraction_cutoffs['--max-n']))
+out_file = get_flag(sys.argv, '-o', usage) if '-o' in sys.argv else sys.stdout
+with SeqWriter(out_file) as writer:
+    length_stats = filter_file(
+        input_file,
+        writer,
+        RecordFilter(predicates),
+        fastq=not using_fastas,
+        processes=threads
+    )
+
+# Report summary stats on standard error, so that they do not mix with the sequences.
+if '--stats' in sys.argv:
+    sys.stderr.write('Sequences written: %d\n' % length_stats.total_count())
+    if length_stats.total_count():
+        sys.stderr.write('Total length: %d\n' % length_stats.total())
+        sys.stderr.write('Minimum length: %d\n' % length_stats.min())
+        sys.stderr.write('Maximum length: %d\n' % length_stats.max())
+        sys.stderr.write('Mean length: %f\n' % length_stats.mean())
+    if length_stats.total_count() > 1:
+        sys.stderr.write('Length standard deviation: %f\n' % length_stats.pop_sd())
+        sys.stderr.write('Median length: %f\n' % length_stats.median())
 
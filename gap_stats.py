@@ -5,29 +5,37 @@ import os
 import sys
 import ntpath
 import collections
+from itertools import repeat
+from multiprocessing import Pool
 
 from dsa_seq_utils.Sequence import GapSequence
 from dsa_seq_utils.SeqReader import SeqReader
-from dsa_seq_utils.stats import calculate_median
+from dsa_seq_utils.stats import LengthHistogram
 from dsa_seq_utils.utilities import log
 from dsa_seq_utils.utilities import help_desired
+from dsa_seq_utils.utilities import get_flag
+from dsa_seq_utils.utilities import has_extension
+from dsa_seq_utils.utilities import fasta_extensions
 
 
 if __name__ == "__main__":
     usage = """
 ___________
 Description:
-Command line utility for analyzing gaps in a fasta file. One file can be analyzed, or up to 3 can be compared.
+Command line utility for analyzing gaps in a fasta file. One file can be analyzed, or any number can be compared.
 Use this tool to compare a genome assembly pre and post gap filling with tools such as PBJelly.
+Fasta files may be gzip, bgzip, bzip2 or xz compressed.
 _____
 Usage:
-python gap_stats.py [options] <sequence1.fasta> <sequence2.fasta> <sequence3.fasta>
+python gap_stats.py [options] <sequence1.fasta> [<sequence2.fasta> ...]
     OPTIONS:
     -m        Save a matplotlib gap length histogram in current working directory.
               * Requires matplotlib to be installed *
     -p        Write a plain text file of all gap lengths in current working directory for
               use as input into other statistical analysis software.
     -b        Make a gap bed file for each input fasta.
+    -t        Number of processes used to analyze the sequences of each fasta in parallel. Default 1.
+              Uncompressed fasta files are indexed (.dsa.fai) so that each process reads its own sequences.
     -h        Print help message.
     """
 
@@ -52,30 +60,28 @@ python gap_stats.py [options] <sequence1.fasta> <sequence2.fasta> <sequence3.fas
         if help_desired(flags):
             sys.exit(usage)
 
-        # Retrieve fasta files. At least one, up to 3 is needed.
-        fastas = [
-            i for i in args_list if
-            i.endswith('.fasta') or
-            i.endswith('.fa') or
-            i.endswith('.fan') or
-            i.endswith('.fas')
-        ]
+        # Retrieve fasta files. At least one is needed.
+        fastas = [i for i in args_list[1:] if has_extension(i, fasta_extensions)]
 
         # Make sure that at least one fasta file was found.
         if not fastas:
             print usage
             raise ValueError('No fasta files found.')
 
-        # Make sure that no more than 3 fasta files have been selected.
-        if len(fastas) > 3:
-            print usage
-            raise ValueError(
-                'A maximum of 3 fasta files can be compared at once. You entered %r fasta files.' % len(fastas)
-            )
+        # Get the number of processes to use.
+        threads = 1
+        for flag in ('-t', '-T'):
+            if flag in args_list:
+                try:
+                    threads = int(get_flag(args_list, flag, usage))
+                except ValueError:
+                    print usage
+                    raise ValueError('The number of processes given with -t must be an integer.')
 
         return {
             'flags': flags,
-            'fastas': fastas
+            'fastas': fastas,
+            'threads': threads
         }
 
     def write_gap_stats(info):
@@ -90,8 +96,8 @@ python gap_stats.py [options] <sequence1.fasta> <sequence2.fasta> <sequence3.fas
             all_percent_N = [str(100*(info[i]['total_N']/info[i]['total_nucleotides'])) for i in info.keys()]
             all_total_gaps = [str(info[i]['total_gaps']) for i in info.keys()]
             all_total_gaps_over_100 = [str(info[i]['total_gaps_over_100']) for i in info.keys()]
-            all_longest_gap = [str(max(info[i]['all_gap_lengths'])) for i in info.keys()]
-            all_medians = [str(calculate_median(info[i]['all_gap_lengths'])) for i in info.keys()]
+            all_longest_gap = [str(info[i]['gap_lengths'].max()) for i in info.keys()]
+            all_medians = [str(info[i]['gap_lengths'].median()) for i in info.keys()]
             files = [ntpath.basename(f) for f in info.keys()]
 
             # Write rows out to csv file.
@@ -102,38 +108,36 @@ python gap_stats.py [options] <sequence1.fasta> <sequence2.fasta> <sequence3.fas
             for i in range(len(files)):
                 out_file.write('%s\t%s\t%s\t%s\t%s\t%s\n' % (files[i], all_percent_N[i], all_total_gaps[i], all_total_gaps_over_100[i], all_longest_gap[i], all_medians[i]))
 
-    def write_bed_file(bed_dict, out_file_name):
+    def get_bed_file_name(fasta):
         """
-        From a dictionary storing bed file info, write output file in bed format.
-        :param bed_dict: Dict where keys = fasta headers, and values = coordinates of each gap in that sequence.
-        :param out_file_name: Name for output bed file.
+        :param fasta: Input fasta file name.
+        :return: Path of the gap bed file for this fasta in the current working directory.
         """
-        with open(os.getcwd() + '/' + ntpath.basename(out_file_name), 'w') as out_file:
-            for header in bed_dict.keys():
-                for coordinates in bed_dict[header]:
-                    out_file.write(
-                        '%s\t%r\t%r\n' %(header[1:], coordinates[0], coordinates[1])
-                    )
+        return os.getcwd() + '/' + ntpath.basename(fasta[:fasta.rfind('.')] + '.gaps.bed')
 
-    def write_hist_img_file(lengths, labels):
+    def write_hist_img_file(histograms, labels):
         """
         Save a matplotlib length histogram image to current working directory.
-        :param lengths: List of Lists of all gap lengths for each fasta.
+        :param histograms: List of LengthHistogram objects of the gap lengths of each fasta.
         :param labels: Labels to be used in the histogram image file.
         """
         import matplotlib.pyplot as plt
 
+        # Plot each distinct length once, weighted by its count.
+        all_items = [h.items() for h in histograms]
+        lengths = [[length for length, count in items] for items in all_items]
+        weights = [[count for length, count in items] for items in all_items]
+
         # Find the max and min values for plotting.
-        max_length = max(max(i) for i in lengths)
-        min_length = min(min(i) for i in lengths)
-        bin_size = int(0.025*max_length)
+        max_length = max(max(i) for i in lengths if i)
+        min_length = min(min(i) for i in lengths if i)
+        bin_size = max(int(0.025*max_length), 1)
 
         # Make histogram
-        colors = ['r', 'g', 'b']
         plt.hist(
             lengths,
+            weights=weights,
             bins=range(min_length, max_length+bin_size, bin_size),
-            color=colors[:len(lengths)],
             label=[ntpath.basename(l) for l in labels]
         )
         plt.legend()
@@ -142,101 +146,147 @@ python gap_stats.py [options] <sequence1.fasta> <sequence2.fasta> <sequence3.fas
         plt.ylabel('Frequency')
         plt.savefig(os.getcwd() + '/gap_stats_hist.pdf')
 
-    def write_hist_text_file(lengths, labels):
+    def write_hist_text_file(histograms, labels):
         """
         Write a plain text file to current working directory.
         1 ordered column of all histogram lengths.
         This is for input into statistical analysis software such as R.
-        :param lengths: List of Lists of all gap lengths for each fasta.
+        :param histograms: List of LengthHistogram objects of the gap lengths of each fasta.
         :param labels: Labels to be used in the histogram image file.
         """
-        for lengths_list, label in zip(lengths, labels):
+        for histogram, label in zip(histograms, labels):
             hist_file_name = label[:label.rfind('.')] + '.all_lengths.txt'
             with open(os.getcwd() + '/' + ntpath.basename(hist_file_name), 'w') as out_file:
                 out_file.write(ntpath.basename(label) + '\n')
-                for length in sorted(lengths_list):
-                    out_file.write(str(length) + '\n')
+                for length, count in histogram.items():
+                    out_file.writelines(repeat(str(length) + '\n', count))
+
+    # SeqReader of the fasta being analyzed, with its index already loaded. It is set before the worker
+    # processes are started, so they share the index made by the parent instead of each making their own.
+    worker_readers = {}
+
+    def get_sequence_gap_info(header, sequence):
+        """
+        Find the gaps of one sequence.
+        :param header: Fasta header of the sequence.
+        :param sequence: The sequence.
+        :return: tuple of header, number of Ns, sequence length, gap start coordinates, gap end coordinates
+                 and gap lengths.
+        """
+        gap_sequence = GapSequence(sequence)
+        # One pass over the sequence finds every gap (vectorized if NumPy is installed).
+        gap_starts, gap_ends, gap_lengths = gap_sequence.get_gap_intervals()
+        if not isinstance(gap_lengths, list):
+            gap_starts, gap_ends, gap_lengths = gap_starts.tolist(), gap_ends.tolist(), gap_lengths.tolist()
+        return header, gap_sequence.count_Ns(), len(sequence), gap_starts, gap_ends, gap_lengths
 
-    def get_gap_info(in_file):
+    def get_indexed_sequence_gap_info(task):
+        """
+        Find the gaps of one sequence of an indexed fasta file. Run in worker processes,
+        each of which reads its own sequences from the fasta file.
+        :param task: tuple of fasta file name and fasta header.
+        :return: See get_sequence_gap_info.
+        """
+        in_file, query_header = task
+        header, sequence = worker_readers[in_file].get_seq(query_header)
+        return get_sequence_gap_info(header, sequence)
+
+    def get_gap_info(in_file, bed_file_name=None, threads=1):
         """
         Given a fasta file, find out some information regarding its global gap content.
         :param in_file: Fasta or multi-fasta with sequences for gap analysis.
-        :return: dictionary with total_N, total_nucleotides, total_gaps and all_gap_lengths
+        :param bed_file_name: If given, gap coordinates are written to this bed file as each sequence is analyzed.
+        :param threads: Number of worker processes. If more than one and the fasta file can be indexed,
+                        sequences are analyzed in parallel. Results are still combined in file order.
+        :return: dictionary with total_N, total_nucleotides, total_gaps, total_gaps_over_100 and
+                 gap_lengths, a LengthHistogram of all gap lengths.
         """
         # Initialize values to be computed.
         total_N = 0
         total_nucleotides = 0
         total_gaps = 0
         total_gaps_over_100 = 0
-        all_gap_lengths = []
+        gap_lengths_histogram = LengthHistogram()
 
-        # Use a dictionary to store bed coordinates.
-        # key = fasta header
-        # Value = list of tuples corresponding to genomic coordinates.
-        bed_gaps = collections.OrderedDict()
+        bed_file = open(bed_file_name, 'w') if bed_file_name is not None else None
 
-        # Iterate through each sequence in the fasta,
-        # and get gap info from each.
+        # Get gap info from each sequence in the fasta, in order.
         sequences = SeqReader(in_file)
-        for header, sequence in sequences.parse_fasta():
-            gap_sequence = GapSequence(sequence)
-
-            # Get total number of 'N' characters for this sequence.
-            total_N += gap_sequence.count_Ns()
-            # Get total number of nucleotides for this sequence.
-            total_nucleotides += len(sequence)
-            for gap in gap_sequence.get_gaps():
+        # The index is built or read once here, even if the .dsa.fai file can not be written.
+        index = sequences.get_index() if threads > 1 else None
+        pool = None
+        if index is not None:
+            worker_readers[in_file] = sequences
+            pool = Pool(threads)
+            tasks = [(in_file, '>' + name) for name in index]
+            all_sequence_info = pool.imap(get_indexed_sequence_gap_info, tasks)
+        else:
+            all_sequence_info = (get_sequence_gap_info(h, s) for h, s in sequences.parse_fasta())
+
+        try:
+            for header, n_count, length, gap_starts, gap_ends, gap_lengths in all_sequence_info:
+                # Get total number of 'N' characters for this sequence.
+                total_N += n_count
+                # Get total number of nucleotides for this sequence.
+                total_nucleotides += length
                 # Increment total number of gaps
-                total_gaps += 1
-                if len(gap) > 100:
-                    total_gaps_over_100 += 1
-                # Save this gap length to master list.
-                all_gap_lengths.append(len(gap))
+                total_gaps += len(gap_lengths)
+                total_gaps_over_100 += sum(1 for gap_length in gap_lengths if gap_length > 100)
+                gap_lengths_histogram.update(gap_lengths)
 
-            # Now fill in bed file data structure.
-            all_coordinates = [(m.start(0), m.end(0)) for m in gap_sequence.get_gap_coords()]
-            if all_coordinates:
-                bed_gaps[header] = all_coordinates
+                # Write the bed rows of this sequence right away.
+                if bed_file is not None:
+                    bed_file.writelines(
+                        '%s\t%r\t%r\n' % (header[1:], start, end) for start, end in zip(gap_starts, gap_ends)
+                    )
+        except:
+            if pool is not None:
+                pool.terminate()
+            raise
+        else:
+            if pool is not None:
+                pool.close()
+        finally:
+            if pool is not None:
+                pool.join()
+                del worker_readers[in_file]
+            if bed_file is not None:
+                bed_file.close()
 
         return {
             'total_N': total_N,
             'total_nucleotides': total_nucleotides,
             'total_gaps': total_gaps,
             'total_gaps_over_100': total_gaps_over_100,
-            'all_gap_lengths': all_gap_lengths,
-            'bed_gaps': bed_gaps
+            'gap_lengths': gap_lengths_histogram
         }
 
     # Parse the command line arguments.
     arg_dict = parse_args(sys.argv)
 
-    # Get gap info for each fasta.
+    # Get gap info for each fasta. Bed files are written while the sequences are analyzed.
+    write_bed = '-B' in arg_dict['flags']
+    if write_bed:
+        log(' ---- Bed file(s) will be written to the current working directory.')
     all_files_info = collections.OrderedDict()
     for fasta in arg_dict['fastas']:
         log(' ---- Analyzing gaps for %s' % fasta)
-        all_files_info[fasta] = get_gap_info(fasta)
+        bed_file_name = get_bed_file_name(fasta) if write_bed else None
+        all_files_info[fasta] = get_gap_info(fasta, bed_file_name=bed_file_name, threads=arg_dict['threads'])
 
     # Write csv file with basic gap stats.
     write_gap_stats(all_files_info)
 
-    # Check if bed file is desired.
-    # Save to current working directory if so.
-    if '-B' in arg_dict['flags']:
-        log(' ---- Writing bed file(s).')
-        for f in all_files_info.keys():
-            file_name = f[:f.rfind('.')] + '.gaps.bed'
-            write_bed_file(all_files_info[f]['bed_gaps'], file_name)
-
     # Check if histogram is desired.
     # Save to current working directory if so.
     if '-M' in arg_dict['flags']:
         log(' ---- Writing histogram image file.')
-        all_lengths = [all_files_info[i]['all_gap_lengths'] for i in all_files_info.keys()]
-        write_hist_img_file(all_lengths, all_files_info.keys())
+        all_histograms = [all_files_info[i]['gap_lengths'] for i in all_files_info.keys()]
+        write_hist_img_file(all_histograms, all_files_info.keys())
 
     # Make a plain text file for plugging into ones
     # favorite statistical analysis software.
     if '-P' in arg_dict['flags']:
         log(' ---- Writing histogram plain text file.')
-        all_lengths = [all_files_info[i]['all_gap_lengths'] for i in all_files_info.keys()]
-        write_hist_text_file(all_lengths, all_files_info.keys())
+        all_histograms = [all_files_info[i]['gap_lengths'] for i in all_files_info.keys()]
+        write_hist_text_file(all_histograms, all_files_info.keys())
@@ -13,7 +13,8 @@ Description:
 This command line utility selects one fasta sequence from a multi fasta file
 given a sequence header. The sequence from the desired header is
 written to standard output in fasta format. A file of many headers can be used to select many
-sequences.
+sequences. A .dsa.fai index is made next to the fasta file on first use, so that later
+lookups read only the requested sequence or range.
 _____
 Usage:
 
@@ -34,11 +35,16 @@ python get_fasta_sequence.py [options] -f <fasta> -s <header> -l <headers.txt>
                                 e.g. -r 100:25843 returns the subset of nucleotides specified in between these
                                 genomic coordinates (0-based). If multiple headers are specified with -l, this
                                 range will apply to all sequences.
+    -w           -------------- Wrap output sequences to this many bases per line. By default sequences
+                                are written on one line.
+    -o           -------------- Write sequences to this file instead of standard output. File names ending
+                                in .gz or .bgz are gzip or bgzip compressed.
 """
 
     import sys
 
     from dsa_seq_utils.SeqReader import SeqReader
+    from dsa_seq_utils.SeqWriter import SeqWriter
     from dsa_seq_utils.utilities import get_flag
     from dsa_seq_utils.utilities import help_desired
 
@@ -86,32 +92,51 @@ python get_fasta_sequence.py [options] -f <fasta> -s <header> -l <headers.txt>
             raise ValueError('Either -s or -l flags must be specified.')
 
 
-    x = SeqReader(fasta)
-    if not multi_headers:
-        query = x.get_seq(query_header)
-        if query is not None:
-            if not subseq:
-                print query[0]
-                print query[1]
+    # Get the output line width.
+    line_width = None
+    if '-w' in sys.argv:
+        try:
+            line_width = int(get_flag(sys.argv, '-w', usage))
+        except ValueError:
+            raise ValueError('The line width must be an integer.')
+
+    # Sequences are written through a buffered writer, to standard output by default.
+    out_file = get_flag(sys.argv, '-o', usage) if '-o' in sys.argv else sys.stdout
+    with SeqWriter(out_file, line_width=line_width) as writer:
+        x = SeqReader(fasta)
+        if not multi_headers:
+            index = x.get_index() if subseq else None
+            if index is None:
+                # Without an index the whole file is parsed, so take the sequence and its length from that one pass.
+                query = x.get_seq(query_header)
+                if query is not None:
+                    seq_length = len(query[1])
+                    if subseq:
+                        query = query[0], query[1][coords[0]:coords[1]]
             else:
-                # This check is more for header output, as this will not affect string slicing.
-                if coords[1] > len(query[1]):
-                    coords[1] = len(query[1])
-                print query[0] + " - " + str(coords[0]) + ":" + str(coords[1])
-                print query[1][coords[0]:coords[1]]
-        else:
-            print 'A sequence for header %s was not found' % query_header
-
-    else:
-        with open(header_list, 'r') as in_file:
-            all_headers = in_file.read().split('\n')
-        for query in x.get_multiple_seqs(all_headers):
-            if not subseq:
-                print query[0]
-                print query[1]
+                # Only the bytes covering the range are read from an indexed fasta.
+                query = x.get_subseq(query_header, coords[0], coords[1])
+                if query is not None:
+                    seq_length = index[query_header[1:]].length
+            if query is not None:
+                if not subseq:
+                    writer.write_fasta(query[0], query[1])
+                else:
+                    # This check is more for header output, as this will not affect string slicing.
+                    if coords[1] > seq_length:
+                        coords[1] = seq_length
+                    writer.write_fasta(query[0] + " - " + str(coords[0]) + ":" + str(coords[1]), query[1])
             else:
-                # This check is more for header output, as this will not affect string slicing.
-                if coords[1] > len(query[1]):
-                    coords[1] = len(query[1])
-                print query[0] + " - " + str(coords[0]) + ":" + str(coords[1])
-                print query[1][coords[0]:coords[1]]
\ No newline at end of file
+                print 'A sequence for header %s was not found' % query_header
+
+        else:
+            with open(header_list, 'r') as in_file:
+                all_headers = in_file.read().split('\n')
+            for query in x.get_multiple_seqs(all_headers):
+                if not subseq:
+                    writer.write_fasta(query[0], query[1])
+                else:
+                    # This check is more for header output, as this will not affect string slicing.
+                    if coords[1] > len(query[1]):
+                        coords[1] = len(query[1])
+                    writer.write_fasta(query[0] + " - " + str(coords[0]) + ":" + str(coords[1]), query[1][coords[0]:coords[1]])
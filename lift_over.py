@@ -1,12 +1,23 @@
 __author__ = 'malonge'
 
+import os
+import time
 import string
 import argparse
+from bisect import bisect_right
+from itertools import chain
+from itertools import islice
+from collections import Counter
 from collections import OrderedDict
+from multiprocessing import Pool
 
 from dsa_seq_utils.SeqReader import SeqReader
+from dsa_seq_utils.search import SuffixArray
+from dsa_seq_utils.search import KmerIndex
+from dsa_seq_utils.search import np
 from dsa_seq_utils.utilities import reverse_complement
 from dsa_seq_utils.utilities import log
+from dsa_seq_utils.utilities import file_md5
 
 
 def get_reverse_coords(start_coord, end_coord, seq_length):
@@ -42,6 +53,111 @@ def get_post_seqs(post_file):
     return seqs
 
 
+class PostAssembly(object):
+    """
+    The post assembly sequences joined into one text, separated by new lines, for searching.
+    With NumPy, a suffix array of the text is used, so a sequence is placed in time proportional
+    to its length rather than to the size of the post assembly. Without NumPy, the text is scanned.
+    Sequences which differ from the post assembly by a few substitutions are placed with find_similar.
+    """
+
+    def __init__(self, post_seqs, suffix_array_file=None):
+        """
+        :param post_seqs: dictionary made from get_post_seqs (header:sequence) for post file
+        :param suffix_array_file: Saved suffix array to reuse, or to save the suffix array to.
+                                  A file which does not match the post assembly is replaced.
+        """
+        self.headers = []
+        self.starts = []
+        position = 0
+        for header, sequence in post_seqs.iteritems():
+            self.headers.append(header)
+            self.starts.append(position)
+            position += len(sequence) + 1
+        self.text = '\n'.join(post_seqs.itervalues())
+        # Made on first use by find_similar.
+        self.kmer_index = None
+
+        self.suffix_array = None
+        if np is None:
+            return
+        if suffix_array_file is not None and os.path.exists(suffix_array_file):
+            try:
+                self.suffix_array = SuffixArray.load(suffix_array_file, self.text)
+            except (IOError, ValueError):
+                self.suffix_array = None
+        if self.suffix_array is None:
+            self.suffix_array = SuffixArray(self.text)
+            if suffix_array_file is not None:
+                try:
+                    self.suffix_array.save(suffix_array_file)
+                except (OSError, IOError):
+                    # e.g. a read only directory. The suffix array is still used from memory.
+                    pass
+
+    @classmethod
+    def from_fasta(cls, post_file):
+        """
+        Load the post assembly, reusing the suffix array saved next to it (post_file + '.sa.npy')
+        if it is at least as new as the post assembly.
+        """
+        suffix_array_file = post_file + '.sa.npy'
+        if os.path.exists(suffix_array_file) and os.path.getmtime(suffix_array_file) < os.path.getmtime(post_file):
+            os.remove(suffix_array_file)
+        return cls(get_post_seqs(post_file), suffix_array_file)
+
+    def find(self, query_seq):
+        """
+        Find the first occurrence of a sequence, in the order of the post assembly.
+        :return: tuple of the post assembly header and 0-based position, or None if the sequence was not found.
+        """
+        if self.suffix_array is None:
+            position = self.text.find(query_seq)
+        else:
+            position = self.suffix_array.find(query_seq)
+        if position == -1:
+            return None
+        i = bisect_right(self.starts, position) - 1
+        return self.headers[i], position - self.starts[i]
+
+    def find_similar(self, query_seq, max_mismatches, max_candidates=50):
+        """
+        Find the placement of a sequence with the fewest mismatches (substitutions), by seed and extend.
+        The k-mers of the query are looked up in a sampled k-mer index of the post assembly, and the
+        positions suggested by the most k-mers are compared to the query base by base. Requires NumPy.
+        :param query_seq: Sequence to place. Case is ignored.
+        :param max_mismatches: Maximum number of mismatches of a placement.
+        :param max_candidates: Maximum number of candidate positions compared to the query.
+        :return: tuple of the post assembly header, 0-based position and number of mismatches,
+                 or None if the sequence could not be placed.
+        """
+        if self.kmer_index is None:
+            self.kmer_index = KmerIndex(self.text)
+        query_seq = query_seq.upper()
+        query_offsets, positions = self.kmer_index.seed_hits(query_seq)
+        if not len(positions):
+            return None
+        candidates, votes = np.unique(positions - query_offsets, return_counts=True)
+        query = np.frombuffer(query_seq, dtype=np.uint8)
+
+        best = None
+        for candidate in candidates[np.argsort(-votes, kind='mergesort')[:max_candidates]]:
+            position = int(candidate)
+            i = bisect_right(self.starts, position) - 1
+            sequence_end = self.starts[i + 1] - 1 if i + 1 < len(self.starts) else len(self.text)
+            if position < 0 or position + len(query) > sequence_end:
+                continue
+            post = np.frombuffer(self.text, dtype=np.uint8, count=len(query), offset=position)
+            mismatches = int(np.count_nonzero(query != post))
+            if mismatches <= max_mismatches and (best is None or (mismatches, position) < best):
+                best = (mismatches, position)
+        if best is None:
+            return None
+        mismatches, position = best
+        i = bisect_right(self.starts, position) - 1
+        return self.headers[i], position - self.starts[i], mismatches
+
+
 def get_query_seqs(in_coords_file, delim='\t'):
     """
 
@@ -49,133 +165,613 @@ def get_query_seqs(in_coords_file, delim='\t'):
     :param delim:
     :return:
     """
-    headers = []
+    headers = set()
     with open(in_coords_file, 'r') as f:
         for line in f:
-            if not line.startswith('#'):
-                L1 = line.split(delim)
-                headers.append(L1[0])
+            if not is_comment(line):
+                headers.add(line.split(delim, 1)[0])
 
-    return set(headers)
+    return headers
 
 
-def place_pre_seqs(query_headers, pre_file, post_seqs, switch_sw=False):
+def place_sequence(query_header, query_seq, post_seqs, switch_sw=False, max_mismatches=0):
+    """
+    Place one pre assembly sequence in the post assembly, forward then reverse complemented.
+
+    :param query_header: Header of the sequence, for messages.
+    :param query_seq: Pre assembly sequence.
+    :param post_seqs: PostAssembly
+    :param max_mismatches: Place sequences that are not found exactly if they differ from the post
+                           assembly by up to this many substitutions. Requires NumPy.
+    :return: tuple of post header, 0-based position, reverse complemented flag and pre sequence length.
     """
+    reverse_complimented = False
+    placement = post_seqs.find(query_seq)
+
+    if placement is None:
+        # Reverse compliment and try again
+        reverse_complimented = True
+        query_seq_R = reverse_complement(query_seq)
+
+        # Switch S and W nucleotides if necessary
+        if switch_sw:
+            query_seq_R = switch_SW(query_seq_R)
+
+        placement = post_seqs.find(query_seq_R)
+
+    if placement is None and max_mismatches:
+        # Take the strand with fewer mismatches, preferring the forward strand.
+        best = None
+        for seq, is_reverse in ((query_seq, False), (query_seq_R, True)):
+            hit = post_seqs.find_similar(seq, max_mismatches)
+            if hit is not None and (best is None or hit[2] < best[0]):
+                best = (hit[2], is_reverse, hit[:2])
+        if best is not None:
+            mismatches, reverse_complimented, placement = best
+            log('Sequence %s was placed with %r mismatches.' % (query_header, mismatches))
+
+    if placement is None:
+        raise ValueError('Sequence %s was not found in the post assembly.' % query_header)
+
+    post_header, search_result = placement
+    return post_header, search_result, reverse_complimented, len(query_seq)
+
+
+# The PostAssembly and placement options of worker processes. These are set before the
+# worker processes are forked, so that the post assembly is inherited rather than pickled.
+_worker_post_seqs = None
+_worker_options = None
+
+
+def _place_in_worker(task):
+    """ Place one (query header, query sequence) tuple. Run in worker processes. """
+    query_header, query_seq = task
+    return query_header, place_sequence(query_header, query_seq, _worker_post_seqs, **_worker_options)
+
+
+def place_pre_seqs(query_headers, pre_file, post_seqs, switch_sw=False, max_mismatches=0, processes=1,
+                   log_interval=10):
+    """
+    The pre assembly is read once, through its .dsa.fai index if it can be indexed. With more than one
+    process, sequences are placed in forked worker processes which share the post assembly.
 
     :param query_seqs: set or list of query headers to be placed.
-    :param post_seqs: dictionary made from get_post_seqs (header:sequence) for post file
+    :param post_seqs: PostAssembly, or dictionary made from get_post_seqs (header:sequence) for post file
+    :param max_mismatches: Place sequences that are not found exactly if they differ from the post
+                           assembly by up to this many substitutions. Requires NumPy.
+    :param processes: Number of worker processes.
+    :param log_interval: Minimum number of seconds between progress messages.
     :return:
     """
-    placements = dict()
-    total = 0
+    global _worker_post_seqs, _worker_options
+    if not isinstance(post_seqs, PostAssembly):
+        post_seqs = PostAssembly(post_seqs)
+    if max_mismatches and post_seqs.kmer_index is None:
+        # Made once here, rather than once per worker process.
+        post_seqs.kmer_index = KmerIndex(post_seqs.text)
+
+    # get_multiple_seqs returns headers starting with '>' and skips empty ones. Placements are
+    # keyed by the headers as they were given.
+    given_headers = OrderedDict(
+        (header if header.startswith('>') else '>' + header, header) for header in query_headers if header
+    )
     x = SeqReader(pre_file)
-    for query_header in query_headers:
-        placed = False
-        reverse_complimented = False
+    x.get_index()
+    query_seqs = (
+        (given_headers[header], query_seq) for header, query_seq in x.get_multiple_seqs(given_headers)
+    )
+    options = {'switch_sw': switch_sw, 'max_mismatches': max_mismatches}
+
+    placements = dict()
+    start_time = last_log_time = time.time()
+    pool = None
+    if processes > 1:
+        _worker_post_seqs, _worker_options = post_seqs, options
+        pool = Pool(processes)
+        # Sequences are read here in batches rather than by the pool, so that errors reading them,
+        # e.g. a missing header, are raised here.
+        batches = iter(lambda: list(islice(query_seqs, 1024)), [])
+        results = chain.from_iterable(
+            pool.imap_unordered(_place_in_worker, batch, chunksize=16) for batch in batches
+        )
+    else:
+        results = (
+            (query_header, place_sequence(query_header, query_seq, post_seqs, **options))
+            for query_header, query_seq in query_seqs
+        )
+
+    try:
+        for query_header, placement in results:
+            placements[query_header] = placement
+            now = time.time()
+            if now - last_log_time >= log_interval:
+                last_log_time = now
+                log('Placed %r of %r sequences (%.1f sequences/s).' % (
+                    len(placements), len(given_headers), len(placements) / (now - start_time)
+                ))
+    except:
+        if pool is not None:
+            pool.terminate()
+        raise
+    else:
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is not None:
+            pool.join()
+        _worker_post_seqs = _worker_options = None
+
+    elapsed = max(time.time() - start_time, 1e-9)
+    log('Placed %r sequences in %.1f seconds (%.1f sequences/s).' % (len(placements), elapsed, len(placements) / elapsed))
+    return placements
+
+
+def get_placement_cache_key(pre_file, post_file, switch_sw=False, max_mismatches=0):
+    """
+    Placements can be reused for the same pre and post assemblies, placed with the same options.
+    :return: tuple of strings identifying a placement run.
+    """
+    return file_md5(pre_file), file_md5(post_file), 'switch_sw=%r' % bool(switch_sw), 'max_mismatches=%r' % max_mismatches
+
+
+def read_placement_cache(cache_file, key):
+    """
+    Read placements saved by write_placement_cache.
+    :param key: tuple from get_placement_cache_key.
+    :return: dictionary of placements, empty if the cache file is missing or was made for another key.
+    """
+    placements = dict()
+    try:
+        with open(cache_file) as f:
+            if f.readline().rstrip('\n') != '#' + '\t'.join(key):
+                return placements
+            for line in f:
+                query_header, position, reverse_complimented, pre_length, post_header = line.rstrip('\n').split('\t', 4)
+                placements[query_header] = (post_header, int(position), reverse_complimented == '1', int(pre_length))
+    except (IOError, ValueError):
+        return dict()
+    return placements
+
+
+def write_placement_cache(cache_file, key, placements):
+    """
+    Save placements for later runs. The file is replaced in one step, so an interrupted run leaves no partial cache.
+    :param key: tuple from get_placement_cache_key.
+    :param placements: dictionary made from place_pre_seqs.
+    """
+    temp_file = cache_file + '.tmp'
+    with open(temp_file, 'w') as f:
+        f.write('#' + '\t'.join(key) + '\n')
+        for query_header, (post_header, position, reverse_complimented, pre_length) in placements.iteritems():
+            f.write('%s\t%d\t%d\t%d\t%s\n' % (query_header, position, reverse_complimented, pre_length, post_header))
+    os.rename(temp_file, cache_file)
+
+
+def get_placements(query_headers, pre_file, post_file, cache_file=None, switch_sw=False, max_mismatches=0, processes=1):
+    """
+    Place the query sequences, reusing placements saved in cache_file by earlier runs with the same
+    pre and post assemblies and options. Only sequences missing from the cache are placed, and
+    the cache is then updated. The post assembly is not loaded if every sequence is in the cache.
+
+    :param query_headers: set or list of query headers to be placed.
+    :param cache_file: Placement cache file. If None, no cache is used.
+    :return: dictionary of placements, as made by place_pre_seqs.
+    """
+    placements = dict()
+    if cache_file is not None:
+        log('Checking the placement cache %s.' % cache_file)
+        key = get_placement_cache_key(pre_file, post_file, switch_sw, max_mismatches)
+        placements = read_placement_cache(cache_file, key)
+
+    # Empty headers, e.g. from lines starting with a tab, have no sequence to place.
+    query_headers = [header for header in query_headers if header]
+    new_headers = [header for header in query_headers if header not in placements]
+    log('%r query sequences were found in the placement cache, %r need to be placed.' % (
+        len(query_headers) - len(new_headers), len(new_headers)
+    ))
+    if not new_headers:
+        return dict((header, placements[header]) for header in query_headers)
+
+    log('Parsing and indexing post assembly sequences.')
+    post_index = PostAssembly.from_fasta(post_file)
+    log('Finding the query headers in the post assembly.')
+    placements.update(place_pre_seqs(
+        new_headers, pre_file, post_index, switch_sw=switch_sw, max_mismatches=max_mismatches, processes=processes
+    ))
+    if cache_file is not None:
         try:
-            query_seq = x.get_seq(query_header)[1]
-        except TypeError:
-            raise ValueError('The query sequence in the coordinates file was not found %s.' % query_header)
-
-        for post_header in post_seqs.keys():
-            search_result = post_seqs[post_header].find(query_seq)
-            if search_result != -1:
-                placed = True
-                break
-
-        if not placed:
-            # Reverse compliment and try again
-            reverse_complimented = True
-            query_seq_R = reverse_complement(query_seq)
-
-            # Switch S and W nucleotides if necessary
-            if switch_sw:
-                query_seq_R = switch_SW(query_seq_R)
-
-            for post_header in post_seqs.keys():
-                search_result = post_seqs[post_header].find(query_seq_R)
-                if search_result != -1:
-                    placed = True
+            write_placement_cache(cache_file, key, placements)
+        except (OSError, IOError):
+            # e.g. a read only directory. The placements are still used.
+            log('The placement cache %s could not be written.' % cache_file)
+    return dict((header, placements[header]) for header in query_headers)
+
+
+# Annotation formats which can be lifted over, and their file name extensions.
+coordinate_formats = {
+    'gff3': ('.gff3', '.gff'),
+    'gtf': ('.gtf',),
+    'bed': ('.bed',),
+    'vcf': ('.vcf',)
+}
+
+_flipped_strands = {'+': '-', '-': '+'}
+
+
+def get_coordinate_format(coords_file):
+    """ Guess the format of a coordinates file from its extension. Defaults to gff3. """
+    for file_format, extensions in coordinate_formats.iteritems():
+        if coords_file.lower().endswith(extensions):
+            return file_format
+    return 'gff3'
+
+
+def is_comment(line):
+    """ Check if a line of a coordinates file is a comment, header, track or blank line. """
+    return line.startswith(('#', 'track', 'browser')) or not line.strip()
+
+
+class ChainBlocks(object):
+    """
+    The aligned blocks of the chains of one pre assembly sequence, read from a chain file.
+    Blocks are sorted by their pre assembly start, so the block holding a coordinate is found by bisection.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.blocks = []
+
+    def add_block(self, t_start, size, q_name, q_start, q_size, q_reverse):
+        """ Add one ungapped block. Coordinates are 0-based, as in chain files. """
+        self.starts.append(t_start)
+        self.blocks.append((t_start, t_start + size, q_name, q_start, q_size, q_reverse))
+
+    def sort(self):
+        order = sorted(xrange(len(self.starts)), key=self.starts.__getitem__)
+        self.starts = [self.starts[i] for i in order]
+        self.blocks = [self.blocks[i] for i in order]
+
+    def lift_interval(self, start, end):
+        """
+        Lift an interval which is within one aligned block. See lift_interval.
+        :return: tuple of post header, start, end and reverse complemented flag, or None.
+        """
+        if start > end + 1:
+            return None
+        i = bisect_right(self.starts, start - 1) - 1
+        if i < 0:
+            return None
+        t_start, t_end, q_name, q_start, q_size, q_reverse = self.blocks[i]
+        if end > t_end:
+            return None
+        # 0-based, end exclusive coordinates on the chain's strand of the post assembly sequence.
+        q_from = q_start + start - 1 - t_start
+        q_to = q_from + end - start + 1
+        if q_reverse:
+            return q_name, q_size - q_to + 1, q_size - q_from, True
+        return q_name, q_from + 1, q_to, False
+
+
+def read_chain_file(chain_file):
+    """
+    Read a UCSC chain file mapping the pre assembly (the chain target) to the post assembly (the chain query).
+    https://genome.ucsc.edu/goldenPath/help/chain.html
+    :return: dictionary of pre assembly sequence name: ChainBlocks, to be used in place of placements.
+    """
+    chains = dict()
+    with open(chain_file) as f:
+        for line in f:
+            if not line.startswith('chain'):
+                if line.strip() and not line.startswith('#'):
+                    raise ValueError('Expected a chain header line in %s, got: %s' % (chain_file, line.rstrip()))
+                continue
+            fields = line.split()
+            if len(fields) < 12:
+                raise ValueError('Chain header line has too few fields: %s' % line.rstrip())
+            t_name, t_strand, t_start = fields[2], fields[4], int(fields[5])
+            q_name, q_size, q_strand, q_start = fields[7], int(fields[8]), fields[9], int(fields[10])
+            if t_strand != '+':
+                raise ValueError('Chains on the reverse strand of the target are not supported: %s' % line.rstrip())
+            blocks = chains.setdefault(t_name, ChainBlocks())
+            for line in f:
+                fields = line.split()
+                if not fields:
                     break
+                size = int(fields[0])
+                blocks.add_block(t_start, size, q_name, q_start, q_size, q_strand == '-')
+                if len(fields) < 3:
+                    break
+                t_start += size + int(fields[1])
+                q_start += size + int(fields[2])
+    for blocks in chains.itervalues():
+        blocks.sort()
+    return chains
+
 
-        if not placed:
-            raise ValueError('Sequence %s was not found in the post assembly.' % query_header)
+def write_chain_file(chain_file, placements, post_lengths):
+    """
+    Write placements as a UCSC chain file, with the pre assembly as the target and the post assembly
+    as the query. Each placement is one chain of a single ungapped block. Chain files separate fields
+    with whitespace, so post assembly sequences are named by the first word of their header.
+    :param placements: dictionary made from place_pre_seqs.
+    :param post_lengths: dictionary of post assembly header (with '>'): sequence length.
+    """
+    with open(chain_file, 'w') as f:
+        for chain_id, (query_header, placement) in enumerate(sorted(placements.iteritems()), 1):
+            post_header, offset, reverse_complimented, pre_length = placement
+            post_length = post_lengths[post_header]
+            q_start = post_length - offset - pre_length if reverse_complimented else offset
+            f.write('chain %d %s %d + 0 %d %s %d %s %d %d %d\n%d\n\n' % (
+                pre_length, query_header, pre_length, pre_length, post_header[1:].split()[0], post_length,
+                '-' if reverse_complimented else '+', q_start, q_start + pre_length, chain_id, pre_length
+            ))
+
+
+def lift_interval(placement, start, end):
+    """
+    Lift an interval of a pre assembly sequence over to the post assembly.
+    :param placement: Placement tuple from place_pre_seqs, or ChainBlocks from read_chain_file.
+    :param start: 1-based start coordinate.
+    :param end: 1-based end coordinate, inclusive.
+    :return: tuple of post header (without '>'), start, end and reverse complemented flag, or None
+             if the interval is not within the pre assembly sequence, or not within one block of a chain.
+    """
+    if isinstance(placement, ChainBlocks):
+        return placement.lift_interval(start, end)
+    post_header, offset, reverse_complimented, pre_length = placement
+    if start < 1 or end > pre_length or start > end + 1:
+        return None
+    if reverse_complimented:
+        start, end = get_reverse_coords(start, end, pre_length)
+    return post_header[1:], start + offset, end + offset, reverse_complimented
+
+
+def _lift_gff(fields, placement):
+    """ Lift a split GFF3 or GTF line. :return: tuple of lifted fields and an unliftable reason. """
+    lifted = lift_interval(placement, int(fields[3]), int(fields[4]))
+    if lifted is None:
+        return None, 'outside the placed sequence'
+    fields[0], fields[3], fields[4] = lifted[0], str(lifted[1]), str(lifted[2])
+    if lifted[3] and len(fields) > 6:
+        fields[6] = _flipped_strands.get(fields[6], fields[6])
+    return fields, None
+
+
+def _lift_bed(fields, placement):
+    """ Lift a split BED line. BED coordinates are 0-based, end exclusive. """
+    start, end = int(fields[1]), int(fields[2])
+    lifted = lift_interval(placement, start + 1, end)
+    if lifted is None:
+        return None, 'outside the placed sequence'
+    fields[0], fields[1], fields[2] = lifted[0], str(lifted[1] - 1), str(lifted[2])
+    reverse_complimented = lifted[3]
+    if len(fields) > 7:
+        lifted_thick = lift_interval(placement, int(fields[6]) + 1, int(fields[7]))
+        if lifted_thick is None:
+            return None, 'outside the placed sequence'
+        fields[6], fields[7] = str(lifted_thick[1] - 1), str(lifted_thick[2])
+    if reverse_complimented:
+        if len(fields) > 5:
+            fields[5] = _flipped_strands.get(fields[5], fields[5])
+        if len(fields) > 11:
+            # Blocks are relative to the feature start, so they are mirrored and their order reversed.
+            sizes = [int(i) for i in fields[10].rstrip(',').split(',')]
+            starts = [int(i) for i in fields[11].rstrip(',').split(',')]
+            trailing_comma = ',' if fields[10].endswith(',') else ''
+            fields[10] = ','.join(str(size) for size in reversed(sizes)) + trailing_comma
+            fields[11] = ','.join(
+                str(end - start - block_start - size) for block_start, size in reversed(zip(starts, sizes))
+            ) + trailing_comma
+    return fields, None
+
+
+def _lift_vcf(fields, placement):
+    """
+    Lift a split VCF line. On reverse complemented sequences, REF and ALT alleles are reverse
+    complemented. Indels are not, because their padding base would move to the other end.
+    """
+    ref = fields[3]
+    lifted = lift_interval(placement, int(fields[1]), int(fields[1]) + len(ref) - 1)
+    if lifted is None:
+        return None, 'outside the placed sequence'
+    if lifted[3]:
+        alts = fields[4].split(',')
+        if any(len(alt) != len(ref) for alt in alts if alt not in ('.', '*')):
+            return None, 'indel on a reverse complemented sequence'
+        try:
+            fields[3] = reverse_complement(ref)
+            fields[4] = ','.join(alt if alt in ('.', '*') else reverse_complement(alt) for alt in alts)
+        except KeyError:
+            return None, 'allele can not be reverse complemented'
+    fields[0], fields[1] = lifted[0], str(lifted[1])
+    return fields, None
 
-        total += 1
-        if total%100 == 0:
-            log('processed %r sequecnes' % total)
-        pre_length = len(query_seq)
-        placements[query_header] = (post_header, search_result, reverse_complimented, pre_length)
 
-    return placements
+_line_lifters = {
+    'gff3': (_lift_gff, 5),
+    'gtf': (_lift_gff, 5),
+    'bed': (_lift_bed, 3),
+    'vcf': (_lift_vcf, 5)
+}
 
 
-def convert_coordinates(coords_file, placements, delim='\t'):
+def lift_lines(lines, placements, file_format='gff3', delim='\t'):
     """
-    Update the genomic coordinates of the given file.
-    :param coords_file:
-    :return:
+    Lift over a batch of lines of a coordinates file. Comment, header and blank lines are kept as they are.
+    :param lines: List of lines.
+    :param placements: dictionary made from place_pre_seqs or read_chain_file.
+    :param file_format: 'gff3', 'gtf', 'bed' or 'vcf'.
+    :return: tuple of the lifted text, the text of the lines which could not be lifted over,
+             and a Counter of the reasons they could not be.
     """
-    # Make new output file.
+    lift_line, min_fields = _line_lifters[file_format]
+    lifted = []
+    unliftable = []
+    reasons = Counter()
+    for line in lines:
+        if is_comment(line):
+            lifted.append(line)
+            continue
+        fields = line.rstrip('\r\n').split(delim)
+        placement = placements.get(fields[0])
+        if placement is None:
+            reason = 'sequence not placed'
+        elif len(fields) < min_fields:
+            reason = 'too few fields'
+        else:
+            try:
+                fields, reason = lift_line(fields, placement)
+            except ValueError:
+                reason = 'coordinates are not integers'
+        if reason is None:
+            lifted.append(delim.join(fields) + '\n')
+        else:
+            unliftable.append(line if line.endswith('\n') else line + '\n')
+            reasons[reason] += 1
+    return ''.join(lifted), ''.join(unliftable), reasons
+
+
+# The placements and format of worker processes, set before the worker processes are forked.
+_worker_lift_options = None
+
+
+def _lift_lines_in_worker(lines):
+    """ Lift over a batch of lines. Run in worker processes. """
+    return lift_lines(lines, **_worker_lift_options)
+
+
+def get_output_file_names(coords_file, file_format):
+    """ :return: tuple of the lifted and unliftable file names of a coordinates file. """
     base_name = coords_file[:coords_file.rfind('.')]
-    out_file = open(base_name + '.transfered.genes.gff3', 'w')
+    extension = coordinate_formats[file_format][0]
+    if file_format == 'gff3':
+        return base_name + '.transfered.genes' + extension, base_name + '.unliftable.genes' + extension
+    return base_name + '.transfered' + extension, base_name + '.unliftable' + extension
+
 
-    # Iterate through input gene file.
-    for line in open(coords_file):
-        if line.startswith('#'):
-            out_file.write(line)
+def convert_coordinates(coords_file, placements, delim='\t', file_format=None, processes=1, batch_size=65536):
+    """
+    Update the genomic coordinates of the given file, streaming it in batches of lines.
+    Features on reverse complemented sequences are moved to the other strand.
+    Features which can not be lifted over are written to a separate unliftable file.
+    :param coords_file:
+    :param placements: dictionary made from place_pre_seqs or read_chain_file.
+    :param file_format: 'gff3', 'gtf', 'bed' or 'vcf'. By default, guessed from the file extension.
+    :param processes: Number of worker processes.
+    :param batch_size: Number of lines lifted over at a time.
+    :return: Counter of the reasons features could not be lifted over.
+    """
+    global _worker_lift_options
+    if file_format is None:
+        file_format = get_coordinate_format(coords_file)
+    if file_format not in coordinate_formats:
+        raise ValueError('Unsupported coordinates format %r. Use one of %s.' % (file_format, ', '.join(sorted(coordinate_formats))))
+    options = {'placements': placements, 'file_format': file_format, 'delim': delim}
+    out_file_name, unliftable_file_name = get_output_file_names(coords_file, file_format)
+
+    reasons = Counter()
+    pool = None
+    with open(coords_file) as in_file, open(out_file_name, 'w') as out_file, open(unliftable_file_name, 'w') as unliftable_file:
+        batches = iter(lambda: list(islice(in_file, batch_size)), [])
+        if processes > 1:
+            _worker_lift_options = options
+            pool = Pool(processes)
+            # Hand the pool a few batches at a time, so that the file is not read faster than it is lifted over.
+            results = chain.from_iterable(
+                pool.imap(_lift_lines_in_worker, group) for group in iter(lambda: list(islice(batches, processes * 2)), [])
+            )
         else:
-            # If not a comment line, update chromosome and coordinate info.
-            split_line = line.split(delim)
-            header = str(split_line[0])
-            # Raise error under the else condition here
-            if header in placements.keys():
-                start_coord = int(split_line[3])
-                end_coord = int(split_line[4])
-                if placements[header][2]:
-                    # print reverse complement coords.
-                    new_coords = get_reverse_coords(start_coord, end_coord, placements[header][3])
-                    out_file.write('%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s' % (placements[header][0][1:], split_line[1],
-                                                                           split_line[2], new_coords[0] + placements[header][1] - 1,
-                                                                           new_coords[1] + placements[header][1] - 1, split_line[5],
-                                                                           split_line[6], split_line[7], split_line[8]))
-                else:
-                    out_file.write('%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s' % (placements[header][0][1:], split_line[1],
-                                                                           split_line[2], str(start_coord + placements[header][1]),
-                                                                           str(placements[header][1] + end_coord), split_line[5], split_line[6],
-                                                                           split_line[7], split_line[8]))
-    out_file.close()
+            results = (lift_lines(lines, **options) for lines in batches)
+        try:
+            for lifted, unliftable, batch_reasons in results:
+                out_file.write(lifted)
+                unliftable_file.write(unliftable)
+                reasons.update(batch_reasons)
+        except:
+            if pool is not None:
+                pool.terminate()
+            raise
+        else:
+            if pool is not None:
+                pool.close()
+        finally:
+            if pool is not None:
+                pool.join()
+            _worker_lift_options = None
+
+    for reason, count in sorted(reasons.iteritems()):
+        log('%r features could not be lifted over: %s. See %s.' % (count, reason, unliftable_file_name))
+    return reasons
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Lift over genomic coordinates from one assembly to another.')
-    parser.add_argument('post_assembly', metavar='<post_assembly.fasta>', type=str,
-                        help='Assembly to which genomic coordinates will be lifted over.')
+    parser.add_argument('post_assembly', metavar='<post_assembly.fasta>', type=str, nargs='?',
+                        help='Assembly to which genomic coordinates will be lifted over. Not used with --chain.')
 
-    parser.add_argument('pre_assembly', metavar='<pre_assembly.fasta>', type=str,
-                        help='Assembly from which genomic coordinates will be lifted over.')
+    parser.add_argument('pre_assembly', metavar='<pre_assembly.fasta>', type=str, nargs='?',
+                        help='Assembly from which genomic coordinates will be lifted over. Not used with --chain.')
 
     parser.add_argument('coordinates', metavar='<coordinates.gff3>', type=str,
-                        help='File with genomic coordnates to be lifted over.')
+                        help='File with genomic coordnates to be lifted over, in GFF3, GTF, BED or VCF format.')
+
+    parser.add_argument('--format', choices=sorted(coordinate_formats), default=None,
+                        help='Format of the coordinates file. By default, it is guessed from the file extension.')
 
     parser.add_argument('-sw', action="store_true", default=False, help='Switch S and W ambiguity codes when reverse complementing.')
 
+    parser.add_argument('--threads', metavar='<int>', type=int, default=1,
+                        help='Number of processes used to place sequences and lift over coordinates. Default 1.')
+
+    parser.add_argument('--max-mismatches', metavar='<int>', type=int, default=0,
+                        help='Place sequences which are not found exactly if they differ from the post assembly by up to this many substitutions. Requires NumPy.')
+
+    parser.add_argument('--placement-cache', metavar='<file>', type=str, default=None,
+                        help='File where placements are saved and reused by later runs with the same assemblies. Default <pre_assembly.fasta>.placements')
+
+    parser.add_argument('--no-cache', action="store_true", default=False, help='Do not read or write the placement cache.')
+
+    parser.add_argument('--chain', metavar='<file>', type=str, default=None,
+                        help='Lift over with a chain file from the pre to the post assembly, rather than placing sequences.')
+
+    parser.add_argument('--chain-out', metavar='<file>', type=str, default=None,
+                        help='Write the placements as a chain file from the pre to the post assembly, for later use with --chain.')
+
     args = parser.parse_args()
 
     post_assembly = args.post_assembly
     pre_assembly = args.pre_assembly
     coordinates_file = args.coordinates
     sw = args.sw
-
-    log('Parsing post assembly sequences.')
-    post_dict = get_post_seqs(post_assembly)
-
-    log('Getting all pre assembly sequences.')
-    query_header_set = get_query_seqs(coordinates_file)
-
-    log('%r query sequences are present in the coordinates file.' %len(query_header_set))
-    log('Finding the query headers in the post assembly.')
-    final_placements = place_pre_seqs(query_header_set, pre_assembly, post_dict, switch_sw=sw)
+    if args.max_mismatches < 0:
+        raise ValueError('The maximum number of mismatches can not be negative.')
+    if args.max_mismatches and np is None:
+        raise ImportError('--max-mismatches requires NumPy.')
+    if args.threads < 1:
+        raise ValueError('The number of threads must be at least 1.')
+    if args.chain is not None:
+        if post_assembly is not None or args.chain_out is not None:
+            parser.error('With --chain, only the coordinates file is given and --chain-out can not be used.')
+    elif pre_assembly is None:
+        parser.error('The post and pre assemblies are required unless --chain is given.')
+
+    if args.chain is not None:
+        log('Reading chain file %s.' % args.chain)
+        final_placements = read_chain_file(args.chain)
+    else:
+        log('Getting all pre assembly sequences.')
+        query_header_set = get_query_seqs(coordinates_file)
+
+        log('%r query sequences are present in the coordinates file.' %len(query_header_set))
+        placement_cache = None if args.no_cache else (args.placement_cache or pre_assembly + '.placements')
+        final_placements = get_placements(
+            query_header_set, pre_assembly, post_assembly, placement_cache, switch_sw=sw,
+            max_mismatches=args.max_mismatches, processes=args.threads
+        )
+
+        if args.chain_out is not None:
+            log('Writing chain file %s.' % args.chain_out)
+            write_chain_file(args.chain_out, final_placements, dict(SeqReader(post_assembly).scan_lengths()))
 
     log('Writing coordinates file with coordinates lifted over.')
-    convert_coordinates(coordinates_file, final_placements)
\ No newline at end of file
+    convert_coordinates(coordinates_file, final_placements, file_format=args.format, processes=args.threads)
\ No newline at end of file
@@ -11,15 +11,33 @@ Description:
 This command line utility takes a sequence file and outputs sequences
 of that file containing a specified subsequence.
 
+Alternatively, a fasta file of many probes or primers can be given with -p.
+All probes are searched for in one pass over the sequence file, and every hit
+is written to standard output as a tab separated line:
+<sequence header> <start> <end> <probe name> <strand> <mismatches>
+Coordinates are 0-based, and the end coordinate is exclusive.
+
+A subsequence given with -s, without -b, -i or --max-mismatches, is matched
+with the same case, so soft masked (lower case) bases only match lower case.
+All other searches ignore case.
+
+With --hits, every hit of the -s subsequence is written in the same way,
+rather than the sequences containing it.
+
+With --max-mismatches, hits may have up to that many mismatches (substitutions).
+Insertions and deletions are not allowed.
+
 _____
 Usage:
 
-python search_subseq.py [options] -f <sequence file> -s <length cutoff>
+python search_subseq.py [options] -f <sequence file> -s <subsequence>
+python search_subseq.py [options] -f <sequence file> -p <probe fasta file>
 
     flags:
 
     -f      ------------------- File from which a sequence is desired.
     -s      ------------------- The subsequence to search for.
+    -p      ------------------- Fasta file of probes or primers to search for, instead of -s.
 
 
     OPTIONS:
@@ -27,10 +45,25 @@ python search_subseq.py [options] -f <sequence file> -s <length cutoff>
     -h, --help   -------------- Display help message.
     -a           -------------- Input file is in fasta format.
     -q           -------------- Input file is in fastq format.
+    -b           -------------- Search both strands.
+    -i           -------------- Expand IUPAC ambiguity codes (e.g. N, R, Y) in the subsequence or probes.
+    --max-mismatches  --------- Maximum number of mismatches in a hit. Default 0.
+    --hits       -------------- Write each hit of the -s subsequence, with its position and
+                                number of mismatches, instead of each sequence containing it.
+    --threads    -------------- Number of processes used to search. Default 1.
+    -o           -------------- Write output to this file instead of standard output. File names ending
+                                in .gz or .bgz are gzip or bgzip compressed.
 """
 import sys
 
 from dsa_seq_utils.SeqReader import SeqReader
+from dsa_seq_utils.search import MismatchSearcher
+from dsa_seq_utils.filters import RecordFilter
+from dsa_seq_utils.filters import SubseqFilter
+from dsa_seq_utils.filters import ExactSubseqFilter
+from dsa_seq_utils.filters import HitFormatter
+from dsa_seq_utils.filters import filter_file
+from dsa_seq_utils.SeqWriter import SeqWriter
 from dsa_seq_utils.utilities import get_flag
 from dsa_seq_utils.utilities import help_desired
 
@@ -41,11 +74,30 @@ if help_desired(sys.argv):
 # Get the sequence file.
 input_file = get_flag(sys.argv, '-f', usage)
 
-# Get the cutoff length.
-subseq = get_flag(sys.argv, '-s', usage)
+# Get the subsequence or the probe file.
+if '-s' in sys.argv and '-p' in sys.argv:
+    raise ValueError("'-s' and '-p' flag cannot be specified together.")
+if '-p' in sys.argv:
+    probe_file = get_flag(sys.argv, '-p', usage)
+    probes = [(header[1:], sequence) for header, sequence in SeqReader(probe_file).parse_fasta()]
+    report_hits = True
+else:
+    subseq = get_flag(sys.argv, '-s', usage)
+    probes = [(subseq, subseq)]
+    report_hits = '--hits' in sys.argv
+
+# Get the number of processes to use.
+threads = 1
+if '--threads' in sys.argv:
+    try:
+        threads = int(get_flag(sys.argv, '--threads', usage))
+    except ValueError:
+        raise ValueError('The number of threads must be an integer.')
+    if threads < 1:
+        raise ValueError('The number of threads must be at least 1.')
 
 # Check if the input file is in fasta or fastq format.
-if '-a' in sys.argv and '- q' not in sys.argv:
+if '-a' in sys.argv and '-q' not in sys.argv:
     using_fastas = True
 elif '-q' in sys.argv and '-a' not in sys.argv:
     using_fastas = False
@@ -58,17 +110,31 @@ else:
         "A '-a' or '-q' flag must be specified. This specifies fasta or fastq file format."
     )
 
-# Iterate through the sequence file and write sequence to standard output
-# if the sequence is longer than the specified cutoff length.
-x = SeqReader(input_file)
-if using_fastas:
-    for header, sequence in x.parse_fasta():
-        if subseq in sequence:
-            print header
-            print sequence
+# Get the maximum number of mismatches.
+max_mismatches = 0
+if '--max-mismatches' in sys.argv:
+    try:
+        max_mismatches = int(get_flag(sys.argv, '--max-mismatches', usage))
+    except ValueError:
+        raise ValueError('--max-mismatches must be followed by a non-negative integer.')
+
+# Find all probes in one pass over each sequence.
+searcher = MismatchSearcher(
+    probes,
+    max_mismatches=max_mismatches,
+    both_strands='-b' in sys.argv,
+    iupac='-i' in sys.argv
+)
+
+# Iterate through the sequence file. Either write every hit, or write each
+# sequence containing the subsequence to standard output.
+if report_hits:
+    record_filter = RecordFilter(formatter=HitFormatter(searcher))
+elif not max_mismatches and '-b' not in sys.argv and '-i' not in sys.argv:
+    # One exact subsequence. The built in string search is much faster than the automaton.
+    record_filter = RecordFilter([ExactSubseqFilter(subseq)])
 else:
-    for read in x.parse_fastq():
-        if subseq in read[1]:
-            for i in read:
-                print i
-
+    record_filter = RecordFilter([SubseqFilter(searcher)])
+out_file = get_flag(sys.argv, '-o', usage) if '-o' in sys.argv else sys.stdout
+with SeqWriter(out_file) as writer:
+    filter_file(input_file, writer, record_filter, fastq=not using_fastas, processes=threads)
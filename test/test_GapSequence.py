@@ -2,6 +2,7 @@ __author__ = 'malonge'
 import unittest
 
 from dsa_seq_utils.Sequence import GapSequence
+from dsa_seq_utils.Sequence import np
 
 
 class GapSequenceTest(unittest.TestCase):
@@ -55,6 +56,22 @@ class GapSequenceTest(unittest.TestCase):
     def test_get_gaps_flanking_gap(self):
         self.assertEqual(self.gs_flanking_N.get_gaps(), ['N', 'N'])
 
+    # Test the get_gap_intervals method
+    def test_get_gap_intervals_regex(self):
+        self.assertEqual(self.gs_empty_string.get_gap_intervals(use_numpy=False), ([], [], []))
+        self.assertEqual(self.gs_two_flanked_gaps.get_gap_intervals(use_numpy=False), ([2, 6], [4, 8], [2, 2]))
+        self.assertEqual(self.gs_flanking_N.get_gap_intervals(use_numpy=False), ([0, 3], [1, 4], [1, 1]))
+
+    @unittest.skipIf(np is None, 'NumPy is not installed.')
+    def test_get_gap_intervals_numpy_matches_regex(self):
+        for gs in (self.gs_empty_string, self.gs_one_flanked_gap, self.gs_two_flanked_gaps,
+                   self.gs_all_N, self.gs_flanking_N, self.gs_lower_case, GapSequence('ACGT')):
+            starts, ends, lengths = gs.get_gap_intervals(use_numpy=True)
+            self.assertEqual(
+                (starts.tolist(), ends.tolist(), lengths.tolist()),
+                gs.get_gap_intervals(use_numpy=False)
+            )
+
 """
     # Test the get_gap_coords method
     def test_get_gap_coords(self):
@@ -1,8 +1,13 @@
 __author__ = 'malonge'
 import os
+import bz2
+import gzip
+import pickle
 import unittest
 
+from dsa_seq_utils import SeqReader as seq_reader_module
 from dsa_seq_utils.SeqReader import SeqReader
+from dsa_seq_utils.SeqReader import get_compression
 
 
 class SeqReaderTest(unittest.TestCase):
@@ -77,6 +82,9 @@ class SeqReaderTest(unittest.TestCase):
         os.remove('good.fastq')
         os.remove('bad_line_number.fastq')
         os.remove('two_headers.fasta')
+        for f in os.listdir('.'):
+            if f.endswith('.fasta.dsa.fai'):
+                os.remove(f)
 
     def test_init_1(self):
         with self.assertRaises(AttributeError):
@@ -180,6 +188,51 @@ class SeqReaderTest(unittest.TestCase):
             self.assertEqual(plus, '+')
             self.assertEqual(qual, 'QQQQQQQQQQ')
 
+    def test_fastq_record(self):
+        read = list(SeqReader('good.fastq').parse_fastq())[0]
+        self.assertEqual(read.header, '@header')
+        self.assertEqual(read.sequence, 'AAAAAAAAAA')
+        self.assertEqual(read.plus, '+')
+        self.assertEqual(read.quality, 'QQQQQQQQQQ')
+        self.assertEqual(read, ['@header', 'AAAAAAAAAA', '+', 'QQQQQQQQQQ'])
+        self.assertEqual(pickle.loads(pickle.dumps(read, 2)), read)
+
+    def test_parse_fastq_crlf_and_no_final_newline(self):
+        with open('crlf.fastq', 'w') as f:
+            f.write('@read1\r\nACGT\r\n+\r\nIIII\r\n')
+            f.write('@read2\nAC\n+\nII')
+        try:
+            x = SeqReader('crlf.fastq')
+            self.assertEqual(list(x.parse_fastq()), [('@read1', 'ACGT', '+', 'IIII'), ('@read2', 'AC', '+', 'II')])
+            self.assertEqual(list(x.parse_fastq_lengths()), [4, 2])
+        finally:
+            os.remove('crlf.fastq')
+
+    def test_scan_lengths(self):
+        for fasta in ('good_alt_line.fasta', 'good_non_alt_line.fasta', 'two_headers.fasta'):
+            x = SeqReader(fasta)
+            expected = [(header, len(seq)) for header, seq in x.parse_fasta()]
+            self.assertEqual(list(x._count_fasta_bases(open(fasta).read())), expected)
+            self.assertEqual(list(x.scan_lengths()), expected)
+            ranges = x.split_offsets(2)
+            self.assertEqual([i for start, end in ranges for i in x.scan_lengths(start, end)], expected)
+            x.write_index(x.build_index())
+            self.assertEqual(list(SeqReader(fasta).scan_lengths()), expected)
+        with self.assertRaises(RuntimeError):
+            list(SeqReader('bad_no_header.fasta').scan_lengths())
+
+    def test_duplicate_headers_are_not_indexed(self):
+        with open('duplicates.fasta', 'w') as f:
+            f.write('>seq\nACGT\n>seq\nAC\n')
+        try:
+            x = SeqReader('duplicates.fasta')
+            with self.assertRaises(RuntimeError):
+                x.build_index()
+            self.assertIsNone(x.get_index())
+            self.assertEqual(list(x.scan_lengths()), [('>seq', 4), ('>seq', 2)])
+        finally:
+            os.remove('duplicates.fasta')
+
     def test_get_single_fasta_seq_with_greater_than_sign(self):
         x = SeqReader('good_alt_line.fasta')
         header, seq = x.get_seq('>test1')
@@ -222,6 +275,187 @@ class SeqReaderTest(unittest.TestCase):
             gen.next()
 
 
+    def test_get_multiple_fasta_seq_out_of_file_order(self):
+        x = SeqReader('good_non_alt_line.fasta')
+        seqs = list(x.get_multiple_seqs(['test2', 'test1', 'test2']))
+        self.assertEqual(seqs, [('>test2', 'GGGGGGGGGG'), ('>test1', 'AAAAAAAAAA'), ('>test2', 'GGGGGGGGGG')])
+
+    def test_get_multiple_fasta_seq_with_index(self):
+        x = SeqReader('good_non_alt_line.fasta')
+        x.write_index(x.build_index())
+        y = SeqReader('good_non_alt_line.fasta')
+        gen = y.get_multiple_seqs(['test2', 'test1', 'test_wrong_header'])
+        self.assertEqual(gen.next(), ('>test2', 'GGGGGGGGGG'))
+        self.assertEqual(gen.next(), ('>test1', 'AAAAAAAAAA'))
+        with self.assertRaises(ValueError):
+            gen.next()
+
+    def write_compressed_copies(self):
+        with open('good_non_alt_line.fasta') as f:
+            contents = f.read()
+        gz_file = gzip.open('compressed.fasta.gz', 'wb')
+        gz_file.write(contents)
+        gz_file.close()
+        bz2_file = bz2.BZ2File('compressed.fasta.bz2', 'wb')
+        bz2_file.write(contents)
+        bz2_file.close()
+
+    def remove_compressed_copies(self):
+        os.remove('compressed.fasta.gz')
+        os.remove('compressed.fasta.bz2')
+
+    def test_get_compression(self):
+        self.write_compressed_copies()
+        try:
+            self.assertEqual(get_compression('compressed.fasta.gz'), 'gzip')
+            self.assertEqual(get_compression('compressed.fasta.bz2'), 'bz2')
+            self.assertIsNone(get_compression('good_non_alt_line.fasta'))
+        finally:
+            self.remove_compressed_copies()
+
+    def test_parse_compressed_fasta(self):
+        self.write_compressed_copies()
+        expected = list(SeqReader('good_non_alt_line.fasta').parse_fasta())
+        saved_commands = seq_reader_module.decompression_commands
+        try:
+            for commands in (saved_commands, {'gzip': [], 'bz2': []}):
+                # Once with external decompressors, once with the standard library.
+                seq_reader_module.decompression_commands = commands
+                for f in ('compressed.fasta.gz', 'compressed.fasta.bz2'):
+                    x = SeqReader(f)
+                    self.assertEqual(list(x.parse_fasta()), expected)
+                    self.assertEqual(x.get_seq('test1'), ('>test1', 'AAAAAAAAAA'))
+                    self.assertIsNone(x.get_index())
+                    self.assertFalse(os.path.exists(f + '.dsa.fai'))
+        finally:
+            seq_reader_module.decompression_commands = saved_commands
+            self.remove_compressed_copies()
+
+    def test_split_offsets_fastq(self):
+        with open('many.fastq', 'w') as f:
+            for i in range(20):
+                # Quality lines starting with '@' must not be mistaken for headers.
+                f.write('@read%d\nACGT\n+\n@@II\n' % i)
+        try:
+            x = SeqReader('many.fastq')
+            offsets = x.split_offsets(6, fastq=True)
+            self.assertEqual(len(offsets), 6)
+            reads = []
+            for start, end in offsets:
+                reads.extend(x.parse_fastq(start, end))
+            self.assertEqual(reads, list(x.parse_fastq()))
+        finally:
+            os.remove('many.fastq')
+
+    def test_split_offsets_fasta(self):
+        x = SeqReader('good_non_alt_line.fasta')
+        offsets = x.split_offsets(3)
+        self.assertEqual(offsets, [(0, 19), (19, 38)])
+        self.assertEqual(list(x.parse_fasta(*offsets[1])), [('>test2', 'GGGGGGGGGG')])
+
+    def test_split_offsets_leading_comment(self):
+        x = SeqReader('bad_comment.fasta')
+        for n_chunks in range(1, 12):
+            offsets = x.split_offsets(n_chunks)
+            self.assertEqual(offsets[0][0], len('#This is a comment\n'))
+            records = []
+            for start, end in offsets:
+                records.extend(x.parse_fasta(start, end))
+                list(x.scan_lengths(start, end))
+            self.assertEqual(records, list(x.parse_fasta()))
+        self.assertEqual(SeqReader('bad_no_header.fasta').split_offsets(3)[0][0], 0)
+
+    def test_get_seq_missing_header(self):
+        x = SeqReader('good_alt_line.fasta')
+        self.assertIsNone(x.get_seq('test3'))
+
+    def test_build_index(self):
+        x = SeqReader('good_non_alt_line.fasta')
+        index = x.build_index()
+        self.assertEqual(index.keys(), ['test1', 'test2'])
+        self.assertEqual(tuple(index['test1']), (10, 7, 5, 6))
+        self.assertEqual(tuple(index['test2']), (10, 26, 5, 6))
+
+    def test_index_written_and_reused(self):
+        x = SeqReader('good_non_alt_line.fasta')
+        x.get_seq('test1')
+        self.assertTrue(os.path.exists('good_non_alt_line.fasta.dsa.fai'))
+        y = SeqReader('good_non_alt_line.fasta')
+        self.assertEqual(y.read_index(), x.get_index())
+        header, seq = y.get_seq('test2')
+        self.assertEqual(seq, 'GGGGGGGGGG')
+
+    def test_get_subseq_across_lines(self):
+        x = SeqReader('good_non_alt_line.fasta')
+        header, seq = x.get_subseq('test2', 3, 8)
+        self.assertEqual(header, '>test2')
+        self.assertEqual(seq, 'GGGGG')
+
+    def test_get_subseq_slicing_conventions(self):
+        with open('mixed.fasta', 'w') as f:
+            f.write('>mixed\n')
+            f.write('ACGTA\n')
+            f.write('CGTAC\n')
+            f.write('GT\n')
+        try:
+            x = SeqReader('mixed.fasta')
+            self.assertEqual(x.get_subseq('mixed', 4, 11)[1], 'ACGTACG')
+            self.assertEqual(x.get_subseq('mixed', 10, 100)[1], 'GT')
+            self.assertEqual(x.get_subseq('mixed', -3)[1], 'CGT')
+            self.assertEqual(x.get_subseq('mixed', 8, 2)[1], '')
+            self.assertEqual(x.get_seq_length('mixed'), 12)
+        finally:
+            os.remove('mixed.fasta')
+
+    def test_irregular_lines_fall_back_to_parsing(self):
+        with open('irregular.fasta', 'w') as f:
+            f.write('>irregular\n')
+            f.write('AAA\n')
+            f.write('CCCCC\n')
+            f.write('>next\n')
+            f.write('GG\n')
+        try:
+            x = SeqReader('irregular.fasta')
+            with self.assertRaises(RuntimeError):
+                x.build_index()
+            self.assertIsNone(x.get_index())
+            self.assertEqual(x.get_seq('irregular'), ('>irregular', 'AAACCCCC'))
+            self.assertEqual(x.get_subseq('irregular', 2, 5), ('>irregular', 'ACC'))
+        finally:
+            os.remove('irregular.fasta')
+
+    def test_iter_reverse_complement(self):
+        with open('mixed.fasta', 'w') as f:
+            f.write('>mixed\n')
+            f.write('ACGTA\n')
+            f.write('CGTac\n')
+            f.write('GT\n')
+        try:
+            x = SeqReader('mixed.fasta')
+            self.assertEqual(list(x.iter_reverse_complement('mixed', 5)), ['ACgtA', 'CGTAC', 'GT'])
+            self.assertEqual(''.join(x.iter_reverse_complement('>mixed')), 'ACgtACGTACGT')
+            with self.assertRaises(ValueError):
+                list(x.iter_reverse_complement('missing'))
+        finally:
+            os.remove('mixed.fasta')
+
+    def test_samtools_index_is_not_overwritten(self):
+        with open('described.fasta', 'w') as f:
+            f.write('>seq1 first sequence\n')
+            f.write('ACGT\n')
+        # samtools only keeps the first word of each header.
+        with open('described.fasta.fai', 'w') as f:
+            f.write('seq1\t4\t21\t4\t5\n')
+        try:
+            x = SeqReader('described.fasta')
+            self.assertEqual(x.get_seq('seq1 first sequence'), ('>seq1 first sequence', 'ACGT'))
+            self.assertTrue(os.path.exists('described.fasta.dsa.fai'))
+            with open('described.fasta.fai') as f:
+                self.assertEqual(f.read(), 'seq1\t4\t21\t4\t5\n')
+        finally:
+            os.remove('described.fasta')
+            os.remove('described.fasta.fai')
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,72 @@
+__author__ = 'malonge'
+import os
+import gzip
+import struct
+import unittest
+from StringIO import StringIO
+
+from dsa_seq_utils.SeqReader import SeqReader
+from dsa_seq_utils.SeqWriter import SeqWriter
+
+
+class SeqWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fasta_records = [('>seq%d' % i, 'ACGTN' * i) for i in range(50)]
+        self.fastq_records = [['@read%d' % i, 'ACGT' * i, '+', 'I' * 4 * i] for i in range(50)]
+
+    def tearDown(self):
+        for f in ('writer_test.fasta', 'writer_test.fasta.gz', 'writer_test.fasta.bgz'):
+            if os.path.exists(f):
+                os.remove(f)
+
+    def test_write_to_file_object(self):
+        out_file = StringIO()
+        with SeqWriter(out_file, buffer_size=100) as writer:
+            writer.write_fasta('>a', 'ACGT')
+            writer.write_fastq(['@b', 'AC', '+', 'II'])
+            writer.write_record(('>c', ''))
+        self.assertEqual(out_file.getvalue(), '>a\nACGT\n@b\nAC\n+\nII\n>c\n\n')
+
+    def test_line_width(self):
+        out_file = StringIO()
+        with SeqWriter(out_file, line_width=4) as writer:
+            self.assertEqual(writer.write_records([('>a', 'ACGTACGTAC'), ('>b', 'ACGT')]), 2)
+        self.assertEqual(out_file.getvalue(), '>a\nACGT\nACGT\nAC\n>b\nACGT\n')
+        with self.assertRaises(ValueError):
+            SeqWriter(StringIO(), line_width=0)
+
+    def test_round_trip(self):
+        with SeqWriter('writer_test.fasta', line_width=7, buffer_size=64) as writer:
+            writer.write_records(self.fasta_records)
+        self.assertEqual(list(SeqReader('writer_test.fasta').parse_fasta()), self.fasta_records)
+
+    def test_gzip(self):
+        with SeqWriter('writer_test.fasta.gz', buffer_size=64) as writer:
+            writer.write_records(self.fastq_records)
+        with gzip.open('writer_test.fasta.gz') as f:
+            self.assertEqual(f.read(), ''.join('\n'.join(read) + '\n' for read in self.fastq_records))
+
+    def test_bgzip(self):
+        records = [('>seq%d' % i, 'ACGT' * 5000) for i in range(10)]
+        with SeqWriter('writer_test.fasta.bgz', buffer_size=30000) as writer:
+            writer.write_records(records)
+        self.assertEqual(list(SeqReader('writer_test.fasta.bgz').parse_fasta()), records)
+
+        # Every block is a gzip member whose size is stored in its header, ending with the empty EOF block.
+        with open('writer_test.fasta.bgz', 'rb') as f:
+            data = f.read()
+        offset = 0
+        block_sizes = []
+        while offset < len(data):
+            self.assertEqual(data[offset + 12:offset + 16], 'BC\x02\x00')
+            block_size = struct.unpack('<H', data[offset + 16:offset + 18])[0] + 1
+            block_sizes.append(block_size)
+            offset += block_size
+        self.assertEqual(offset, len(data))
+        self.assertEqual(block_sizes[-1], 28)
+        self.assertGreater(len(block_sizes), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1 +1,95 @@
 __author__ = 'malonge'
+
+import os
+import gzip
+import shutil
+import unittest
+
+from design_kaspar import read_snps
+from design_kaspar import read_masks
+from design_kaspar import design_batch
+from design_kaspar import make_kaspar_sequences
+
+
+class DesignKasparTest(unittest.TestCase):
+
+    def setUp(self):
+        with open('test_kaspar.fasta', 'w') as f:
+            f.write('>chr1\nACGTACGTAC\nGTACGTACGT\n>chr2\nTTTTTGTTTTT\n')
+        with open('test_kaspar.vcf', 'w') as f:
+            f.write('##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\n')
+            f.write('chr1\t6\tsnp1\tC\tT\n')
+            f.write('chr1\t8\t.\tTA\tT\n')
+            f.write('chr2\t6\t.\tg\ta\n')
+            f.write('chr1\t9\t.\tA\tC,G\n')
+        with open('test_kaspar.tsv', 'w') as f:
+            f.write('scaffold\tcoordinate\tref\talt\tname\n')
+            f.write('chr1\t6\tC\tT\tsnp1\n')
+            f.write('chr2\t6\tA\tC\n')
+            f.write('chr1\t2\tC\tG\n')
+            f.write('chr3\t5\tA\tG\n')
+
+    def tearDown(self):
+        for f in ('test_kaspar.fasta', 'test_kaspar.fasta.dsa.fai', 'test_kaspar.fasta.gz', 'test_kaspar.vcf',
+                  'test_kaspar.tsv', 'test_kaspar.bed', 'test_kaspar.REF.fasta', 'test_kaspar.ALT.fasta',
+                  'test_kaspar.SNP.fasta'):
+            if os.path.exists(f):
+                os.remove(f)
+
+    def test_read_snps(self):
+        self.assertEqual(read_snps('test_kaspar.vcf'), [
+            ('snp1', 'chr1', 6, 'C', 'T'),
+            ('chr2_6', 'chr2', 6, 'G', 'A')
+        ])
+        self.assertEqual(read_snps('test_kaspar.tsv')[:2], [
+            ('snp1', 'chr1', 6, 'C', 'T'),
+            ('chr2_6', 'chr2', 6, 'A', 'C')
+        ])
+
+    def test_bad_coordinate(self):
+        with open('test_kaspar.tsv', 'a') as f:
+            f.write('chr1\tsix\tC\tT\n')
+        with self.assertRaises(ValueError) as context:
+            read_snps('test_kaspar.tsv')
+        self.assertIn('Line 6', str(context.exception))
+
+    def test_make_kaspar_sequences(self):
+        ref, alt, snp = make_kaspar_sequences('ACGTA', 10, 2, 'G', 'C', [(8, 12), (14, 20)])
+        self.assertEqual(ref.sequence, 'nnGTn')
+        self.assertEqual(alt.sequence, 'nnCTn')
+        self.assertEqual(snp.sequence, 'nn[G/C]Tn')
+
+    def test_design_batch(self):
+        with open('test_kaspar.bed', 'w') as f:
+            f.write('chr1\t6\t7\n')
+        skipped = design_batch('test_kaspar.fasta', read_snps('test_kaspar.tsv'), 3, 'test_kaspar', read_masks('test_kaspar.bed'))
+        self.assertEqual(skipped, {
+            'reference base does not match the assembly': 1,
+            'flanking region runs past the end of the scaffold': 1,
+            'scaffold not found': 1
+        })
+        with open('test_kaspar.SNP.fasta') as f:
+            self.assertEqual(f.read(), '>snp1 chr1 2:9 SNP at 4\nGTA[C/T]nTA\n')
+        with open('test_kaspar.ALT.fasta') as f:
+            self.assertEqual(f.read(), '>snp1 chr1 2:9 alternate SNP at 4\nGTATnTA\n')
+
+    def test_design_batch_compressed(self):
+        # A compressed genome can not be indexed, so it is parsed once for the whole batch.
+        with open('test_kaspar.fasta', 'rb') as in_file, gzip.open('test_kaspar.fasta.gz', 'wb') as out_file:
+            shutil.copyfileobj(in_file, out_file)
+        snps = read_snps('test_kaspar.tsv') + read_snps('test_kaspar.vcf')
+        indexed_skipped = design_batch('test_kaspar.fasta', snps, 3, 'test_kaspar')
+        indexed_output = []
+        for extension in ('.REF.fasta', '.ALT.fasta', '.SNP.fasta'):
+            with open('test_kaspar' + extension) as f:
+                indexed_output.append(f.read())
+
+        self.assertEqual(design_batch('test_kaspar.fasta.gz', snps, 3, 'test_kaspar'), indexed_skipped)
+        for extension, expected in zip(('.REF.fasta', '.ALT.fasta', '.SNP.fasta'), indexed_output):
+            with open('test_kaspar' + extension) as f:
+                self.assertEqual(f.read(), expected)
+        self.assertEqual(indexed_output[2].count('>'), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
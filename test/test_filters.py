@@ -0,0 +1,108 @@
+__author__ = 'malonge'
+import os
+import gzip
+import unittest
+from StringIO import StringIO
+
+from dsa_seq_utils.filters import LengthFilter
+from dsa_seq_utils.filters import GCFilter
+from dsa_seq_utils.filters import NFilter
+from dsa_seq_utils.filters import SubseqFilter
+from dsa_seq_utils.filters import ExactSubseqFilter
+from dsa_seq_utils.filters import HitFormatter
+from dsa_seq_utils.filters import RecordFilter
+from dsa_seq_utils.filters import filter_file
+from dsa_seq_utils.search import MismatchSearcher
+from dsa_seq_utils.SeqReader import SeqReader
+
+
+class PredicateTest(unittest.TestCase):
+
+    def test_length_filter(self):
+        x = LengthFilter(2, 5)
+        self.assertEqual([x(('>s', 'A' * i)) for i in range(7)], [False, False, False, True, True, False, False])
+        self.assertTrue(LengthFilter()(('>s', '')))
+
+    def test_gc_filter(self):
+        self.assertTrue(GCFilter(0.5, 0.5)(('>s', 'ACgtNN')))
+        self.assertFalse(GCFilter(0.6)(('>s', 'ACGT')))
+        self.assertFalse(GCFilter(upper=0.4)(('>s', 'ACGT')))
+        self.assertFalse(GCFilter()(('>s', 'NNNN')))
+
+    def test_n_filter(self):
+        self.assertTrue(NFilter(0.5)(('>s', 'ACnN')))
+        self.assertFalse(NFilter(0.25)(('>s', 'ACnN')))
+
+    def test_subseq_filter_and_hits(self):
+        searcher = MismatchSearcher([('p', 'GATTACA')], max_mismatches=1)
+        self.assertTrue(SubseqFilter(searcher)(['@r1', 'ccgattaga', '+', 'IIIIIIIII']))
+        self.assertFalse(SubseqFilter(searcher)(['@r1', 'ccgatcaga', '+', 'IIIIIIIII']))
+        self.assertEqual(HitFormatter(searcher)(('>r1', 'GATTACAGATTACA')), 'r1\t0\t7\tp\t+\t0\nr1\t7\t14\tp\t+\t0\n')
+
+    def test_subseq_filter_case(self):
+        # Exact subsequences keep their case, like 'in'. Searcher hits ignore it.
+        self.assertTrue(ExactSubseqFilter('ACG')(('>s', 'TACGT')))
+        self.assertFalse(ExactSubseqFilter('ACG')(('>s', 'TacgT')))
+        self.assertTrue(ExactSubseqFilter('acg')(('>s', 'TacgT')))
+        self.assertTrue(SubseqFilter(MismatchSearcher([('p', 'ACG')]))(('>s', 'TacgT')))
+
+    def test_record_filter(self):
+        x = RecordFilter([LengthFilter(3), NFilter(0)])
+        text, lengths = x.filter_records([('>a', 'ACGT'), ('>b', 'AC'), ('>c', 'ACGN'), ('>d', 'ACGTA')])
+        self.assertEqual(text, '>a\nACGT\n>d\nACGTA\n')
+        self.assertEqual(lengths, [4, 5])
+
+
+class FilterFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [('>seq%d' % i, 'ACGT' * (i % 7) + 'N' * (i % 3)) for i in range(500)]
+        with open('filter_test.fasta', 'w') as f:
+            for header, sequence in self.records:
+                f.write('%s\n%s\n' % (header, sequence))
+        self.record_filter = RecordFilter([LengthFilter(5, 25), NFilter(0.1)])
+        self.expected = ''.join(
+            '%s\n%s\n' % r for r in self.records if 5 < len(r[1]) < 25 and r[1].count('N') <= 0.1 * len(r[1])
+        )
+
+    def tearDown(self):
+        os.remove('filter_test.fasta')
+
+    def test_serial(self):
+        out_file = StringIO()
+        length_stats = filter_file('filter_test.fasta', out_file, self.record_filter, batch_size=7)
+        self.assertEqual(out_file.getvalue(), self.expected)
+        self.assertEqual(length_stats.total_count(), self.expected.count('>'))
+
+    def test_processes_keep_order(self):
+        out_file = StringIO()
+        length_stats = filter_file('filter_test.fasta', out_file, self.record_filter, processes=2)
+        self.assertEqual(out_file.getvalue(), self.expected)
+        self.assertEqual(length_stats.total_count(), self.expected.count('>'))
+
+    def test_compressed_processes_keep_order(self):
+        with open('filter_test.fasta') as f:
+            with gzip.open('filter_test.fasta.gz', 'wb') as gz:
+                gz.write(f.read())
+        try:
+            out_file = StringIO()
+            filter_file('filter_test.fasta.gz', out_file, self.record_filter, processes=2, batch_size=11)
+            self.assertEqual(out_file.getvalue(), self.expected)
+        finally:
+            os.remove('filter_test.fasta.gz')
+
+    def test_indexed_length_filter(self):
+        x = SeqReader('filter_test.fasta')
+        x.write_index(x.build_index())
+        try:
+            out_file = StringIO()
+            length_stats = filter_file('filter_test.fasta', out_file, RecordFilter([LengthFilter(5, 25)]), batch_size=7)
+            expected = ''.join('%s\n%s\n' % r for r in self.records if 5 < len(r[1]) < 25)
+            self.assertEqual(out_file.getvalue(), expected)
+            self.assertEqual(length_stats.total_count(), expected.count('>'))
+        finally:
+            os.remove('filter_test.fasta.dsa.fai')
+
+
+if __name__ == '__main__':
+    unittest.main()
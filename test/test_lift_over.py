@@ -2,13 +2,25 @@ __author__ = 'malonge'
 
 import os
 import unittest
+from collections import OrderedDict
 
-#from dsa_seq_utils.utilities import reverse_complement
+from dsa_seq_utils.utilities import reverse_complement
 from lift_over import switch_SW
 from lift_over import get_reverse_coords
 from lift_over import place_pre_seqs
 from lift_over import get_post_seqs
 from lift_over import convert_coordinates
+from lift_over import PostAssembly
+from lift_over import lift_interval
+from lift_over import lift_lines
+from lift_over import get_placements
+from lift_over import get_placement_cache_key
+from lift_over import read_placement_cache
+from lift_over import write_placement_cache
+from lift_over import read_chain_file
+from lift_over import write_chain_file
+from dsa_seq_utils.search import np
+from dsa_seq_utils.search import KmerIndex
 
 
 class LiftOverTest(unittest.TestCase):
@@ -27,6 +39,10 @@ class LiftOverTest(unittest.TestCase):
     def tearDown(self):
         os.remove('test_post_file.fasta')
         os.remove('test_pre_file.fasta')
+        for f in ('test_pre_file.fasta.dsa.fai', 'test_post_file.fasta.sa.npy', 'test_multi_post_file.fasta',
+                  'test_multi_post_file.fasta.sa.npy', 'test_placements', 'test.chain'):
+            if os.path.exists(f):
+                os.remove(f)
 
     def test_get_post_seqs(self):
         d1 = get_post_seqs('test_post_file.fasta')
@@ -45,6 +61,186 @@ class LiftOverTest(unittest.TestCase):
             '>pre_header_2': ('>post_header', 3, True, 4)
         })
 
+    def test_place_pre_seqs_processes(self):
+        x = PostAssembly(get_post_seqs('test_post_file.fasta'))
+        placements = place_pre_seqs(['pre_header_1', 'pre_header_2'], 'test_pre_file.fasta', x, True, processes=2)
+        self.assertEqual(placements, {
+            'pre_header_1': ('>post_header', 1, False, 4),
+            'pre_header_2': ('>post_header', 3, True, 4)
+        })
+        with self.assertRaises(ValueError):
+            place_pre_seqs(['missing_header'], 'test_pre_file.fasta', x, processes=2)
+
+    def test_place_pre_seqs_empty_header(self):
+        # get_multiple_seqs skips empty headers, which must not shift the placements of later headers.
+        x = PostAssembly(get_post_seqs('test_post_file.fasta'))
+        for processes in (1, 2):
+            placements = place_pre_seqs(['', 'pre_header_1', '', '>pre_header_2'], 'test_pre_file.fasta', x, True,
+                                        processes=processes)
+            self.assertEqual(placements, {
+                'pre_header_1': ('>post_header', 1, False, 4),
+                '>pre_header_2': ('>post_header', 3, True, 4)
+            })
+
+    def test_post_assembly_find(self):
+        with open('test_multi_post_file.fasta', 'w') as f:
+            f.write('>post_1\nACGTTT\n>post_2\nGGACGT\n>post_3\nTTTGGA\n')
+        x = PostAssembly(get_post_seqs('test_multi_post_file.fasta'))
+        self.assertEqual(x.find('ACGT'), ('>post_1', 0))
+        self.assertEqual(x.find('GAC'), ('>post_2', 1))
+        self.assertEqual(x.find('TTTGG'), ('>post_3', 0))
+        # Matches do not span two post assembly sequences.
+        self.assertIsNone(x.find('TTTGGACGT'))
+
+    def test_post_assembly_suffix_array_reused(self):
+        x = PostAssembly.from_fasta('test_post_file.fasta')
+        y = PostAssembly.from_fasta('test_post_file.fasta')
+        self.assertEqual(y.find('CCSGG'), ('>post_header', 5))
+        if x.suffix_array is not None:
+            self.assertTrue(os.path.exists('test_post_file.fasta.sa.npy'))
+            self.assertEqual(list(y.suffix_array.suffix_array), list(x.suffix_array.suffix_array))
+
+    @unittest.skipIf(np is None, 'NumPy is not installed.')
+    def test_post_assembly_find_similar(self):
+        post_1 = 'ACGTTGCAAGCTTAGCCATGGATCCTAGGCATCGATCGGAATTCC'
+        post_2 = 'TTGACCGGTACGATCGTAGCTAGCTTACGGATCGATGCATGCAAGT'
+        x = PostAssembly(OrderedDict([('>post_1', post_1), ('>post_2', post_2)]))
+        # The default k-mers are too long for these short sequences.
+        x.kmer_index = KmerIndex(x.text, k=8, step=2)
+        query = post_2[5:40]
+        self.assertEqual(x.find_similar(query, 0), ('>post_2', 5, 0))
+        query = query[:10] + 'A' + query[11:30] + 'C' + query[31:]
+        self.assertEqual(x.find_similar(query, 2), ('>post_2', 5, 2))
+        self.assertIsNone(x.find_similar(query, 1))
+
+    @unittest.skipIf(np is None, 'NumPy is not installed.')
+    def test_place_pre_seqs_with_mismatches(self):
+        post = 'ACGTTGCAAGCTTAGCCATGGATCCTAGGCATCGATCGGAATTCCTTGACCGGTACGATCGTAGC'
+        with open('test_multi_post_file.fasta', 'w') as f:
+            f.write('>post\n%s\n' % post)
+        with open('test_pre_file.fasta', 'w') as f:
+            f.write('>forward\n%sT%s\n' % (post[3:20], post[21:40]))
+            f.write('>reverse\n%s\n' % reverse_complement(post[30:60].replace('GGTA', 'GCTA')))
+        x = PostAssembly.from_fasta('test_multi_post_file.fasta')
+        x.kmer_index = KmerIndex(x.text, k=8, step=2)
+        with self.assertRaises(ValueError):
+            place_pre_seqs(['>forward'], 'test_pre_file.fasta', x)
+        placements = place_pre_seqs(['>forward', '>reverse'], 'test_pre_file.fasta', x, max_mismatches=1)
+        self.assertEqual(placements, {
+            '>forward': ('>post', 3, False, 37),
+            '>reverse': ('>post', 30, True, 30)
+        })
+
+    def test_lift_interval(self):
+        pre = 'CAGGTAC'
+        post = 'AAA' + reverse_complement(pre) + 'GG'
+        placement = ('>post', 3, True, len(pre))
+        for start, end in [(1, 1), (2, 4), (1, 7), (6, 7)]:
+            header, post_start, post_end, reverse = lift_interval(placement, start, end)
+            self.assertEqual(post[post_start - 1:post_end], reverse_complement(pre[start - 1:end]))
+        self.assertEqual(lift_interval(('>post', 3, False, 7), 2, 4), ('post', 5, 7, False))
+        self.assertIsNone(lift_interval(placement, 5, 8))
+
+    def test_convert_gff3(self):
+        placements = {'ctg1': ('>chr1', 100, False, 50), 'ctg2': ('>chr2', 10, True, 50)}
+        with open('test_coords.gff3', 'w') as f:
+            f.write('##gff-version 3\n')
+            f.write('ctg1\tsrc\tgene\t1\t10\t.\t+\t.\tID=g1\n')
+            f.write('ctg2\tsrc\tgene\t1\t10\t.\t+\t.\tID=g2\n')
+            f.write('ctg1\tsrc\tgene\t45\t55\t.\t-\t.\tID=g3\n')
+            f.write('ctg3\tsrc\tgene\t1\t10\t.\t-\t.\tID=g4')
+        try:
+            reasons = convert_coordinates('test_coords.gff3', placements)
+            with open('test_coords.transfered.genes.gff3') as f:
+                self.assertEqual(f.read(), (
+                    '##gff-version 3\n'
+                    'chr1\tsrc\tgene\t101\t110\t.\t+\t.\tID=g1\n'
+                    'chr2\tsrc\tgene\t51\t60\t.\t-\t.\tID=g2\n'
+                ))
+            with open('test_coords.unliftable.genes.gff3') as f:
+                self.assertEqual(f.read(), (
+                    'ctg1\tsrc\tgene\t45\t55\t.\t-\t.\tID=g3\n'
+                    'ctg3\tsrc\tgene\t1\t10\t.\t-\t.\tID=g4\n'
+                ))
+            self.assertEqual(reasons, {'outside the placed sequence': 1, 'sequence not placed': 1})
+        finally:
+            for f in ('test_coords.gff3', 'test_coords.transfered.genes.gff3', 'test_coords.unliftable.genes.gff3'):
+                os.remove(f)
+
+    def test_lift_bed_and_vcf(self):
+        placements = {'ctg': ('>chr', 0, True, 100)}
+        bed = 'ctg\t10\t30\tname\t0\t+\t12\t28\t0\t2\t4,6,\t0,14,\n'
+        self.assertEqual(
+            lift_lines([bed], placements, 'bed')[0],
+            'chr\t70\t90\tname\t0\t-\t72\t88\t0\t2\t6,4,\t0,16,\n'
+        )
+        vcf = ['#CHROM\tPOS\tID\tREF\tALT\n', 'ctg\t11\t.\tA\tG,T\n', 'ctg\t20\t.\tAC\tA\n']
+        lifted, unliftable, reasons = lift_lines(vcf, placements, 'vcf')
+        self.assertEqual(lifted, '#CHROM\tPOS\tID\tREF\tALT\nchr\t90\t.\tT\tC,A\n')
+        self.assertEqual(unliftable, 'ctg\t20\t.\tAC\tA\n')
+        self.assertEqual(reasons, {'indel on a reverse complemented sequence': 1})
+
+    def test_placement_cache(self):
+        key = get_placement_cache_key('test_pre_file.fasta', 'test_post_file.fasta', True)
+        placements = {'>pre_header_1': ('>post header', 1, False, 4), '>pre_header_2': ('>post_header', 3, True, 4)}
+        write_placement_cache('test_placements', key, placements)
+        self.assertEqual(read_placement_cache('test_placements', key), placements)
+
+        # The cache is not used for other options or changed assemblies.
+        self.assertEqual(read_placement_cache('test_placements', key[:2] + ('switch_sw=False', key[3])), {})
+        with open('test_post_file.fasta', 'a') as f:
+            f.write('A')
+        new_key = get_placement_cache_key('test_pre_file.fasta', 'test_post_file.fasta', True)
+        self.assertEqual(read_placement_cache('test_placements', new_key), {})
+
+    def test_get_placements_reuses_cache(self):
+        expected = {'>pre_header_1': ('>post_header', 1, False, 4), '>pre_header_2': ('>post_header', 3, True, 4)}
+        placements = get_placements(
+            {'>pre_header_1', '>pre_header_2'}, 'test_pre_file.fasta', 'test_post_file.fasta', 'test_placements', True
+        )
+        self.assertEqual(placements, expected)
+
+        # Cached placements are returned as saved, without placing the sequences again.
+        key = get_placement_cache_key('test_pre_file.fasta', 'test_post_file.fasta', True)
+        write_placement_cache('test_placements', key, {'>pre_header_1': ('>cached', 5, False, 4)})
+        placements = get_placements(
+            {'>pre_header_1', '>pre_header_2'}, 'test_pre_file.fasta', 'test_post_file.fasta', 'test_placements', True
+        )
+        self.assertEqual(placements, {'>pre_header_1': ('>cached', 5, False, 4), '>pre_header_2': expected['>pre_header_2']})
+        self.assertEqual(len(read_placement_cache('test_placements', key)), 2)
+
+    def test_chain_file(self):
+        placements = {'ctg1': ('>chr', 10, False, 20), 'ctg2': ('>chr', 50, True, 20)}
+        write_chain_file('test.chain', placements, {'>chr': 100})
+        with open('test.chain') as f:
+            self.assertEqual(f.readline(), 'chain 20 ctg1 20 + 0 20 chr 100 + 10 30 1\n')
+        chains = read_chain_file('test.chain')
+        for header, placement in placements.iteritems():
+            for start, end in ((1, 20), (5, 5), (3, 12), (0, 4), (15, 21)):
+                self.assertEqual(lift_interval(chains[header], start, end), lift_interval(placement, start, end))
+
+        gff = ['ctg1\t.\tgene\t2\t5\t.\t+\t.\tID=1\n', 'ctg2\t.\tgene\t2\t5\t.\t+\t.\tID=2\n']
+        self.assertEqual(lift_lines(gff, chains), lift_lines(gff, placements))
+
+    def test_chain_file_header_description(self):
+        placements = {'ctg1': ('>chr1 length=100 version 2', 10, True, 20)}
+        write_chain_file('test.chain', placements, {'>chr1 length=100 version 2': 100})
+        with open('test.chain') as f:
+            self.assertEqual(f.readline(), 'chain 20 ctg1 20 + 0 20 chr1 100 - 70 90 1\n')
+        chains = read_chain_file('test.chain')
+        self.assertEqual(lift_interval(chains['ctg1'], 1, 5), ('chr1', 26, 30, True))
+
+    def test_gapped_chain(self):
+        # Blocks of 10 and 5 bases, with 3 bases only in the pre assembly and 2 only in the post assembly.
+        with open('test.chain', 'w') as f:
+            f.write('chain 15 ctg 30 + 2 20 chr 40 - 5 22 7\n10 3 2\n5\n\n')
+        chains = read_chain_file('test.chain')
+        self.assertEqual(lift_interval(chains['ctg'], 3, 12), ('chr', 26, 35, True))
+        self.assertEqual(lift_interval(chains['ctg'], 16, 20), ('chr', 19, 23, True))
+        self.assertIsNone(lift_interval(chains['ctg'], 12, 16))
+        self.assertIsNone(lift_interval(chains['ctg'], 1, 3))
+        self.assertIsNone(lift_interval(chains['ctg'], 20, 21))
+
     def test_get_reverse_coords(self):
         # This assumes 1-indexed
         start, end = get_reverse_coords(1, 3, 4)
@@ -0,0 +1,175 @@
+__author__ = 'malonge'
+import os
+import unittest
+
+from dsa_seq_utils.search import AhoCorasick
+from dsa_seq_utils.search import expand_iupac
+from dsa_seq_utils.search import build_probe_searcher
+from dsa_seq_utils.search import MismatchSearcher
+from dsa_seq_utils.search import SuffixArray
+from dsa_seq_utils.search import KmerIndex
+from dsa_seq_utils.search import np
+
+
+class AhoCorasickTest(unittest.TestCase):
+
+    def test_overlapping_patterns(self):
+        x = AhoCorasick()
+        for pattern in ['ACGT', 'CGTA', 'GT', 'TTT']:
+            x.add(pattern)
+        x.build()
+        self.assertEqual(len(x), 4)
+        self.assertEqual(
+            list(x.search('AACGTAATTTT')),
+            [(1, 5, 'ACGT'), (3, 5, 'GT'), (2, 6, 'CGTA'), (7, 10, 'TTT'), (8, 11, 'TTT')]
+        )
+
+    def test_matches_naive_search(self):
+        patterns = ['A', 'AA', 'AAC', 'ACA', 'CAAC', 'NAC']
+        text = 'AACAACANACAAAC'
+        x = AhoCorasick()
+        for pattern in patterns:
+            x.add(pattern)
+        x.build()
+        expected = sorted(
+            (i, i + len(p), p) for p in patterns for i in range(len(text)) if text[i:i + len(p)] == p
+        )
+        self.assertEqual(sorted(x.search(text)), expected)
+
+    def test_build_required(self):
+        x = AhoCorasick()
+        x.add('ACGT')
+        with self.assertRaises(RuntimeError):
+            list(x.search('ACGT'))
+        x.build()
+        with self.assertRaises(RuntimeError):
+            x.add('GG')
+        with self.assertRaises(ValueError):
+            AhoCorasick().add('')
+
+
+class ProbeSearchTest(unittest.TestCase):
+
+    def test_expand_iupac(self):
+        self.assertEqual(expand_iupac('ACR'), ['ACA', 'ACG'])
+        self.assertEqual(len(expand_iupac('NN')), 16)
+        with self.assertRaises(ValueError):
+            expand_iupac('AC-T')
+        with self.assertRaises(ValueError):
+            expand_iupac('N' * 10, max_expansions=1000)
+
+    def test_both_strands(self):
+        x = build_probe_searcher([('p1', 'aacg')], both_strands=True)
+        self.assertEqual(list(x.search('TTAACGATCGTTAA')), [(2, 6, ('p1', '+')), (8, 12, ('p1', '-'))])
+        x = build_probe_searcher([('p1', 'AACG')])
+        self.assertEqual(list(x.search('TTAACGATCGTTAA')), [(2, 6, ('p1', '+'))])
+
+    def test_iupac_probes(self):
+        x = build_probe_searcher([('p1', 'GAY'), ('p2', 'TTN')], iupac=True)
+        self.assertEqual(list(x.search('GATTGACGAG')), [(0, 3, ('p1', '+')), (2, 5, ('p2', '+')), (4, 7, ('p1', '+'))])
+
+
+class MismatchSearcherTest(unittest.TestCase):
+
+    def test_mismatches(self):
+        x = MismatchSearcher([('bc', 'ACGTACGT')], max_mismatches=1)
+        self.assertEqual(list(x.search('TTACGTACGTTT')), [(2, 10, ('bc', '+'), 0)])
+        self.assertEqual(list(x.search('TTACGAACGTTT')), [(2, 10, ('bc', '+'), 1)])
+        self.assertEqual(list(x.search('TTACGAACCTTT')), [])
+        self.assertEqual(list(x.search('ACGTAC')), [])
+
+    def test_matches_naive_search(self):
+        probe = 'GATTACAG'
+        text = 'GATTACAGTTGATAACAGGNTTACAGCTTTACTGAGATTAGAG'
+        for max_mismatches in range(4):
+            expected = []
+            for i in range(len(text) - len(probe) + 1):
+                mismatches = sum(1 for a, b in zip(text[i:i + len(probe)], probe) if a != b)
+                if mismatches <= max_mismatches:
+                    expected.append((i, i + len(probe), ('p', '+'), mismatches))
+            x = MismatchSearcher([('p', probe)], max_mismatches=max_mismatches)
+            self.assertEqual(sorted(x.search(text)), expected)
+
+    def test_iupac_and_strands(self):
+        x = MismatchSearcher([('p', 'AAYGG')], max_mismatches=1, both_strands=True, iupac=True)
+        self.assertEqual(sorted(x.search('AATGGTTCCGTT')), [(0, 5, ('p', '+'), 0), (7, 12, ('p', '-'), 0)])
+        self.assertEqual(sorted(x.search('AAAGGTTCCGTA')), [(0, 5, ('p', '+'), 1), (7, 12, ('p', '-'), 1)])
+
+    def test_short_probe(self):
+        with self.assertRaises(ValueError):
+            MismatchSearcher([('p', 'AC')], max_mismatches=2)
+
+    def test_probes_of_different_lengths_match_naive_search(self):
+        probes = [('short', 'ACGTA'), ('long', 'ACGTACGTTACG'), ('mid', 'TTACGAC')]
+        text = 'ACGTACGTTACGACGTACGTTACGTTACGACGTAAACGTTCGTTACGA' * 20
+        for max_mismatches in range(3):
+            expected = []
+            for name, probe in probes:
+                for i in range(len(text) - len(probe) + 1):
+                    mismatches = sum(1 for a, b in zip(text[i:i + len(probe)], probe) if a != b)
+                    if mismatches <= max_mismatches:
+                        expected.append((i, i + len(probe), (name, '+'), mismatches))
+            x = MismatchSearcher(probes, max_mismatches=max_mismatches)
+            self.assertEqual(sorted(x.search(text)), sorted(expected))
+
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed.')
+class SuffixArrayTest(unittest.TestCase):
+
+    def test_suffixes_sorted(self):
+        for text in ['', 'A', 'banana', 'ACGTACGTTACG\nACGT', 'AAAAAAAAAAAAAAAAAAAAA', 'ACACACACACACACACACAG' * 3]:
+            x = SuffixArray(text)
+            self.assertEqual(list(x.suffix_array), sorted(range(len(text)), key=lambda i: text[i:]))
+
+    def test_long_text_sort(self):
+        # Texts too long to pack both ranks into one key are sorted with lexsort, with the same result.
+        saved = SuffixArray.max_packed_length
+        SuffixArray.max_packed_length = 0
+        try:
+            for text in ['banana', 'AAAAAAAAAAAAAAAAAAAAA', 'ACACACACACACACACACAG' * 3, 'NNNNACGTNNNNACGTTNNNN' * 5]:
+                x = SuffixArray(text)
+                self.assertEqual(list(x.suffix_array), sorted(range(len(text)), key=lambda i: text[i:]))
+        finally:
+            SuffixArray.max_packed_length = saved
+
+    def test_find(self):
+        text = 'ACGTACGTTACG\nACGTA'
+        x = SuffixArray(text)
+        self.assertEqual(x.find_all('ACG'), [0, 4, 9, 13])
+        self.assertEqual(x.count('ACGTA'), 2)
+        self.assertEqual(x.find('TTA'), 7)
+        self.assertEqual(x.find('GGG'), -1)
+        self.assertEqual(x.find_all('GTA\nA'), [])
+
+    def test_save_and_load(self):
+        text = 'ACGTACGTTACG'
+        SuffixArray(text).save('test.sa.npy')
+        try:
+            self.assertEqual(SuffixArray.load('test.sa.npy', text).find_all('CG'), [1, 5, 10])
+            with self.assertRaises(ValueError):
+                SuffixArray.load('test.sa.npy', 'ACG')
+            with self.assertRaises(ValueError):
+                SuffixArray.load('test.sa.npy', 'TTTTTTAAAAAA')
+        finally:
+            os.remove('test.sa.npy')
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed.')
+class KmerIndexTest(unittest.TestCase):
+
+    def test_seed_hits(self):
+        text = 'ACGTACGTTTACGTNACGT'
+        x = KmerIndex(text, k=4, step=2, chunk_size=5)
+        # Sampled k-mers start at even positions and have no ambiguous bases.
+        self.assertEqual(sorted(x.positions), [0, 2, 4, 6, 8, 10])
+        query_offsets, positions = x.seed_hits('TTACGTA')
+        self.assertEqual(sorted(zip(query_offsets, positions)), [(0, 8), (2, 0), (2, 4), (2, 10)])
+
+    def test_max_hits(self):
+        x = KmerIndex('A' * 50, k=5, step=1)
+        self.assertEqual(len(x.seed_hits('AAAAA', max_hits=10)[0]), 0)
+        self.assertEqual(len(x.seed_hits('AAAAA', max_hits=46)[0]), 46)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+__author__ = 'malonge'
+import unittest
+
+from dsa_seq_utils.stats import calculate_mean
+from dsa_seq_utils.stats import calculate_pop_sd
+from dsa_seq_utils.stats import calculate_median
+from dsa_seq_utils.stats import LengthHistogram
+from dsa_seq_utils.stats import RunningStats
+
+
+class LengthHistogramTest(unittest.TestCase):
+
+    def setUp(self):
+        self.lengths = [5, 1, 10, 5, 3, 8, 5, 2]
+        self.histogram = LengthHistogram(self.lengths)
+
+    def test_counts(self):
+        self.assertEqual(self.histogram.items(), [(1, 1), (2, 1), (3, 1), (5, 3), (8, 1), (10, 1)])
+        self.assertEqual(self.histogram.total_count(), 8)
+        self.assertEqual(self.histogram.total_length(), 39)
+        self.assertEqual(list(self.histogram.iter_lengths()), sorted(self.lengths))
+
+    def test_matches_list_stats(self):
+        self.assertAlmostEqual(self.histogram.mean(), calculate_mean(self.lengths))
+        self.assertAlmostEqual(self.histogram.pop_sd(), calculate_pop_sd(self.lengths))
+        self.assertEqual(self.histogram.median(), calculate_median(self.lengths))
+        self.assertEqual(LengthHistogram([4, 1, 7]).median(), calculate_median([4, 1, 7]))
+
+    def test_min_max_percentile(self):
+        self.assertEqual(self.histogram.min(), 1)
+        self.assertEqual(self.histogram.max(), 10)
+        self.assertEqual(self.histogram.percentile(0), 1)
+        self.assertEqual(self.histogram.percentile(100), 10)
+        self.assertAlmostEqual(self.histogram.percentile(90), 8.6)
+
+    def test_n50(self):
+        # 10 + 8 + 5 = 23 >= 39 / 2
+        self.assertEqual(self.histogram.n50(), 5)
+        self.assertEqual(self.histogram.ng50(30), 8)
+        self.assertIsNone(self.histogram.ng50(100))
+
+    def test_merge(self):
+        x = LengthHistogram(self.lengths[:3])
+        x.merge(LengthHistogram(self.lengths[3:]))
+        self.assertEqual(x.items(), self.histogram.items())
+
+    def test_empty(self):
+        with self.assertRaises(ValueError):
+            LengthHistogram().mean()
+        with self.assertRaises(ValueError):
+            LengthHistogram([1]).pop_sd()
+        with self.assertRaises(ValueError):
+            LengthHistogram([1]).median()
+
+
+class RunningStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.values = [5, 1, 10, 5, 3, 8, 5, 2]
+
+    def test_generator_input(self):
+        x = RunningStats(i for i in self.values)
+        self.assertEqual(x.total_count(), 8)
+        self.assertAlmostEqual(x.total(), 39)
+        self.assertEqual(x.min(), 1)
+        self.assertEqual(x.max(), 10)
+        self.assertAlmostEqual(x.mean(), calculate_mean(self.values))
+        self.assertAlmostEqual(x.pop_sd(), 2.8034576865007255)
+        self.assertEqual(x.median(), calculate_median(self.values))
+        self.assertTrue(x.exact)
+
+    def test_calculate_pop_sd_generator(self):
+        self.assertAlmostEqual(calculate_pop_sd(i for i in self.values), 2.8034576865007255)
+        with self.assertRaises(ValueError):
+            calculate_pop_sd([1])
+
+    def test_merge(self):
+        x = RunningStats(self.values[:5])
+        x.merge(RunningStats(self.values[5:]))
+        self.assertAlmostEqual(x.mean(), calculate_mean(self.values))
+        self.assertAlmostEqual(x.pop_sd(), calculate_pop_sd(self.values))
+        self.assertEqual(x.median(), calculate_median(self.values))
+        self.assertEqual(x.min(), 1)
+        self.assertEqual(x.max(), 10)
+
+    def test_exact_total(self):
+        values = [(i * 7919) % 100003 + 1 for i in xrange(200000)]
+        x = RunningStats(values[:1000])
+        x.update(i for i in values[1000:150000])
+        x.merge(RunningStats(values[150000:], max_bins=0))
+        self.assertEqual(x.total(), sum(values))
+        self.assertIsInstance(x.total(), (int, long))
+
+    def test_bounded_quantiles(self):
+        values = range(10000)
+        x = RunningStats(values, max_bins=50)
+        self.assertFalse(x.exact)
+        self.assertTrue(len(x._bins) <= 100)
+        self.assertAlmostEqual(x.median(), calculate_median(values), delta=100)
+        self.assertAlmostEqual(x.percentile(90), 8999.1, delta=100)
+        self.assertEqual(x.percentile(100), 9999)
+        self.assertEqual(x.max(), 9999)
+
+    def test_empty(self):
+        with self.assertRaises(ValueError):
+            RunningStats().mean()
+        with self.assertRaises(ValueError):
+            RunningStats([1]).median()
+
+
+if __name__ == '__main__':
+    unittest.main()
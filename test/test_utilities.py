@@ -0,0 +1,90 @@
+__author__ = 'malonge'
+import os
+import unittest
+
+from dsa_seq_utils import utilities
+from dsa_seq_utils.utilities import complements
+from dsa_seq_utils.utilities import file_md5
+from dsa_seq_utils.utilities import kmerize
+from dsa_seq_utils.utilities import kmer_codes
+from dsa_seq_utils.utilities import kmer_code_array
+from dsa_seq_utils.utilities import decode_kmer
+from dsa_seq_utils.utilities import reverse_complement
+from dsa_seq_utils.utilities import reverse_complement_array
+
+
+class ReverseComplementTest(unittest.TestCase):
+
+    def test_reverse_complement(self):
+        self.assertEqual(reverse_complement('AACGTN'), 'NACGTT')
+        self.assertEqual(reverse_complement(''), '')
+        self.assertEqual(reverse_complement('RYSWKMBVDHU'), 'ADHBVKMWSRY')
+
+    def test_matches_complements(self):
+        for nuc, complement in complements.items():
+            self.assertEqual(reverse_complement(nuc), complement)
+
+    def test_soft_masked(self):
+        self.assertEqual(reverse_complement('ACgtnA'), 'TnacGT')
+
+    def test_invalid_nucleotide(self):
+        with self.assertRaises(KeyError):
+            reverse_complement('ACGT-ACGT')
+
+    @unittest.skipIf(utilities.np is None, 'NumPy is not installed.')
+    def test_reverse_complement_array(self):
+        np = utilities.np
+        seq = 'ACGTRYSWKMBVDHNUacgtn'
+        rc = reverse_complement_array(np.frombuffer(seq, dtype=np.uint8))
+        self.assertEqual(rc.tostring(), reverse_complement(seq))
+        with self.assertRaises(KeyError):
+            reverse_complement_array(np.frombuffer('ACXT', dtype=np.uint8))
+
+
+class KmerCodesTest(unittest.TestCase):
+
+    def test_kmer_codes(self):
+        # A=0, C=1, G=2, T=3
+        self.assertEqual(list(kmer_codes('ACGT', 2)), [(0, 1), (1, 6), (2, 11)])
+        self.assertEqual(list(kmer_codes('acgt', 4)), [(0, 27)])
+        self.assertEqual(list(kmer_codes('AC', 3)), [])
+
+    def test_decode(self):
+        seq = 'GATTACAGATTACA'
+        for start, code in kmer_codes(seq, 5):
+            self.assertEqual(decode_kmer(code, 5), seq[start:start+5])
+        self.assertEqual([seq[i:i+5] for i, code in kmer_codes(seq, 5)], list(kmerize(seq, 5)))
+
+    def test_ambiguous_bases(self):
+        self.assertEqual([start for start, code in kmer_codes('ACGNACGTRAC', 3)], [0, 4, 5])
+
+    def test_canonical(self):
+        for start, code in kmer_codes('GGTCAATTNGAC', 4, canonical=True):
+            kmer = 'GGTCAATTNGAC'[start:start+4]
+            self.assertEqual(decode_kmer(code, 4), min(kmer, reverse_complement(kmer)))
+
+    @unittest.skipIf(utilities.np is None, 'NumPy is not installed.')
+    def test_kmer_code_array(self):
+        seq = 'ACGTTGCANNACGTAGGCTAGCTTAGGAYTCGATCGATTTAGCACACGTAGTC' * 3
+        for k in (1, 5, 12, 31, 32):
+            for canonical in (False, True):
+                starts, codes = kmer_code_array(seq, k, canonical)
+                self.assertEqual(zip(starts.tolist(), codes.tolist()), list(kmer_codes(seq, k, canonical)))
+        with self.assertRaises(ValueError):
+            kmer_code_array(seq, 33)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class FileMD5Test(unittest.TestCase):
+
+    def tearDown(self):
+        os.remove('test_md5.txt')
+
+    def test_file_md5(self):
+        with open('test_md5.txt', 'w') as f:
+            f.write('ACGT' * 10)
+        self.assertEqual(file_md5('test_md5.txt'), '9889878875bfc855a532253c415dceb6')
+        self.assertEqual(file_md5('test_md5.txt', block_size=7), '9889878875bfc855a532253c415dceb6')